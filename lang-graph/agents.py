@@ -1,31 +1,117 @@
-import json
+import os
 import re
-from langchain_openai import ChatOpenAI
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_core.prompts import ChatPromptTemplate
 from colorama import Fore,Back,Style
-from dotenv import load_dotenv
-import os
+from llm_client import invoke_llm, stream_llm
+from resilience import LLMUnavailableError
+from keyword_matcher import get_matcher, literal_verdict, format_evidence
+from keyword_index import get_index
+
+from chunker import chunk_document
+from decision_engine import decide, needs_llm, render_report, render_weights
+from json_stream import IncrementalJSONParser, JSONExtractError, agent_parser, parse_decision, decision_from_fields, verdict_from_fields
+import policy
+import telemetry
 
-load_dotenv()
+# 提示词版本：修改任一智能体提示词或判定逻辑后递增，使判定缓存失效
+PROMPT_VERSION = '6'
+
+# 长文档分块并行分析的线程池；某块以不低于该置信度判定为涉密时提前结束其余分块
+CHUNK_EARLY_STOP_CONFIDENCE = int(os.getenv('CHUNK_EARLY_STOP_CONFIDENCE', '90'))
+chunk_executor = ThreadPoolExecutor(max_workers=int(os.getenv('CHUNK_WORKERS', '8')))
+
+def analyze_chunks(agent_name, prompt, state, secret_value):
+  """
+  长文档 map-reduce：按 token 预算分块后并行调用大模型，再归并为一个 {result, confidence, evidence}
+  secret_value: 该智能体 result 取何值表示涉密（语义分析为 True，非涉密证明为 False）
+  """
+  chunks = chunk_document(state['doc_content'])
+  if len(chunks) == 1:
+    return invoke_llm(agent_name, prompt, state, parse=agent_parser('result'))
+  print(f'{Fore.BLUE}长文档分为 {len(chunks)} 块并行分析{Style.RESET_ALL}')
+  futures = {}
+  for index, chunk in enumerate(chunks):
+    variables = dict(state)
+    variables['doc_content'] = f'【长文档第 {index + 1}/{len(chunks)} 部分】\n{chunk}'
+    futures[telemetry.submit(chunk_executor, 'chunk', invoke_llm, agent_name, prompt, variables, agent_parser('result'))] = index
+  results = {}
+  failures = {}
+  try:
+    for future in as_completed(futures):
+      index = futures[future]
+      try:
+        response_json = future.result()
+      except Exception as e:
+        # 单个分块失败（大模型不可用或响应无法解析）不影响其余分块
+        print(f'{Fore.RED}{agent_name} 第 {index + 1}/{len(chunks)} 部分分析失败: {e}{Style.RESET_ALL}')
+        failures[index] = e
+        continue
+      results[index] = response_json
+      if response_json['result'] == secret_value and response_json['confidence'] >= CHUNK_EARLY_STOP_CONFIDENCE:
+        break
+  finally:
+    for future in futures:
+      future.cancel()
+  if not results:
+    error = failures[min(failures)]
+    if isinstance(error, (LLMUnavailableError, JSONExtractError)):
+      raise error
+    raise LLMUnavailableError(agent_name, 'error', f': {type(error).__name__}: {error}') from error
+  response_json = reduce_chunks(results, len(chunks), secret_value, failed=len(failures))
+  # 部分分块失败时结论只依据成功的分块，智能体记为降级（结果不写入判定缓存）
+  response_json['degraded'] = bool(failures)
+  return response_json
+
+def chunk_output(agent_name, response_json):
+  """把分块归并结果写回状态；部分分块失败时记录降级"""
+  output = {
+    f'{agent_name}_detail': response_json['evidence'],
+    f'{agent_name}_result': response_json['result'],
+    f'{agent_name}_confidence': response_json['confidence'],
+    'current_node': agent_name,
+  }
+  if response_json.get('degraded'):
+    telemetry.DEGRADED.inc(agent=agent_name)
+    output['degraded_agents'] = [agent_name]
+  return output
+
+def reduce_chunks(results, total, secret_value, failed=0):
+  """任一分块涉密即整体涉密（取最高置信度），否则整体非涉密（取最低置信度）；failed 为分析失败的分块数"""
+  secret = [response_json for response_json in results.values() if response_json['result'] == secret_value]
+  if secret:
+    result = secret_value
+    confidence = max(response_json['confidence'] for response_json in secret)
+  else:
+    result = not secret_value
+    confidence = min(response_json['confidence'] for response_json in results.values())
+  evidence = []
+  for index in sorted(results):
+    items = results[index]['evidence']
+    if isinstance(items, str):
+      items = [items]
+    evidence.extend(f'[第 {index + 1}/{total} 部分] {item}' for item in items)
+  if failed:
+    evidence.append(f'{failed}/{total} 部分分析失败，结论只依据其余部分')
+  if len(results) + failed < total:
+    evidence.append(f'已分析 {len(results)}/{total} 部分并确认存在涉密风险，其余部分未继续分析')
+  return {'result': result, 'confidence': confidence, 'evidence': evidence}
 
 # 正向过滤涉密文件：关联涉密关键词检测智能体
 def agent_keyword(state):
   print(f'{Fore.MAGENTA}{Style.BRIGHT}开始执行: Agent关键词检测智能体{Style.RESET_ALL}')
-  # 加载关键词库
-  keywords_list = []
-  with open('lang-graph/lib/keywords.json', 'r', encoding='utf-8') as f:
-    keywords = json.load(f)
-    for category in keywords:
-        for keyword in keywords[category]:
-          keywords_list.append(keyword)
-  state.update({'keywords_list': keywords_list})
-  # 大模型判断内容与关键词库是否有关联
-  llm = ChatOpenAI(
-    model=os.getenv("MODEL"),
-    base_url="https://api.siliconflow.cn/v1",
-    api_key=os.getenv("SILICONFLOW_API_KEY"),
-    temperature=0
-  )
+  # 加载关键词库（进程内只编译一次）
+  matcher = get_matcher()
+  # 本地字面匹配：证据充分时直接给出结果，不再调用大模型
+  hits = matcher.find(state['doc_content'])
+  # 提示词只携带字面命中与 BM25 排名靠前的候选关键词，而不是整个关键词库
+  state.update({'keywords_list': get_index().top_k(state['doc_content'], required=[hit['keyword'] for hit in hits])})
+  literal = literal_verdict(hits)
+  if literal is not None:
+    print(f'{Fore.BLUE}本地字面匹配命中 {len(hits)} 处，跳过大模型{Style.RESET_ALL}')
+    return keyword_result(state, literal)
+  state.update({'literal_hits': format_evidence(hits) or '无'})
+  # 大模型只判断语义关联
   prompt = ChatPromptTemplate.from_messages([
     ('system','''
     *角色设定*:
@@ -33,7 +119,9 @@ def agent_keyword(state):
 
     *任务设定*:
     你的任务是根据关键词的字面匹配或语义关联，给出明确的判断结果和支撑该结果的证据链。
-    【敏感关键词库】 (JSON 数组):{keywords_list}
+    字面匹配已由本地程序完成，你需要重点判断文本与关键词库的同义词或上下文语义关联，并结合字面匹配结果给出结论。
+    【敏感关键词库（与文本最相关的候选关键词）】 (JSON 数组):{keywords_list}
+    【本地字面匹配结果】:{literal_hits}
 
     *格式设定*:
     请严格按照以下 JSON 格式输出结果：
@@ -61,30 +149,48 @@ def agent_keyword(state):
     {doc_content}
     ''')
   ])
-  chain = prompt | llm
-  response = chain.invoke(state)
-  response_json = json.loads(response.content)
-  if(response_json['associated'] == True and response_json['confidence'] > 90):
-    state.update({'current_node': 'agent_decision'})
-  else:
-    state.update({'current_node': 'agent_semantics'})
+  try:
+    response_json = invoke_llm('agent_keyword', prompt, state, parse=agent_parser('associated'))
+  except (LLMUnavailableError, JSONExtractError) as e:
+    if not hits:
+      return degraded('agent_keyword', e)
+    # 大模型不可用但存在字面命中：以较低置信度采用字面匹配结论
+    output = keyword_result(state, {
+      'associated': True,
+      'confidence': 80,
+      'evidence': format_evidence(hits) + ['关键词大模型不可用或响应无法解析，仅依据字面命中判断'],
+    })
+    output['degraded_agents'] = ['agent_keyword']
+    telemetry.DEGRADED.inc(agent='agent_keyword')
+    return output
+  return keyword_result(state, response_json)
+
+def degraded(agent_name, error):
+  """大模型不可用或响应无法解析时的降级结果：详情为空，决策时视为未执行、不参与加权"""
+  print(f'{Fore.RED}{agent_name} 降级: {error}{Style.RESET_ALL}')
+  telemetry.DEGRADED.inc(agent=agent_name)
+  return {
+    f'{agent_name}_detail': '',
+    f'{agent_name}_result': False,
+    f'{agent_name}_confidence': 0,
+    'current_node': agent_name,
+    'degraded_agents': [agent_name],
+  }
+
+def keyword_result(state, response_json):
+  """把关键词检测结论（本地或大模型）写回状态，下一步路由由 policy 中的策略决定"""
   return {
     'agent_keyword_result': response_json['associated'],
     'agent_keyword_detail': response_json['evidence'],
     'agent_keyword_confidence': response_json['confidence'],
-    'current_node': state['current_node'],
+    'keywords_list': state['keywords_list'],
+    'current_node': 'agent_keyword',
   }
 
 # 正向过滤涉密文件：语义分析智能体
 def agent_semantics(state):
   print(f'{Fore.MAGENTA}{Style.BRIGHT}开始执行: Agent语义分析智能体{Style.RESET_ALL}')
   # 大模型
-  llm = ChatOpenAI(
-    model=os.getenv("MODEL"),
-    base_url="https://api.siliconflow.cn/v1",
-    api_key=os.getenv("SILICONFLOW_API_KEY"),
-    temperature=0
-  )
   # 提示词
   prompt = ChatPromptTemplate.from_messages([
     ('system','''
@@ -132,27 +238,25 @@ def agent_semantics(state):
     ''')
   ])
 
-  chain = prompt | llm 
-  response = chain.invoke(state)
-  # print(f'{Fore.GREEN}{Style.BRIGHT}语义分析结果:{Style.RESET_ALL}{Fore.YELLOW}{response.content}{Style.RESET_ALL}')
-  response_json = json.loads(response.content)
-
-  return {
-    'agent_semantics_detail': response_json['evidence'],
-    'agent_semantics_result': response_json['result'],
-    'agent_semantics_confidence': response_json['confidence'],
-    'current_node': 'agent_semantics',
-  }
+  # 近似文档的上一版本已判定为非涉密时，只分析新增 / 修改的段落（见 near_dup.py）
+  focus = state.get('semantics_focus')
+  if focus:
+    print(f'{Fore.BLUE}近似文档：只分析新增段落（{len(focus)} 字）{Style.RESET_ALL}')
+    state = {**state, 'doc_content': focus}
+  try:
+    response_json = analyze_chunks('agent_semantics', prompt, state, secret_value=True)
+  except (LLMUnavailableError, JSONExtractError) as e:
+    return degraded('agent_semantics', e)
+  # print(f'{Fore.GREEN}{Style.BRIGHT}语义分析结果:{Style.RESET_ALL}{Fore.YELLOW}{response_json}{Style.RESET_ALL}')
+  if focus:
+    evidence = response_json['evidence'] if isinstance(response_json['evidence'], list) else [response_json['evidence']]
+    response_json['evidence'] = ['[近似文档] 上一版本语义分析为非涉密，本次只分析新增/修改的段落', *evidence]
+
+  return chunk_output('agent_semantics', response_json)
 
 # 反向非涉密证明：非涉密验证专家
 def agent_non_secret_proof(state):
   print(f'{Fore.MAGENTA}{Style.BRIGHT}开始执行: Agent非涉密证明专家智能体{Style.RESET_ALL}')
-  llm = ChatOpenAI(
-    model=os.getenv("MODEL"),
-    base_url="https://api.siliconflow.cn/v1",
-    api_key=os.getenv("SILICONFLOW_API_KEY"),
-    temperature=0
-  )
   prompt = ChatPromptTemplate.from_messages([
     ('system','''
     *角色设定*:
@@ -200,33 +304,30 @@ def agent_non_secret_proof(state):
     ''')
   ])
 
-  chain = prompt | llm 
-  response = chain.invoke(state)
-  response_json = json.loads(response.content)
-  # print(f'{Fore.GREEN}{Style.BRIGHT}文件排除结果:{Style.RESET_ALL}{Fore.YELLOW}{response.content}{Style.RESET_ALL}')
+  try:
+    response_json = analyze_chunks('agent_non_secret_proof', prompt, state, secret_value=False)
+  except (LLMUnavailableError, JSONExtractError) as e:
+    return degraded('agent_non_secret_proof', e)
+  # print(f'{Fore.GREEN}{Style.BRIGHT}文件排除结果:{Style.RESET_ALL}{Fore.YELLOW}{response_json}{Style.RESET_ALL}')
 
-  return {
-    "agent_non_secret_proof_detail": response_json['evidence'],
-    "agent_non_secret_proof_result": response_json['result'],
-    "agent_non_secret_proof_confidence": response_json['confidence'],
-    'current_node': 'agent_non_secret_proof',
-  }
+  return chunk_output('agent_non_secret_proof', response_json)
 
 # 决策审核智能体
 def agent_decision(state):
   print(f'{Fore.MAGENTA}{Style.BRIGHT}开始执行: Agent决策评审智能体{Style.RESET_ALL}')
-  # 关键词关联判断为true并且置信度大于90直接判定为涉密文件
-  if(state['agent_keyword_result'] == True and state['agent_keyword_confidence'] > 90):
-    state.update({'result': True})
-    state.update({'result_detail': '关键词检测结果为涉密，置信度为' + str(state['agent_keyword_confidence']) + '，最终判定为涉密'})
-    state.update({'result_confidence': state['agent_keyword_confidence']})
+  # 本地加权聚合，只有结论模糊时才调用大模型
+  decision = decide(state)
+  fired, actions = decision_policies(state)
+  degraded_agents = []
+  if actions['verdict_from']:
+    # 策略指定直接采用某个智能体的结论（例如关键词快速通道）
+    state.update(policy.policy_verdict(actions['verdict_from'], state))
+  elif 'decision_llm' in actions['skip'] or not needs_llm(decision):
+    print(f'{Fore.BLUE}本地决策: 加权涉密得分 {decision["score"]:.1f}{Style.RESET_ALL}')
+    state.update({'result': decision['result']})
+    state.update({'result_detail': render_report(decision)})
+    state.update({'result_confidence': decision['result_confidence']})
   else:
-    llm = ChatOpenAI(
-      model=os.getenv("MODEL"),
-      base_url="https://api.siliconflow.cn/v1",
-      api_key=os.getenv("SILICONFLOW_API_KEY"),
-      temperature=0
-    )
     prompt = ChatPromptTemplate.from_messages([
       ('system','''
       *角色设定*:
@@ -247,9 +348,7 @@ def agent_decision(state):
       你的任务是接收来自三个独立分析系统（系统一：关键词匹配；系统二：深层语义推断；系统三：非涉密证明）的详细报告。
       你必须根据报告中提供的结果、置信度、证据链，结合预设的权重，执行加权平均计算和逻辑校验，最终给出关于文本是否涉密的聚合判断。
       【聚合判断权重】:
-      关键词匹配分析 (M1) 权重： 40%
-      深层语义分析 (M2) 权重： 30%
-      非涉密证明 (M3) 权重： 30%
+      {decision_weights}
 
       *输出格式*:
       严格以纯json格式输出，确保可解析。不要包含任何注释或额外字符。
@@ -266,211 +365,191 @@ def agent_decision(state):
       4. 不要在 JSON 中使用注释（//）
       ''')
     ])
-    chain = prompt | llm 
-    response = chain.invoke(state)
-    
-    # 打印原始响应用于调试
-    print(f'{Fore.YELLOW}原始响应: {response.content}{Style.RESET_ALL}')
-    
-    # 尝试解析 JSON
     try:
-      # 清理响应内容，移除可能的 markdown 代码块标记
-      content = response.content.strip()
-      if content.startswith('```json'):
-        content = content[7:]
-      if content.startswith('```'):
-        content = content[3:]
-      if content.endswith('```'):
-        content = content[:-3]
-      content = content.strip()
-      
-      # 尝试移除注释（虽然提示词要求不使用注释，但以防万一）
-      lines = content.split('\n')
-      cleaned_lines = []
-      for line in lines:
-        # 移除行内注释
-        if '//' in line:
-          # 找到注释位置，但要确保不是在字符串内
-          comment_pos = line.find('//')
-          # 简单处理：如果 // 不在引号内，则移除
-          cleaned_lines.append(line[:comment_pos].rstrip())
-        else:
-          cleaned_lines.append(line)
-      content = '\n'.join(cleaned_lines)
-      
-      response_json = json.loads(content)
-      
-      # 确保 result 是布尔值
-      if isinstance(response_json.get('result'), str):
-        response_json['result'] = response_json['result'].lower() in ['true', 'yes', '1']
-      
-      state.update({'result': response_json['result']})
-      state.update({'result_detail': str(response_json.get('result_detail', ''))})
-      state.update({'result_confidence': int(response_json.get('result_confidence', 0))})
-      
-    except json.JSONDecodeError as e:
+      decision = invoke_llm('agent_decision', prompt, {**state, 'decision_weights': render_weights()}, parse=parse_decision)
+      print(f'{Fore.YELLOW}决策结果: {decision}{Style.RESET_ALL}')
+      state.update(decision)
+    except JSONExtractError as e:
       print(f'{Fore.RED}JSON 解析失败: {str(e)}{Style.RESET_ALL}')
-      print(f'{Fore.RED}清理后的内容: {content}{Style.RESET_ALL}')
       # 使用默认值
       state.update({'result': False})
-      state.update({'result_detail': f'解析失败: {str(e)}\n原始响应: {response.content}'})
-      state.update({'result_confidence': 0})
-    except Exception as e:
-      print(f'{Fore.RED}处理响应时出错: {str(e)}{Style.RESET_ALL}')
-      state.update({'result': False})
-      state.update({'result_detail': f'处理错误: {str(e)}'})
+      state.update({'result_detail': f'解析失败: {str(e)}\n原始响应: {e.raw}'})
       state.update({'result_confidence': 0})
+    except LLMUnavailableError as e:
+      fallback = local_fallback(decision, e)
+      degraded_agents.extend(fallback.pop('degraded_agents'))
+      state.update(fallback)
 
   return {
     'result': state['result'],
     'result_detail': state['result_detail'],
     'result_confidence': state['result_confidence'],
     'current_node': 'END',
+    'fired_policies': fired,
+    'degraded_agents': degraded_agents,
   }
 
+def local_fallback(decision, error):
+  """决策大模型不可用时退回本地加权结果"""
+  print(f'{Fore.RED}agent_decision 降级: {error}{Style.RESET_ALL}')
+  telemetry.DEGRADED.inc(agent='agent_decision')
+  return {
+    'result': decision['result'],
+    'result_detail': render_report(decision) + '\n（决策大模型暂不可用，以上为本地加权结果）',
+    'result_confidence': decision['result_confidence'],
+    'current_node': 'END',
+    'degraded_agents': ['agent_decision'],
+  }
+
+def decision_policies(state):
+  """评估 before_decision 阶段的策略，返回 (新触发的策略名, 合并全部已触发策略后的动作)"""
+  fired = policy.evaluate('before_decision', state)
+  return fired, policy.actions(list(state.get('fired_policies') or []) + fired)
+
 
 # 决策评审智能体（流式版本，用于 API）
-def agent_decision_stream(state, stream_callback=None):
+def agent_decision_events(state, force_llm=False):
   """
-  流式版本的决策评审智能体，支持回调函数实时输出 token
-  stream_callback: 可选的回调函数，每次收到 token 时调用
+  流式决策评审，依次产出事件：
+  ('token', 文本片段)：大模型输出的 token
+  ('verdict', {result, result_confidence})：结论字段一解析完成就产出，无需等待完整的 result_detail
+  ('result', 决策结果)：最终结果，与 agent_decision 的返回值一致
+  force_llm: 跳过本地决策，始终由大模型生成详细报告（用于按需生成报告）
   """
-  print(f'{Fore.MAGENTA}{Style.BRIGHT}开始执行: Agent决策评审智能体（流式）{Style.RESET_ALL}')
-  
-  # 关键词关联判断为true并且置信度大于90直接判定为涉密文件
-  if(state.get('agent_keyword_result') == True and state.get('agent_keyword_confidence', 0) > 90):
-    result_detail = '关键词检测结果为涉密，置信度为' + str(state['agent_keyword_confidence']) + '，最终判定为涉密'
-    result_confidence = state['agent_keyword_confidence']
-    
-    # 如果提供了流式回调，分段发送结果
-    if stream_callback:
-      for char in result_detail:
-        stream_callback(char)
-    
-    print(result_detail)
-    
-    return {
-      'result': True,
+  fired, actions = ([], policy.actions([])) if force_llm else decision_policies(state)
+  # 策略指定直接采用某个智能体的结论（例如关键词快速通道）
+  if actions['verdict_from']:
+    decision = policy.policy_verdict(actions['verdict_from'], state)
+    decision['fired_policies'] = fired
+    yield 'verdict', {'result': decision['result'], 'result_confidence': decision['result_confidence']}
+    yield 'token', decision['result_detail']
+    yield 'result', decision
+    return
+
+  # 本地加权聚合，只有结论模糊时才调用大模型
+  decision = decide(state)
+  if not force_llm and ('decision_llm' in actions['skip'] or not needs_llm(decision)):
+    result_detail = render_report(decision)
+    yield 'verdict', {'result': decision['result'], 'result_confidence': decision['result_confidence']}
+    yield 'token', result_detail
+    yield 'result', {
+      'result': decision['result'],
       'result_detail': result_detail,
-      'result_confidence': result_confidence,
+      'result_confidence': decision['result_confidence'],
       'current_node': 'END',
+      'fired_policies': fired,
     }
-  else:
-    llm = ChatOpenAI(
-      model=os.getenv("MODEL"),
-      base_url="https://api.siliconflow.cn/v1",
-      api_key=os.getenv("SILICONFLOW_API_KEY"),
-      temperature=0
-    )
-    
-    prompt = ChatPromptTemplate.from_messages([
-      ('system','''
-      *角色设定*:
-      你是一名高权限的信息安全决策模块。
+    return
 
-      *任务设定*:
-      你的任务是接收来自三个独立分析系统（系统一：关键词匹配；系统二：深层语义推断；系统三：非涉密证明）的详细报告。
-      你必须根据报告中提供的结果、置信度、证据链，结合预设的权重，执行加权平均计算和逻辑校验，最终给出关于文本是否涉密的聚合判断。
-      【聚合判断权重】:
-      关键词匹配分析 (M1) 权重： 40%
-      深层语义分析 (M2) 权重： 30%
-      非涉密证明 (M3) 权重： 30%
+  prompt = ChatPromptTemplate.from_messages([
+    ('system','''
+    *角色设定*:
+    你是一名高权限的信息安全决策模块。
 
-      *输出格式*:
-      严格以纯json格式输出,确保可解析
-      {{
-        "result": True | False, // 最终裁决结果 True为涉密，False为非涉密
-        "result_confidence": [判断最终结果置信度]
-        "result_detail": [评审结果分析报告]
-      1. 关键词匹配分析：[分析报告]
-      2. 语义推断分析：[分析报告]
-      3. 非涉密证明分析：[分析报告]
-      4. 最终裁决：
-      [判断结果：涉密/非涉密]
-      决策路径与依据：
-      判定依据： [说明最终判定是满足了哪一条或哪几条规则（规则 1 / 规则 2 / 规则 3），或者三条规则均未满足。]
-      规则 1 (关键词匹配) 检查结果： [满足/不满足]
-      规则 2 (语义推断) 检查结果： [满足/不满足]
-      规则 3 (非涉密证明) 检查结果： [满足/不满足]
-      }}
+    *任务设定*:
+    你的任务是接收来自三个独立分析系统（系统一：关键词匹配；系统二：深层语义推断；系统三：非涉密证明）的详细报告。
+    你必须根据报告中提供的结果、置信度、证据链，结合预设的权重，执行加权平均计算和逻辑校验，最终给出关于文本是否涉密的聚合判断。
+    【聚合判断权重】:
+    {decision_weights}
 
-      *输入数据*
-      关键字匹配结果：{agent_keyword_result}
-      关键字匹配置信度：{agent_keyword_confidence}
-      关键字匹配证据：{agent_keyword_detail}
-      语义推断结果：{agent_semantics_result}
-      语义推断置信度：{agent_semantics_confidence}
-      语义推断证据：{agent_semantics_detail}
-      非涉密证明结果：{agent_non_secret_proof_result}
-      非涉密证明置信度：{agent_non_secret_proof_confidence}
-      非涉密证明证据：{agent_non_secret_proof_detail}
-      ''')
-    ])
-    
-    chain = prompt | llm 
-    response = chain.stream(state)
-    full_response = ""
-    
-    for event in response:
-      token = event.content
+    *输出格式*:
+    严格以纯json格式输出,确保可解析
+    {{
+      "result": True | False, // 最终裁决结果 True为涉密，False为非涉密
+      "result_confidence": [判断最终结果置信度]
+      "result_detail": [评审结果分析报告]
+    1. 关键词匹配分析：[分析报告]
+    2. 语义推断分析：[分析报告]
+    3. 非涉密证明分析：[分析报告]
+    4. 最终裁决：
+    [判断结果：涉密/非涉密]
+    决策路径与依据：
+    判定依据： [说明最终判定是满足了哪一条或哪几条规则（规则 1 / 规则 2 / 规则 3），或者三条规则均未满足。]
+    规则 1 (关键词匹配) 检查结果： [满足/不满足]
+    规则 2 (语义推断) 检查结果： [满足/不满足]
+    规则 3 (非涉密证明) 检查结果： [满足/不满足]
+    }}
+
+    *输入数据*
+    关键字匹配结果：{agent_keyword_result}
+    关键字匹配置信度：{agent_keyword_confidence}
+    关键字匹配证据：{agent_keyword_detail}
+    语义推断结果：{agent_semantics_result}
+    语义推断置信度：{agent_semantics_confidence}
+    语义推断证据：{agent_semantics_detail}
+    非涉密证明结果：{agent_non_secret_proof_result}
+    非涉密证明置信度：{agent_non_secret_proof_confidence}
+    非涉密证明证据：{agent_non_secret_proof_detail}
+    ''')
+  ])
+
+  parser = IncrementalJSONParser()
+  full_response = ""
+  verdict_sent = None
+  try:
+    # 只有能解析出结论的完整响应才写入响应缓存，截断或格式错误的输出不会在重放时重复出现
+    for token in stream_llm('agent_decision', prompt, {**state, 'decision_weights': render_weights()}, validate=parse_decision):
       full_response += token
-      print(token, end='', flush=True)
-      
+      yield 'token', token
+      parser.feed(token)
+      if verdict_sent is None and 'result' in parser.fields and 'result_confidence' in parser.fields:
+        verdict_sent = verdict_from_fields(parser.fields)
+        yield 'verdict', verdict_sent
+  except LLMUnavailableError as e:
+    # 大模型不可用：没有拿到结论时退回本地加权结果
+    if verdict_sent is None:
+      fallback = local_fallback(decision, e)
+      fallback['fired_policies'] = fired
+      yield 'verdict', {'result': fallback['result'], 'result_confidence': fallback['result_confidence']}
+      yield 'token', fallback['result_detail']
+      yield 'result', fallback
+      return
+    # 结论已经推送：保持与已推送的 verdict 一致，详情只保留已输出的部分
+    print(f'{Fore.RED}agent_decision 输出中断: {e}{Style.RESET_ALL}')
+    telemetry.DEGRADED.inc(agent='agent_decision')
+    detail = parser.fields.get('result_detail') or render_report(decision)
+    note = '\n（决策大模型输出中断，结论以已输出的部分为准）'
+    yield 'token', note
+    yield 'result', {
+      **verdict_sent,
+      'result_detail': f'{detail}{note}',
+      'current_node': 'END',
+      'degraded_agents': ['agent_decision'],
+      'fired_policies': fired,
+    }
+    return
+  parser.close()
+
+  try:
+    decision = decision_from_fields(parser.fields, full_response)
+  except JSONExtractError as e:
+    telemetry.PARSE_FAILURES.inc(agent='agent_decision')
+    print(f'{Fore.RED}JSON 解析失败: {str(e)}{Style.RESET_ALL}')
+    decision = {
+      'result': False,
+      'result_detail': f'解析失败: {str(e)}\n原始响应: {full_response}',
+      'result_confidence': 0,
+      'current_node': 'END',
+    }
+  decision['fired_policies'] = fired
+  if verdict_sent is None:
+    yield 'verdict', {'result': decision['result'], 'result_confidence': decision['result_confidence']}
+  yield 'result', decision
+
+def agent_decision_stream(state, stream_callback=None):
+  """
+  流式版本的决策评审智能体，支持回调函数实时输出 token
+  stream_callback: 可选的回调函数，每次收到 token 时调用
+  """
+  print(f'{Fore.MAGENTA}{Style.BRIGHT}开始执行: Agent决策评审智能体（流式）{Style.RESET_ALL}')
+  decision = {}
+  for kind, payload in agent_decision_events(state):
+    if kind == 'token':
+      print(payload, end='', flush=True)
       # 如果提供了回调函数，调用它
       if stream_callback:
-        stream_callback(token)
-    
-    print('\n')
-    
-    # 尝试解析 JSON
-    try:
-      # 清理响应内容
-      content = full_response.strip()
-      if content.startswith('```json'):
-        content = content[7:]
-      if content.startswith('```'):
-        content = content[3:]
-      if content.endswith('```'):
-        content = content[:-3]
-      content = content.strip()
-      
-      # 移除注释
-      lines = content.split('\n')
-      cleaned_lines = []
-      for line in lines:
-        if '//' in line:
-          comment_pos = line.find('//')
-          cleaned_lines.append(line[:comment_pos].rstrip())
-        else:
-          cleaned_lines.append(line)
-      content = '\n'.join(cleaned_lines)
-      
-      response_json = json.loads(content)
-      
-      # 确保 result 是布尔值
-      if isinstance(response_json.get('result'), str):
-        response_json['result'] = response_json['result'].lower() in ['true', 'yes', '1']
-      
-      return {
-        'result': response_json['result'],
-        'result_detail': str(response_json.get('result_detail', '')),
-        'result_confidence': int(response_json.get('result_confidence', 0)),
-        'current_node': 'END',
-      }
-    except json.JSONDecodeError as e:
-      print(f'{Fore.RED}JSON 解析失败: {str(e)}{Style.RESET_ALL}')
-      return {
-        'result': False,
-        'result_detail': f'解析失败: {str(e)}\n原始响应: {full_response}',
-        'result_confidence': 0,
-        'current_node': 'END',
-      }
-    except Exception as e:
-      print(f'{Fore.RED}处理响应时出错: {str(e)}{Style.RESET_ALL}')
-      return {
-        'result': False,
-        'result_detail': f'处理错误: {str(e)}',
-        'result_confidence': 0,
-        'current_node': 'END',
-      }
-
+        stream_callback(payload)
+    elif kind == 'result':
+      decision = payload
+  print('\n')
+  return decision
@@ -1,246 +1,355 @@
 from flask import Flask, request, jsonify, Response, stream_with_context
-from main import invoke, invoke_stream, app as workflow_app
-from agents import agent_keyword, agent_semantics, agent_non_secret_proof, agent_decision_stream
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from main import invoke, initial_state, nodes, route_after_keyword
+from agents import agent_decision_events
+from sse_writer import SSEWriter, accepts_gzip, format_event, stream
+import jobs
+import llm_cache
+import policy
+import rate_limiter
+import telemetry
+import verdict_cache
+import near_dup
+import triage
 import json
+import os
+import time
 
 app = Flask(__name__)
 
+# 并行执行语义分析与非涉密证明的共享线程池
+agent_executor = ThreadPoolExecutor(max_workers=int(os.getenv('AGENT_WORKERS', '16')))
+
+# 批量检测：默认并发数、单次请求允许的最大并发数，以及所有批量请求共享的线程池
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '32'))
+batch_executor = ThreadPoolExecutor(max_workers=int(os.getenv('BATCH_WORKERS', str(BATCH_MAX_CONCURRENCY))))
+
+def sse(payload):
+  """格式化一条 SSE 消息"""
+  return format_event(payload)
+
+def sse_writer():
+  """按客户端 Accept-Encoding 与 SSE_COMPRESSION 创建合并输出的 SSE 写出器"""
+  return SSEWriter(compress=accepts_gzip(request.headers.get('Accept-Encoding')))
+
+def run_check(writer, cache_key, doc_title, doc_content, fields=None):
+  """
+  执行检测流程并逐条产出 SSE 数据，节点包装、路由与策略与工作流图 (main.app) 一致
+  fields 为并入初始状态的字段（近似文档的 semantics_focus 等）
+  """
+  input_state = initial_state(doc_title, doc_content)
+  input_state.update(fields or {})
+  # 记录进度事件，写入缓存供重复提交时回放
+  events = []
+
+  def emit(payload):
+    events.append(payload)
+    return writer.event(payload)
+
+  def node_events(node_name, node_result):
+    """合并节点输出并生成进度事件，触发了策略时附带 policy 事件"""
+    policy.merge(input_state, node_result)
+    frames = [emit({'type': 'progress', 'node': node_name, 'data': node_result})]
+    if node_result.get('fired_policies'):
+      frames.append(emit({'type': 'policy', 'node': node_name, 'data': {'fired': node_result['fired_policies']}}))
+    return frames
+
+  # 发送开始消息
+  yield emit({'type': 'progress', 'node': 'start_node', 'data': {}})
+
+  # 执行关键词检测，随后按 lib/policies.json 中的策略决定是否跳过后续智能体
+  for frame in node_events('agent_keyword', nodes['agent_keyword'](input_state)):
+    yield frame
+
+  next_node = route_after_keyword(input_state)
+  if next_node == 'agent_decision':
+    # 直接进入决策评审
+    pass
+  elif isinstance(next_node, list):
+    # 并行执行语义检测与非涉密证明，哪个先完成先推送哪个
+    futures = {
+      telemetry.submit(agent_executor, 'agent', nodes[node_name], dict(input_state)): node_name
+      for node_name in next_node
+    }
+    for future in as_completed(futures):
+      for frame in node_events(futures[future], future.result()):
+        yield frame
+  else:
+    # 依次执行语义检测与非涉密证明，前者触发的策略可以跳过后者
+    for node_name in ('agent_semantics', 'agent_non_secret_proof'):
+      for frame in node_events(node_name, nodes[node_name](input_state)):
+        yield frame
+
+  # 发送决策评审开始消息
+  yield emit({'type': 'progress', 'node': 'agent_decision', 'data': {'status': 'started'}})
+
+  # 执行决策评审（流式输出），结论字段一解析完成就先推送 verdict 事件
+  decision_result = {}
+  full_response = ""
+  decision_span = telemetry.start_span('node.agent_decision', node='agent_decision', stream=True)
+  decision_start = time.perf_counter()
+  try:
+    for kind, payload in agent_decision_events(input_state):
+      if kind == 'token':
+        full_response += payload
+        # token 先缓冲，按时间窗口或字节数合并为一条消息
+        yield writer.token('agent_decision', payload)
+      elif kind == 'verdict':
+        decision_span.add_event('verdict', **payload)
+        yield emit({'type': 'verdict', 'node': 'agent_decision', 'data': payload})
+      else:
+        decision_result = payload
+  finally:
+    decision_span.end()
+  decision_seconds = time.perf_counter() - decision_start
+  telemetry.NODE_SECONDS.observe(decision_seconds, node='agent_decision')
+  decision_result['node_timings'] = [{'node': 'agent_decision', 'seconds': decision_seconds}]
+
+  policy.merge(input_state, decision_result)
+  events.append({'type': 'stream_token', 'node': 'agent_decision', 'token': full_response})
+
+  # 发送决策评审完成消息
+  yield emit({'type': 'progress', 'node': 'agent_decision', 'data': decision_result})
+  if decision_result.get('fired_policies'):
+    yield emit({'type': 'policy', 'node': 'agent_decision', 'data': {'fired': decision_result['fired_policies']}})
+
+  root_span = telemetry.current_span()
+  if root_span is not None:
+    root_span.set_attributes(result=input_state.get('result'), fired_policies=input_state.get('fired_policies', []))
+  # 发送最终结果
+  final_data = {
+    'type': 'final',
+    'data': input_state
+  }
+  verdict_cache.store(cache_key, input_state, events)
+  if not input_state.get('semantics_focus'):
+    near_dup.remember(doc_title, doc_content, input_state)
+  yield writer.event(final_data)
+
 @app.route('/check', methods=['POST'])
 def check():
   data = request.json
   doc_title = data.get('doc_title')
   doc_content = data.get('doc_content')
+  writer = sse_writer()
   
   def generate():
-    input_state = {
-      'doc_title': doc_title,
-      'doc_content': doc_content,
-      'keywords_list': [],
-      'current_node': 'start_node',
-      'agent_keyword_result': False,
-      'agent_keyword_detail': '',
-      'agent_keyword_confidence': 0,
-      'agent_semantics_result': False,
-      'agent_semantics_detail': '',
-      'agent_semantics_confidence': 0,
-      'agent_non_secret_proof_result': False,
-      'agent_non_secret_proof_detail': '',
-      'agent_non_secret_proof_confidence': 0,
-      'result': False,
-      'result_detail': '',
-      'result_confidence': 0,
-    }
-    
-    # 发送开始消息
-    yield f"data: {json.dumps({'type': 'progress', 'node': 'start_node', 'data': {}}, ensure_ascii=False)}\n\n"
-    
-    # 执行关键词检测
-    keyword_result = agent_keyword(input_state)
-    input_state.update(keyword_result)
-    yield f"data: {json.dumps({'type': 'progress', 'node': 'agent_keyword', 'data': keyword_result}, ensure_ascii=False)}\n\n"
-    
-    # 根据关键词检测结果决定是否继续语义检测
-    # 如果关键词检测结果为 True 且置信度大于 90，则跳过语义检测和非涉密证明，直接进入决策
-    if keyword_result.get('agent_keyword_result') == True and keyword_result.get('agent_keyword_confidence', 0) > 90:
-      # 直接进入决策评审
-      pass
-    else:
-      # 执行语义检测
-      semantics_result = agent_semantics(input_state)
-      input_state.update(semantics_result)
-      yield f"data: {json.dumps({'type': 'progress', 'node': 'agent_semantics', 'data': semantics_result}, ensure_ascii=False)}\n\n"
-      
-      # 执行非涉密证明
-      proof_result = agent_non_secret_proof(input_state)
-      input_state.update(proof_result)
-      yield f"data: {json.dumps({'type': 'progress', 'node': 'agent_non_secret_proof', 'data': proof_result}, ensure_ascii=False)}\n\n"
-    
-    # 发送决策评审开始消息
-    yield f"data: {json.dumps({'type': 'progress', 'node': 'agent_decision', 'data': {'status': 'started'}}, ensure_ascii=False)}\n\n"
-    
-    # 收集流式 token
-    collected_tokens = []
-    
-    def stream_callback(token):
-      """流式输出回调函数"""
-      collected_tokens.append(token)
-      # 发送流式 token
-      stream_data = {
-        'type': 'stream_token',
-        'node': 'agent_decision',
-        'token': token
-      }
-      # 注意：这里不能直接 yield，但我们可以在主流程中处理
-    
-    # 使用改造后的流式决策评审智能体
-    # 由于 stream_callback 无法在生成器内部 yield，我们需要直接流式处理
-    
-    # 执行决策评审（流式输出）
-    decision_result = {}
-    full_response = ""
-    
-    # 检查是否满足快速判定条件
-    if input_state.get('agent_keyword_result') == True and input_state.get('agent_keyword_confidence', 0) > 90:
-      # 快速判定逻辑
-      result_detail = '关键词检测结果为涉密，置信度为' + str(input_state['agent_keyword_confidence']) + '，最终判定为涉密'
-      result_confidence = input_state['agent_keyword_confidence']
-      
-      # 逐字符发送结果
-      for char in result_detail:
-        stream_data = {
-          'type': 'stream_token',
-          'node': 'agent_decision',
-          'token': char
-        }
-        yield f"data: {json.dumps(stream_data, ensure_ascii=False)}\n\n"
-      
-      decision_result = {
-        'result': True,
-        'result_detail': result_detail,
-        'result_confidence': result_confidence,
-        'current_node': 'END',
-      }
-    else:
-      # 使用 LLM 流式判定
-      from langchain_openai import ChatOpenAI
-      from langchain_core.prompts import ChatPromptTemplate
-      import os
-      
-      llm = ChatOpenAI(
-        model=os.getenv("MODEL"),
-        base_url="https://api.siliconflow.cn/v1",
-        api_key=os.getenv("SILICONFLOW_API_KEY"),
-        temperature=0
-      )
-      
-      prompt = ChatPromptTemplate.from_messages([
-        ('system','''
-        *角色设定*:
-        你是一名高权限的信息安全决策模块。
-
-        *输入数据*
-        关键字匹配结果：{agent_keyword_result}
-        关键字匹配置信度：{agent_keyword_confidence}
-        关键字匹配证据：{agent_keyword_detail}
-        语义推断结果：{agent_semantics_result}
-        语义推断置信度：{agent_semantics_confidence}
-        语义推断证据：{agent_semantics_detail}
-        非涉密证明结果：{agent_non_secret_proof_result}
-        非涉密证明置信度：{agent_non_secret_proof_confidence}
-        非涉密证明证据：{agent_non_secret_proof_detail}
-
-        *任务设定*:
-        你的任务是接收来自三个独立分析系统（系统一：关键词匹配；系统二：深层语义推断；系统三：非涉密证明）的详细报告。
-        你必须根据报告中提供的结果、置信度、证据链，结合预设的权重，执行加权平均计算和逻辑校验，最终给出关于文本是否涉密的聚合判断。
-        【聚合判断权重】:
-        关键词匹配分析 (M1) 权重： 40%
-        深层语义分析 (M2) 权重： 30%
-        非涉密证明 (M3) 权重： 30%
-
-        *输出格式*:
-        严格以纯json格式输出,确保可解析
-        {{
-          "result": True | False, // 最终裁决结果 True为涉密，False为非涉密
-          "result_confidence": [判断最终结果置信度]
-          "result_detail": [评审结果分析报告]
-        1. 关键词匹配分析：[分析报告]
-        2. 语义推断分析：[分析报告]
-        3. 非涉密证明分析：[分析报告]
-        4. 最终裁决：
-        [判断结果：涉密/非涉密]
-        决策路径与依据：
-        判定依据： [说明最终判定是满足了哪一条或哪几条规则（规则 1 / 规则 2 / 规则 3），或者三条规则均未满足。]
-        规则 1 (关键词匹配) 检查结果： [满足/不满足]
-        规则 2 (语义推断) 检查结果： [满足/不满足]
-        规则 3 (非涉密证明) 检查结果： [满足/不满足]
-        }}
-        ''')
-      ])
-      
-      chain = prompt | llm
-      response = chain.stream(input_state)
-      
-      # 逐个 token 发送
-      for event in response:
-        token = event.content
-        full_response += token
-        
-        # 发送流式 token
-        stream_data = {
-          'type': 'stream_token',
-          'node': 'agent_decision',
-          'token': token
-        }
-        yield f"data: {json.dumps(stream_data, ensure_ascii=False)}\n\n"
-      
-      # 解析最终结果
-      try:
-        # 清理响应内容
-        content = full_response.strip()
-        if content.startswith('```json'):
-          content = content[7:]
-        if content.startswith('```'):
-          content = content[3:]
-        if content.endswith('```'):
-          content = content[:-3]
-        content = content.strip()
-        
-        # 移除注释
-        lines = content.split('\n')
-        cleaned_lines = []
-        for line in lines:
-          if '//' in line:
-            comment_pos = line.find('//')
-            cleaned_lines.append(line[:comment_pos].rstrip())
-          else:
-            cleaned_lines.append(line)
-        content = '\n'.join(cleaned_lines)
-        
-        response_json = json.loads(content)
-        
-        # 确保 result 是布尔值
-        if isinstance(response_json.get('result'), str):
-          response_json['result'] = response_json['result'].lower() in ['true', 'yes', '1']
-        
-        decision_result = {
-          'result': response_json['result'],
-          'result_detail': str(response_json.get('result_detail', '')),
-          'result_confidence': int(response_json.get('result_confidence', 0)),
-          'current_node': 'END',
-        }
-      except json.JSONDecodeError as e:
-        decision_result = {
-          'result': False,
-          'result_detail': f'解析失败: {str(e)}\n原始响应: {full_response}',
-          'result_confidence': 0,
-          'current_node': 'END',
-        }
-      except Exception as e:
-        decision_result = {
-          'result': False,
-          'result_detail': f'处理错误: {str(e)}',
-          'result_confidence': 0,
-          'current_node': 'END',
-        }
-    
-    input_state.update(decision_result)
-    
-    # 发送决策评审完成消息
-    yield f"data: {json.dumps({'type': 'progress', 'node': 'agent_decision', 'data': decision_result}, ensure_ascii=False)}\n\n"
-    
-    # 发送最终结果
-    final_data = {
-      'type': 'final',
-      'data': input_state
-    }
-    yield f"data: {json.dumps(final_data, ensure_ascii=False)}\n\n"
+    # 判定缓存命中：回放保存的进度事件后直接返回最终结果
+    start = time.perf_counter()
+    cache_key, cached = verdict_cache.lookup(doc_title, doc_content)
+    if cached is not None:
+      telemetry.DOCUMENT_SECONDS.observe(time.perf_counter() - start, entry='check', outcome='cache')
+      yield writer.events(cached['events'] + [{'type': 'final', 'data': cached['state'], 'cached': True}])
+      return
+
+    with telemetry.span('check', doc_title=doc_title, doc_length=len(doc_content or '')):
+      # 近似文档：直接复用上一版本的判定，或只对新增段落做语义分析
+      near = near_dup.check(doc_title, doc_content)
+      if near is not None and near['mode'] == 'reuse':
+        telemetry.DOCUMENT_SECONDS.observe(time.perf_counter() - start, entry='check', outcome='near_dup')
+        yield writer.events([
+          {'type': 'near_duplicate', 'data': near['state']['near_duplicate']},
+          {'type': 'final', 'data': near['state'], 'near_duplicate': True},
+        ])
+        return
+      # 本地分诊模型有把握的文档直接给出结论
+      verdict, triage_info = triage.route(doc_title, doc_content)
+      if verdict is not None:
+        telemetry.DOCUMENT_SECONDS.observe(time.perf_counter() - start, entry='check', outcome='triage')
+        yield writer.event({'type': 'final', 'data': {**initial_state(doc_title, doc_content), **verdict}, 'triage': True})
+        return
+      fields = dict(near['fields']) if near else {}
+      if triage_info is not None:
+        fields['triage'] = triage_info
+      for frame in run_check(writer, cache_key, doc_title, doc_content, fields):
+        yield frame
+    telemetry.DOCUMENT_SECONDS.observe(time.perf_counter() - start, entry='check', outcome='workflow')
   
-  return Response(stream_with_context(generate()), 
+  return Response(stream_with_context(stream(writer, generate())), 
                   mimetype='text/event-stream',
+                  headers=writer.headers())
+
+@app.route('/report', methods=['POST'])
+def report():
+  """按需由大模型生成详细决策报告，请求体为 /check 返回的最终状态"""
+  state = request.json
+  writer = sse_writer()
+
+  def generate():
+    for kind, payload in agent_decision_events(state, force_llm=True):
+      if kind == 'token':
+        yield writer.token('agent_decision', payload)
+      elif kind == 'verdict':
+        yield writer.event({'type': 'verdict', 'node': 'agent_decision', 'data': payload})
+      else:
+        yield writer.event({'type': 'final', 'data': payload})
+
+  return Response(stream_with_context(stream(writer, generate())),
+                  mimetype='text/event-stream',
+                  headers=writer.headers())
+
+def run_batch_item(index, item):
+  """执行批量中的单个文档，失败只影响该条目"""
+  item_id = item.get('id', index) if isinstance(item, dict) else index
+  try:
+    if not isinstance(item, dict) or not item.get('doc_content'):
+      raise ValueError('缺少 doc_content')
+    final_state = invoke(item.get('doc_title') or '', item['doc_content'])
+    return {
+      'type': 'result',
+      'id': item_id,
+      'status': 'ok',
+      'data': {key: value for key, value in final_state.items() if key != 'keywords_list'},
+    }
+  except Exception as e:
+    return {'type': 'result', 'id': item_id, 'status': 'error', 'error': str(e)}
+
+@app.route('/check/batch', methods=['POST'])
+def check_batch():
+  """
+  批量检测：请求体为 {"items": [{"id", "doc_title", "doc_content"}, ...], "concurrency": n}
+  按完成顺序流式返回每个条目的结果，?format=sse 时以 SSE 返回，默认 NDJSON
+  """
+  data = request.json
+  items = data.get('items') if isinstance(data, dict) else data
+  if not isinstance(items, list) or not items:
+    return jsonify({'error': 'items 必须是非空数组'}), 400
+  concurrency = BATCH_CONCURRENCY
+  if isinstance(data, dict) and data.get('concurrency') is not None:
+    try:
+      if isinstance(data['concurrency'], (bool, float)):
+        raise ValueError
+      concurrency = int(data['concurrency'])
+    except (TypeError, ValueError):
+      concurrency = 0
+    if concurrency < 1:
+      return jsonify({'error': 'concurrency 必须是正整数'}), 400
+  concurrency = min(concurrency, BATCH_MAX_CONCURRENCY)
+  use_sse = request.args.get('format', 'ndjson') == 'sse'
+
+  def frame(payload):
+    if use_sse:
+      return sse(payload)
+    return json.dumps(payload, ensure_ascii=False) + '\n'
+
+  def generate():
+    queue = iter(enumerate(items))
+    pending = set()
+
+    def submit_next():
+      for index, item in queue:
+        pending.add(telemetry.submit(batch_executor, 'batch', run_batch_item, index, item))
+        return True
+      return False
+
+    # 同时在途的文档数不超过 concurrency
+    for _ in range(concurrency):
+      if not submit_next():
+        break
+    succeeded = 0
+    failed = 0
+    try:
+      while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          pending.discard(future)
+          result = future.result()
+          if result['status'] == 'ok':
+            succeeded += 1
+          else:
+            failed += 1
+          yield frame(result)
+          submit_next()
+      yield frame({'type': 'done', 'total': len(items), 'succeeded': succeeded, 'failed': failed})
+    finally:
+      # 客户端断开时取消尚未开始的条目
+      for future in pending:
+        future.cancel()
+
+  return Response(stream_with_context(generate()),
+                  mimetype='text/event-stream' if use_sse else 'application/x-ndjson',
                   headers={
                     'Cache-Control': 'no-cache',
                     'X-Accel-Buffering': 'no'
                   })
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+  """提交后台检测任务，立即返回任务 id；请求体为 {"doc_title", "doc_content", "max_attempts"}"""
+  data = request.get_json(silent=True)
+  if not isinstance(data, dict) or not data.get('doc_content'):
+    return jsonify({'error': '缺少 doc_content'}), 400
+  if not isinstance(data['doc_content'], str) or not isinstance(data.get('doc_title') or '', str):
+    return jsonify({'error': 'doc_title 与 doc_content 必须是字符串'}), 400
+  max_attempts = data.get('max_attempts')
+  if max_attempts is not None and (isinstance(max_attempts, bool) or not isinstance(max_attempts, int) or max_attempts < 1):
+    return jsonify({'error': 'max_attempts 必须是正整数'}), 400
+  jobs.ensure_workers()
+  job_id = jobs.submit(data.get('doc_title') or '', data['doc_content'], max_attempts)
+  return jsonify({'id': job_id, 'status': 'queued'}), 202
+
+@app.route('/jobs', methods=['GET'])
+def job_counts():
+  """各状态的任务数"""
+  return jsonify(jobs.get_store().counts())
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+  """任务状态、各节点进度与最终状态"""
+  job = jobs.get_store().get(job_id)
+  if job is None:
+    return jsonify({'error': '任务不存在'}), 404
+  return jsonify(job)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+  """取消任务：排队中的任务立即取消，执行中的任务在当前节点结束后中止"""
+  status = jobs.get_store().cancel(job_id)
+  if status is None:
+    return jsonify({'error': '任务不存在'}), 404
+  if status in ('succeeded', 'failed'):
+    return jsonify({'id': job_id, 'status': status, 'error': '任务已结束'}), 409
+  return jsonify({'id': job_id, 'status': status, 'cancel_requested': True})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+  cache = verdict_cache.get_cache()
+  response_cache = llm_cache.get_cache()
+  near_index = near_dup.get_index()
+  return jsonify({
+    'verdict': cache.stats() if cache else {'enabled': False},
+    'llm': response_cache.stats() if response_cache else {'enabled': False},
+    'near_dup': near_index.stats() if near_index else {'enabled': False},
+  })
+
+@app.route('/rate_limits', methods=['GET'])
+def rate_limits():
+  """上游配额限额配置与各令牌桶当前余量（所有进程共享）"""
+  return jsonify({
+    'limits': rate_limiter.load_limits(),
+    'buckets': rate_limiter.get_limiter().levels(),
+  })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+  """Prometheus 指标"""
+  return Response(telemetry.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/traces', methods=['GET'])
+def traces():
+  """最近结束的追踪 span，?trace_id= 只返回某次运行"""
+  limit = int(request.args.get('limit', '200'))
+  return jsonify(telemetry.recent_spans(request.args.get('trace_id'), limit))
+
+@app.before_request
+def start_job_workers():
+  """确保当前进程的工作线程已启动（fork 出的 WSGI 工作进程在第一个请求时启动）"""
+  jobs.ensure_workers()
+
 if __name__ == '__main__':
-  app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+  debug = os.getenv('APP_DEBUG', '1') != '0'
+  # 调试模式下重载器的父进程只负责监视文件，工作线程在实际服务的子进程中启动；重启后继续执行未完成的任务
+  if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    jobs.ensure_workers()
+  app.run(host='0.0.0.0', port=int(os.getenv('APP_PORT', '5001')), debug=debug)
\ No newline at end of file
@@ -0,0 +1,96 @@
+import math
+import os
+import re
+
+# 长文档分块：按段落、句子切分并保留重叠，每块不超过 token 预算，
+# 供语义分析与非涉密证明智能体并行分析各块后归并结果。
+#
+# 配置（环境变量）：
+#   CHUNK_MAX_TOKENS        每块 token 预算，默认 4000
+#   CHUNK_OVERLAP_TOKENS    相邻块重叠的 token 数，默认 200
+
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '4000'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '200'))
+
+_CJK = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+_PARAGRAPH = re.compile(r'\n\s*\n|\n')
+_SENTENCE = re.compile(r'(?<=[。！？!?；;…])')
+
+def estimate_tokens(text):
+  """粗略估算 token 数：中日文字符按 1 个 token，其余字符按 4 个字符 1 个 token"""
+  cjk = len(_CJK.findall(text))
+  return cjk + math.ceil((len(text) - cjk) / 4)
+
+def split_sentences(text):
+  """按段落再按句子切分，段落分隔符保留在段落最后一句末尾"""
+  sentences = []
+  position = 0
+  for match in _PARAGRAPH.finditer(text):
+    sentences.extend(_sentences_of(text[position:match.start()]))
+    if sentences:
+      sentences[-1] += match.group(0)
+    position = match.end()
+  sentences.extend(_sentences_of(text[position:]))
+  return sentences
+
+def _sentences_of(paragraph):
+  return [sentence for sentence in _SENTENCE.split(paragraph) if sentence]
+
+def _hard_split(sentence, max_tokens):
+  """没有标点的超长句子按字符数强制切分"""
+  pieces = []
+  start = 0
+  cjk = 0
+  other = 0
+  for index, char in enumerate(sentence):
+    if _CJK.match(char):
+      cjk += 1
+    else:
+      other += 1
+    if index > start and cjk + math.ceil(other / 4) > max_tokens:
+      pieces.append(sentence[start:index])
+      start = index
+      cjk, other = (1, 0) if _CJK.match(char) else (0, 1)
+  if start < len(sentence):
+    pieces.append(sentence[start:])
+  return pieces
+
+def chunk_document(text, max_tokens=None, overlap_tokens=None):
+  """把文档切分为若干块，短文档返回只含原文的单元素列表"""
+  if max_tokens is None:
+    max_tokens = CHUNK_MAX_TOKENS
+  if overlap_tokens is None:
+    overlap_tokens = CHUNK_OVERLAP_TOKENS
+  text = text or ''
+  if estimate_tokens(text) <= max_tokens:
+    return [text]
+
+  units = []
+  for sentence in split_sentences(text):
+    tokens = estimate_tokens(sentence)
+    if tokens > max_tokens:
+      units.extend((piece, estimate_tokens(piece)) for piece in _hard_split(sentence, max_tokens))
+    else:
+      units.append((sentence, tokens))
+
+  chunks = []
+  current = []
+  current_tokens = 0
+  for sentence, tokens in units:
+    if current and current_tokens + tokens > max_tokens:
+      chunks.append(''.join(unit[0] for unit in current))
+      # 新块以上一块末尾若干句作为重叠上下文
+      overlap = []
+      overlap_size = 0
+      for unit in reversed(current):
+        if overlap_size + unit[1] > overlap_tokens or overlap_size + unit[1] + tokens > max_tokens:
+          break
+        overlap.insert(0, unit)
+        overlap_size += unit[1]
+      current = overlap
+      current_tokens = overlap_size
+    current.append((sentence, tokens))
+    current_tokens += tokens
+  if current:
+    chunks.append(''.join(unit[0] for unit in current))
+  return chunks
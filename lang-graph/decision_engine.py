@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+
+# 本地决策聚合：按 lib/decision.json 中的权重对三个智能体的结论加权，微秒级给出最终判定。
+# 只有各智能体结论不一致且加权得分落在阈值附近的模糊区间内时，才交给大模型决策。
+#
+# decision.json：
+#   weights            各智能体权重（未执行的智能体不参与加权）
+#   secret_threshold   加权涉密得分达到该值判定为涉密（0-100）
+#   ambiguity_band     得分与阈值的差小于该值且智能体结论不一致时视为模糊
+#   llm_on_ambiguity   模糊时是否调用大模型决策
+
+DECISION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib', 'decision.json')
+
+# 各智能体 result 取何值表示“涉密”
+SECRET_VALUES = {
+  'agent_keyword': True,
+  'agent_semantics': True,
+  'agent_non_secret_proof': False,
+}
+
+AGENT_LABELS = {
+  'agent_keyword': '关键词匹配',
+  'agent_semantics': '语义推断',
+  'agent_non_secret_proof': '非涉密证明',
+}
+
+_lock = threading.Lock()
+_cached = {}
+
+def load_config(path=DECISION_PATH):
+  """读取决策配置，文件变更后自动重新加载"""
+  mtime = os.path.getmtime(path)
+  cached = _cached.get(path)
+  if cached and cached[0] == mtime:
+    return cached[1]
+  with _lock:
+    with open(path, 'r', encoding='utf-8') as f:
+      config = json.load(f)
+    _cached[path] = (mtime, config)
+    return config
+
+def agent_ran(state, agent_name):
+  """默认状态下详情为空字符串，据此判断该智能体是否执行过"""
+  detail = state.get(f'{agent_name}_detail')
+  return detail not in (None, '', [])
+
+def secret_score(state, agent_name):
+  """把智能体的结论与置信度换算为 0-100 的涉密得分"""
+  confidence = max(0, min(100, float(state.get(f'{agent_name}_confidence') or 0)))
+  if state.get(f'{agent_name}_result') == SECRET_VALUES[agent_name]:
+    return confidence
+  if agent_name == 'agent_keyword':
+    # 关键词提示词把 confidence 定义为“存在关联”的置信度，无关联时两种解读取较低的涉密得分
+    return min(confidence, 100 - confidence)
+  return 100 - confidence
+
+def decide(state, config=None):
+  """
+  加权聚合三个智能体的结论
+  返回 {result, result_confidence, score, ambiguous, votes}
+  """
+  if config is None:
+    config = load_config()
+  threshold = config.get('secret_threshold', 50)
+  votes = {}
+  weighted = 0.0
+  total_weight = 0.0
+  for agent_name, weight in config['weights'].items():
+    if weight <= 0 or not agent_ran(state, agent_name):
+      continue
+    score = secret_score(state, agent_name)
+    votes[agent_name] = score
+    weighted += weight * score
+    total_weight += weight
+  if not total_weight:
+    return {'result': False, 'result_confidence': 0, 'score': 0.0, 'ambiguous': True, 'votes': votes}
+  score = weighted / total_weight
+  result = score >= threshold
+  disagree = len({vote >= threshold for vote in votes.values()}) > 1
+  return {
+    'result': result,
+    'result_confidence': int(round(score if result else 100 - score)),
+    'score': score,
+    'ambiguous': disagree and abs(score - threshold) < config.get('ambiguity_band', 10),
+    'votes': votes,
+  }
+
+def needs_llm(decision, config=None):
+  """模糊且配置允许时才调用大模型"""
+  if config is None:
+    config = load_config()
+  return decision['ambiguous'] and config.get('llm_on_ambiguity', True)
+
+def render_weights(config=None):
+  """按 decision.json 渲染大模型决策提示词中的权重说明，与本地加权保持一致"""
+  if config is None:
+    config = load_config()
+  return '\n'.join(
+    f"{AGENT_LABELS[agent_name]} (M{index}) 权重： {config['weights'].get(agent_name, 0):.0%}"
+    for index, agent_name in enumerate(SECRET_VALUES, start=1)
+  )
+
+def render_report(decision, config=None):
+  """生成简明的决策报告（本地模板，详细分析报告可通过 /report 按需由大模型生成）"""
+  if config is None:
+    config = load_config()
+  threshold = config.get('secret_threshold', 50)
+  lines = [
+    f"最终裁决：{'涉密' if decision['result'] else '非涉密'}",
+    '决策路径与依据：',
+    f"判定依据：加权涉密得分 {decision['score']:.1f}，判定阈值 {threshold}，置信度 {decision['result_confidence']}",
+  ]
+  for index, agent_name in enumerate(SECRET_VALUES, start=1):
+    label = AGENT_LABELS[agent_name]
+    if agent_name not in decision['votes']:
+      lines.append(f'规则 {index} ({label}) 检查结果：未执行')
+      continue
+    vote = decision['votes'][agent_name]
+    status = '满足' if vote >= threshold else '不满足'
+    lines.append(f"规则 {index} ({label}) 检查结果：{status}（涉密得分 {vote:.0f}，权重 {config['weights'][agent_name]:.0%}）")
+  return '\n'.join(lines)
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from verdict_cache import CACHE_DIR, normalize_text
+
+# 文档判定记录：为每个已判定的文档保存内容哈希、判定时的关键词库版本、命中的关键词以及判定依赖的关键词，
+# 并为每个关键词库版本保存快照。关键词库变更后 rescan.py 对比快照得到新增 / 删除的关键词，
+# 只重新判定命中新增关键词或判定依赖被删除关键词的文档，而不是整个归档。
+#
+#   matched_terms   正文中字面命中（精确、归一化或核心词）的关键词
+#   verdict_terms   关键词检测结论为关联时，结论所依据的关键词（字面命中 + 大模型证据中引用的候选关键词）
+#
+# 正文以 zlib 压缩保存，rescan 可以直接在本地用新增关键词重新匹配，不需要重新抽取原文件。
+#
+# 配置（环境变量）：
+#   DOC_RECORDS_DB    记录数据库路径，默认 CACHE_DIR/documents.db
+
+def content_hash(doc_title, doc_content):
+  return hashlib.sha256(f'{normalize_text(doc_title)}\x00{normalize_text(doc_content)}'.encode('utf-8')).hexdigest()
+
+def verdict_terms(final_state, matched_terms):
+  """关键词检测结论为关联时，判定依赖的关键词；结论为不关联时判定不依赖任何关键词"""
+  if not final_state.get('agent_keyword_result'):
+    return []
+  detail = str(final_state.get('agent_keyword_detail', ''))
+  cited = [keyword for keyword in final_state.get('keywords_list') or [] if keyword in detail]
+  return sorted(set(matched_terms) | set(cited))
+
+class DocumentRecords:
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    self._conn.executescript('''
+    CREATE TABLE IF NOT EXISTS documents (
+      doc_id TEXT PRIMARY KEY,
+      doc_title TEXT NOT NULL,
+      content BLOB NOT NULL,
+      content_hash TEXT NOT NULL,
+      library_version TEXT NOT NULL,
+      matched_terms TEXT NOT NULL,
+      verdict_terms TEXT NOT NULL,
+      result INTEGER,
+      updated REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_documents_library_version ON documents(library_version);
+    CREATE TABLE IF NOT EXISTS verdict_terms (
+      term TEXT NOT NULL,
+      doc_id TEXT NOT NULL,
+      PRIMARY KEY (term, doc_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_verdict_terms_doc ON verdict_terms(doc_id);
+    CREATE TABLE IF NOT EXISTS libraries (
+      version TEXT PRIMARY KEY,
+      library TEXT NOT NULL,
+      created REAL NOT NULL
+    );
+    ''')
+    self._conn.commit()
+
+  def save_library(self, matcher):
+    """保存关键词库快照（每个版本只保存一次）"""
+    with self._lock:
+      self._conn.execute(
+        'INSERT OR IGNORE INTO libraries (version, library, created) VALUES (?, ?, ?)',
+        (matcher.version, json.dumps(matcher.library, ensure_ascii=False), time.time()),
+      )
+      self._conn.commit()
+
+  def library(self, version):
+    with self._lock:
+      row = self._conn.execute('SELECT library FROM libraries WHERE version = ?', (version,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+  def put(self, doc_id, doc_title, doc_content, library_version, matched, depended, result):
+    with self._lock:
+      self._conn.execute(
+        'INSERT OR REPLACE INTO documents (doc_id, doc_title, content, content_hash, library_version, matched_terms, '
+        'verdict_terms, result, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (
+          doc_id,
+          doc_title,
+          zlib.compress(doc_content.encode('utf-8')),
+          content_hash(doc_title, doc_content),
+          library_version,
+          json.dumps(matched, ensure_ascii=False),
+          json.dumps(depended, ensure_ascii=False),
+          None if result is None else int(result),
+          time.time(),
+        ),
+      )
+      self._conn.execute('DELETE FROM verdict_terms WHERE doc_id = ?', (doc_id,))
+      self._conn.executemany('INSERT INTO verdict_terms (term, doc_id) VALUES (?, ?)', [(term, doc_id) for term in depended])
+      self._conn.commit()
+
+  def get(self, doc_id):
+    with self._lock:
+      row = self._conn.execute(
+        'SELECT doc_title, content, content_hash, library_version, matched_terms, verdict_terms, result '
+        'FROM documents WHERE doc_id = ?',
+        (doc_id,),
+      ).fetchone()
+    if row is None:
+      return None
+    return {
+      'doc_id': doc_id,
+      'doc_title': row[0],
+      'doc_content': zlib.decompress(row[1]).decode('utf-8'),
+      'content_hash': row[2],
+      'library_version': row[3],
+      'matched_terms': json.loads(row[4]),
+      'verdict_terms': json.loads(row[5]),
+      'result': None if row[6] is None else bool(row[6]),
+    }
+
+  def versions(self):
+    """各关键词库版本下的文档数"""
+    with self._lock:
+      return dict(self._conn.execute('SELECT library_version, COUNT(*) FROM documents GROUP BY library_version').fetchall())
+
+  def iter_contents(self, library_version, batch=500):
+    """逐批读取某个库版本下的文档 (doc_id, 标题, 正文)"""
+    last = ''
+    while True:
+      with self._lock:
+        rows = self._conn.execute(
+          'SELECT doc_id, doc_title, content FROM documents WHERE library_version = ? AND doc_id > ? ORDER BY doc_id LIMIT ?',
+          (library_version, last, batch),
+        ).fetchall()
+      if not rows:
+        return
+      for doc_id, doc_title, content in rows:
+        yield doc_id, doc_title, zlib.decompress(content).decode('utf-8')
+      last = rows[-1][0]
+
+  def depending_on(self, terms, library_version):
+    """判定依赖其中任一关键词的文档"""
+    if not terms:
+      return {}
+    placeholders = ','.join('?' for _ in terms)
+    with self._lock:
+      rows = self._conn.execute(
+        f'SELECT t.doc_id, t.term FROM verdict_terms t JOIN documents d ON d.doc_id = t.doc_id '
+        f'WHERE d.library_version = ? AND t.term IN ({placeholders})',
+        (library_version, *terms),
+      ).fetchall()
+    affected = {}
+    for doc_id, term in rows:
+      affected.setdefault(doc_id, []).append(term)
+    return affected
+
+  def advance(self, from_version, to_version, removed, exclude=(), batch=500):
+    """
+    未受影响的文档直接升级到新库版本（不重新判定），并从命中记录中去掉已删除的关键词
+    exclude 为需要重新判定的文档，保持旧版本；返回升级的文档数
+    """
+    removed = set(removed)
+    exclude = set(exclude)
+    advanced = 0
+    last = ''
+    while True:
+      with self._lock:
+        rows = self._conn.execute(
+          'SELECT doc_id, matched_terms FROM documents WHERE library_version = ? AND doc_id > ? ORDER BY doc_id LIMIT ?',
+          (from_version, last, batch),
+        ).fetchall()
+        if not rows:
+          return advanced
+        for doc_id, matched_terms in rows:
+          if doc_id in exclude:
+            continue
+          matched = [term for term in json.loads(matched_terms) if term not in removed]
+          self._conn.execute(
+            'UPDATE documents SET library_version = ?, matched_terms = ? WHERE doc_id = ?',
+            (to_version, json.dumps(matched, ensure_ascii=False), doc_id),
+          )
+          advanced += 1
+        self._conn.commit()
+      last = rows[-1][0]
+
+_records = None
+_records_lock = threading.Lock()
+
+def get_records():
+  """获取进程内共享的记录实例"""
+  global _records
+  if _records is None:
+    with _records_lock:
+      if _records is None:
+        _records = DocumentRecords(os.getenv('DOC_RECORDS_DB', os.path.join(CACHE_DIR, 'documents.db')))
+  return _records
+
+def record(doc_id, doc_title, doc_content, final_state, records=None):
+  """记录一次判定：命中的关键词按当前关键词库重新匹配得到（本地 Aho–Corasick 扫描，开销很小）"""
+  from keyword_matcher import get_matcher
+  records = records or get_records()
+  matcher = get_matcher()
+  records.save_library(matcher)
+  matched = sorted({hit['keyword'] for hit in matcher.find(doc_content)})
+  records.put(
+    doc_id,
+    doc_title,
+    doc_content,
+    matcher.version,
+    matched,
+    verdict_terms(final_state, matched),
+    final_state.get('result'),
+  )
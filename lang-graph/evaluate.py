@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from colorama import Fore,Back,Style
+
+# 并行评测工具：在带标注的语料上运行工作流，输出准确率、精确率/召回率、混淆矩阵、
+# 各节点耗时分位数、大模型调用次数与关键词快速通道比例，并写入 JSON 报告便于对比不同版本。
+#
+# 用法：
+#   python lang-graph/evaluate.py --db lang-graph/test_documents_3.db --concurrency 8 --output report.json
+#   python lang-graph/evaluate.py --jsonl corpus.jsonl
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def iter_db(path):
+  """逐行读取测试数据库 (title, summary, is_sensitive)"""
+  conn = sqlite3.connect(path)
+  try:
+    for row in conn.execute('SELECT id, title, summary, is_sensitive FROM test'):
+      yield {
+        'id': f'{os.path.basename(path)}:{row[0]}',
+        'doc_title': row[1],
+        'doc_content': row[2],
+        'expected': bool(row[3]),
+      }
+  finally:
+    conn.close()
+
+def iter_jsonl(path):
+  """逐行读取 JSONL 语料，兼容 doc_title/title、doc_content/content/summary、is_sensitive/label 字段"""
+  with open(path, 'r', encoding='utf-8') as f:
+    for index, line in enumerate(f):
+      if not line.strip():
+        continue
+      item = json.loads(line)
+      yield {
+        'id': item.get('id', f'{os.path.basename(path)}:{index}'),
+        'doc_title': item.get('doc_title', item.get('title', '')),
+        'doc_content': item.get('doc_content', item.get('content', item.get('summary', ''))),
+        'expected': bool(item.get('is_sensitive', item.get('label'))),
+      }
+
+def percentiles(values):
+  """返回 p50/p90/p95/p99/均值/最大值（线性插值）"""
+  if not values:
+    return {}
+  ordered = sorted(values)
+
+  def pick(p):
+    position = (len(ordered) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+  return {
+    'count': len(ordered),
+    'p50': pick(50),
+    'p90': pick(90),
+    'p95': pick(95),
+    'p99': pick(99),
+    'mean': sum(ordered) / len(ordered),
+    'max': ordered[-1],
+  }
+
+def evaluate_document(document):
+  from main import invoke
+  start = time.perf_counter()
+  record = {
+    'id': document['id'],
+    'doc_title': document['doc_title'],
+    'expected': document['expected'],
+  }
+  try:
+    final_state = invoke(document['doc_title'], document['doc_content'])
+  except Exception as e:
+    record.update({'error': str(e), 'seconds': time.perf_counter() - start})
+    return record
+  nodes = [timing['node'] for timing in final_state.get('node_timings', [])]
+  record.update({
+    'predicted': bool(final_state.get('result')),
+    'result_confidence': final_state.get('result_confidence', 0),
+    'seconds': time.perf_counter() - start,
+    'node_timings': final_state.get('node_timings', []),
+    # 关键词检测后直接进入决策，未经过语义分析
+    'fast_path': 'agent_keyword' in nodes and 'agent_semantics' not in nodes,
+    'fired_policies': final_state.get('fired_policies', []),
+    'skipped_nodes': final_state.get('skipped_nodes', []),
+    # 近似文档处理方式（reuse / partial / full），未匹配到近似文档时为空
+    'near_duplicate': (final_state.get('near_duplicate') or {}).get('mode'),
+    # 本地分诊直接判定（未调用大模型）
+    'triaged': (final_state.get('triage') or {}).get('label') is not None,
+  })
+  return record
+
+def summarize(records, wall_seconds, llm_calls):
+  scored = [record for record in records if 'error' not in record]
+  confusion = {'tp': 0, 'fp': 0, 'tn': 0, 'fn': 0}
+  for record in scored:
+    if record['predicted'] and record['expected']:
+      confusion['tp'] += 1
+    elif record['predicted']:
+      confusion['fp'] += 1
+    elif record['expected']:
+      confusion['fn'] += 1
+    else:
+      confusion['tn'] += 1
+  precision = confusion['tp'] / (confusion['tp'] + confusion['fp']) if confusion['tp'] + confusion['fp'] else 0.0
+  recall = confusion['tp'] / (confusion['tp'] + confusion['fn']) if confusion['tp'] + confusion['fn'] else 0.0
+  node_seconds = {}
+  for record in scored:
+    for timing in record['node_timings']:
+      node_seconds.setdefault(timing['node'], []).append(timing['seconds'])
+  policy_counts = {}
+  for record in scored:
+    for name in record['fired_policies']:
+      policy_counts[name] = policy_counts.get(name, 0) + 1
+  return {
+    'documents': len(records),
+    'errors': len(records) - len(scored),
+    'accuracy': (confusion['tp'] + confusion['tn']) / len(scored) if scored else 0.0,
+    'precision': precision,
+    'recall': recall,
+    'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+    'confusion_matrix': confusion,
+    'fast_path_rate': sum(1 for record in scored if record['fast_path']) / len(scored) if scored else 0.0,
+    'policy_rates': {name: count / len(scored) for name, count in policy_counts.items()},
+    'triage_rate': sum(1 for record in scored if record.get('triaged')) / len(scored) if scored else 0.0,
+    'triage_accuracy': (
+      sum(1 for record in scored if record.get('triaged') and record['predicted'] == record['expected'])
+      / sum(1 for record in scored if record.get('triaged'))
+      if any(record.get('triaged') for record in scored) else 0.0
+    ),
+    'near_duplicate_rates': {
+      mode: sum(1 for record in scored if record.get('near_duplicate') == mode) / len(scored) if scored else 0.0
+      for mode in ('reuse', 'partial', 'full')
+    },
+    'wall_seconds': wall_seconds,
+    'documents_per_second': len(records) / wall_seconds if wall_seconds else 0.0,
+    'latency': {
+      'document': percentiles([record['seconds'] for record in scored]),
+      'nodes': {node: percentiles(values) for node, values in node_seconds.items()},
+    },
+    'llm_calls': {
+      'total': sum(llm_calls.values()),
+      'per_document': sum(llm_calls.values()) / len(records) if records else 0.0,
+      'by_agent': llm_calls,
+    },
+  }
+
+def run(documents, concurrency=4):
+  """并行评测，返回报告（summary + 每篇文档的明细）"""
+  from llm_client import call_counts
+  calls_before = call_counts()
+  start = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    records = list(executor.map(evaluate_document, documents))
+  wall_seconds = time.perf_counter() - start
+  calls_after = call_counts()
+  llm_calls = {agent: calls_after[agent] - calls_before.get(agent, 0) for agent in calls_after}
+  return {
+    'summary': summarize(records, wall_seconds, llm_calls),
+    'documents': records,
+  }
+
+def print_summary(summary):
+  print(f'{Fore.GREEN}{Style.BRIGHT}准确率:{Style.RESET_ALL}{Fore.YELLOW}{summary["accuracy"] * 100:.1f}%{Style.RESET_ALL}')
+  print(f'{Fore.CYAN}精确率: {summary["precision"]:.3f}  召回率: {summary["recall"]:.3f}  F1: {summary["f1"]:.3f}{Style.RESET_ALL}')
+  print(f'{Fore.CYAN}混淆矩阵: {summary["confusion_matrix"]}{Style.RESET_ALL}')
+  print(f'{Fore.CYAN}快速通道比例: {summary["fast_path_rate"] * 100:.1f}%  失败: {summary["errors"]}{Style.RESET_ALL}')
+  for name, rate in summary['policy_rates'].items():
+    print(f'{Fore.CYAN}策略 {name} 触发比例: {rate * 100:.1f}%{Style.RESET_ALL}')
+  if summary['triage_rate']:
+    print(f'{Fore.CYAN}本地分诊比例: {summary["triage_rate"] * 100:.1f}%  分诊准确率: {summary["triage_accuracy"] * 100:.1f}%{Style.RESET_ALL}')
+  near = summary['near_duplicate_rates']
+  if any(near.values()):
+    print(f'{Fore.CYAN}近似文档: 复用 {near["reuse"] * 100:.1f}%  部分分析 {near["partial"] * 100:.1f}%  完整分析 {near["full"] * 100:.1f}%{Style.RESET_ALL}')
+  print(f'{Fore.CYAN}大模型调用: {summary["llm_calls"]["total"]} 次（每篇 {summary["llm_calls"]["per_document"]:.2f}）{Style.RESET_ALL}')
+  print(f'{Fore.CYAN}总耗时: {summary["wall_seconds"]:.2f}s  吞吐: {summary["documents_per_second"]:.2f} 篇/秒{Style.RESET_ALL}')
+  for node, stats in summary['latency']['nodes'].items():
+    print(f'  {node}: p50={stats["p50"]:.3f}s p95={stats["p95"]:.3f}s p99={stats["p99"]:.3f}s')
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='涉密文件判定工作流评测')
+  parser.add_argument('--db', action='append', default=[], help='测试数据库路径，可重复指定')
+  parser.add_argument('--jsonl', action='append', default=[], help='JSONL 语料路径，可重复指定')
+  parser.add_argument('--concurrency', type=int, default=4, help='并行评测的文档数')
+  parser.add_argument('--output', help='JSON 报告输出路径')
+  parser.add_argument('--use-verdict-cache', action='store_true', help='允许复用文档级判定缓存（默认关闭以测量真实耗时）')
+  parser.add_argument('--use-near-dup', action='store_true', help='允许复用近似文档的判定（默认关闭，语料中的近似文档会影响准确率统计）')
+  parser.add_argument('--use-triage', action='store_true', help='允许本地分诊直接判定（默认关闭，分诊模型的训练语料不能包含评测语料）')
+  parser.add_argument('--no-llm-cache', action='store_true', help='关闭智能体级响应缓存')
+  args = parser.parse_args(argv)
+
+  if not args.use_verdict_cache:
+    os.environ['VERDICT_CACHE'] = '0'
+  if not args.use_near_dup:
+    os.environ['NEAR_DUP'] = '0'
+  if not args.use_triage:
+    os.environ['TRIAGE'] = '0'
+  if args.no_llm_cache:
+    os.environ['LLM_CACHE'] = '0'
+  if not args.db and not args.jsonl:
+    args.db = [os.path.join(CURRENT_DIR, 'test_documents_3.db')]
+
+  documents = []
+  for path in args.db:
+    documents.extend(iter_db(path))
+  for path in args.jsonl:
+    documents.extend(iter_jsonl(path))
+
+  report = run(documents, concurrency=args.concurrency)
+  report['config'] = {
+    'db': args.db,
+    'jsonl': args.jsonl,
+    'concurrency': args.concurrency,
+    'verdict_cache': args.use_verdict_cache,
+    'near_dup': args.use_near_dup,
+    'triage': args.use_triage,
+    'llm_cache': not args.no_llm_cache,
+  }
+  print_summary(report['summary'])
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'报告已写入: {args.output}')
+  return report
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -3,7 +3,7 @@ from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 import json
-import re
+import rule_engine
 
 # 初始化 LLM
 llm = ChatOpenAI(
@@ -13,6 +13,10 @@ llm = ChatOpenAI(
     temperature=0
 )
 
+# 关键词与正则规则文件
+RULE_PATH = '../rule.json'
+REGEX_PATH = '../regex.json'
+
 # 匹配状态 State
 class MatchingState(TypedDict):
     title: str
@@ -28,75 +32,32 @@ class MatchingState(TypedDict):
     risk_level: str
     sensitive_topics: List[str]
     recommendations: str
+    rule_scan: Dict[str, Any]  # 规则引擎单遍扫描的完整结果，关键词与正则两个节点共用
 
 # 节点1：关键词匹配
 def keyword_match(state: MatchingState) -> Dict[str, Any]:
-    """关键词匹配节点"""
-    text = state['text'].lower()
-    keywords = state['keywords_to_match']
-    result = {}
-    is_sensitive = False
-    total_matches = 0
-
-    for kw in keywords:
-        kw_lower = kw.lower()
-        matches = re.findall(re.escape(kw_lower), text)
-        count = len(matches)
-        if count > 0:
-            result[kw] = count
-            total_matches += count
-            is_sensitive = True
+    """关键词匹配节点（规则引擎单遍扫描，结果与逐个关键词 re.findall 一致）"""
+    scan = rule_engine.get_engine(RULE_PATH, REGEX_PATH).scan(state['text'])
+    result = {keyword: item['count'] for keyword, item in scan['keywords'].items()}
+    total_matches = scan['total_keyword_matches']
+    is_sensitive = total_matches > 0
 
     print(f"--- 关键词匹配完成 | 匹配 {len(result)} 个关键词 | 总计 {total_matches} 次 ---")
 
     return {
         'keyword_result': result,
         'is_sensitive': is_sensitive or state.get('is_sensitive', False),
-        'total_keyword_matches': total_matches
+        'total_keyword_matches': total_matches,
+        'rule_scan': scan
     }
 
 # 节点2：正则匹配
 def regex_match(state: MatchingState) -> Dict[str, Any]:
-    """正则规则匹配节点"""
-    text = state['text']
-    regex_rules = state['regex_rules']
-    result = {}
-    total_matches = 0
-    
-    for rule in regex_rules:
-        rule_id = rule['id']
-        rule_name = rule['name']
-        pattern = rule['regex']
-        category = rule['category']
-        
-        try:
-            matches = re.findall(pattern, text)
-            
-            if matches:
-                match_list = []
-                for match in matches:
-                    if isinstance(match, tuple):
-                        matched_text = ''.join([str(m) for m in match if m])
-                    else:
-                        matched_text = str(match)
-                    
-                    match_list.append({
-                        'matched_text': matched_text,
-                        'category': category
-                    })
-                
-                result[rule_id] = {
-                    'rule_name': rule_name,
-                    'category': category,
-                    'matches': match_list,
-                    'count': len(matches)
-                }
-                
-                total_matches += len(matches)
-        
-        except re.error as e:
-            print(f"[警告] 正则表达式错误 [{rule_id}]: {e}")
-            continue
+    """正则规则匹配节点（规则在加载时编译与校验，只执行必需字面量出现过的规则）"""
+    # 关键词匹配节点已经扫描过正文，直接使用同一次扫描的正则结果
+    scan = state.get('rule_scan') or rule_engine.get_engine(RULE_PATH, REGEX_PATH).scan(state['text'])
+    result = scan['regex']
+    total_matches = scan['total_regex_matches']
     
     is_sensitive = state.get('is_sensitive', False) or (total_matches > 0)
     
@@ -284,22 +245,10 @@ with open('../秋日私语.txt', 'r', encoding='utf-8') as f:
     text = f.read()
     title = '秋日私语'
 
-# 2. 获取涉密关键词
-with open('../rule.json', 'r', encoding='utf-8') as f:
-    keywords_data = json.load(f)
-
-# 3. 获取正则表达式规则
-with open('../regex.json', 'r', encoding='utf-8') as f:
-    regex_data = json.load(f)
-
-# 解析涉密关键词
-keywords_to_match = []
-for category in keywords_data['categories']:
-    for keyword in category['keywords']:
-        keywords_to_match.append(keyword)
-
-# 解析正则规则
-regex_rules = regex_data['rules']
+# 2. 加载并编译涉密关键词与正则表达式规则（规则不合法时在这里报错）
+engine = rule_engine.get_engine(RULE_PATH, REGEX_PATH)
+keywords_to_match = engine.keywords
+regex_rules = engine.rules
 
 # 初始状态
 initial_state = {
@@ -315,7 +264,8 @@ initial_state = {
     "llm_analysis": "",
     "risk_level": "未知",
     "sensitive_topics": [],
-    "recommendations": ""
+    "recommendations": "",
+    "rule_scan": {}
 }
 
 print("=" * 80)
@@ -0,0 +1,357 @@
+import argparse
+import codecs
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from xml.etree import ElementTree
+from colorama import Fore,Back,Style
+
+# 文档接入：在进入工作流之前把 txt / md / html / docx / pdf 文件抽取为规范化正文与标题等元数据。
+# 解析是 CPU 密集型工作，放在进程池中执行，不阻塞判定流程中等待大模型的线程。
+# 大文件按页（PDF 页、DOCX 段落、文本块）流式读取，正文超过 INGEST_MAX_CHARS 后停止读取并标记为已截断。
+# 抽取耗时单独记录在元数据 extract_seconds 中，与判定耗时分开统计（见 scan.py）。
+#
+# PDF 需要可选依赖 pypdf（pip install pypdf），未安装时 PDF 文件抽取失败并给出提示；其余格式只依赖标准库。
+# 文本编码检测：BOM → UTF-8 → charset_normalizer（已安装时）→ GB18030 → Big5，均失败时替换非法字节。
+#
+# 用法：
+#   python lang-graph/ingest.py 通知.docx 报告.pdf --json
+#
+# 配置（环境变量）：
+#   INGEST_WORKERS     抽取进程数，默认 CPU 核数
+#   INGEST_MAX_CHARS   单个文档最多保留的字符数，默认 2000000
+
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '0')) or os.cpu_count() or 1
+INGEST_MAX_CHARS = int(os.getenv('INGEST_MAX_CHARS', '2000000'))
+
+TEXT_BLOCK = 64 * 1024
+SNIFF_BYTES = 64 * 1024
+
+FORMATS = {
+  '.txt': 'text',
+  '.md': 'text',
+  '.htm': 'html',
+  '.html': 'html',
+  '.docx': 'docx',
+  '.pdf': 'pdf',
+}
+SUPPORTED_EXTENSIONS = tuple(FORMATS)
+
+class ExtractError(ValueError):
+  """文件无法抽取（格式不支持、文件损坏或缺少可选依赖）"""
+
+# ---- 编码检测 ----
+
+BOMS = (
+  (codecs.BOM_UTF8, 'utf-8-sig'),
+  (codecs.BOM_UTF32_LE, 'utf-32'),
+  (codecs.BOM_UTF32_BE, 'utf-32'),
+  (codecs.BOM_UTF16_LE, 'utf-16'),
+  (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+FALLBACK_ENCODINGS = ('gb18030', 'big5')
+
+def _strict_decodes(sample, encoding):
+  """样本能按该编码解码（忽略样本末尾被截断的多字节字符）"""
+  try:
+    codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    return True
+  except UnicodeDecodeError:
+    return False
+
+def detect_encoding(sample):
+  """根据文件开头的字节推测编码"""
+  for bom, encoding in BOMS:
+    if sample.startswith(bom):
+      return encoding
+  if _strict_decodes(sample, 'utf-8'):
+    return 'utf-8'
+  # 没有 BOM 的 UTF-16：英文与标点的高字节为 0
+  if len(sample) >= 4 and sample[1::2].count(0) > len(sample) // 4:
+    return 'utf-16-le'
+  if len(sample) >= 4 and sample[0::2].count(0) > len(sample) // 4:
+    return 'utf-16-be'
+  try:
+    from charset_normalizer import from_bytes
+    best = from_bytes(sample).best()
+    if best is not None:
+      return best.encoding
+  except ImportError:
+    pass
+  for encoding in FALLBACK_ENCODINGS:
+    if _strict_decodes(sample, encoding):
+      return encoding
+  return 'utf-8'
+
+def decode_bytes(raw):
+  """整段字节解码为文本，返回 (文本, 编码)"""
+  encoding = detect_encoding(raw[:SNIFF_BYTES])
+  return raw.decode(encoding, errors='replace'), encoding
+
+def iter_decoded(f, encoding):
+  """按块流式解码，避免一次读入整个大文件"""
+  decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+  while True:
+    block = f.read(TEXT_BLOCK)
+    if not block:
+      tail = decoder.decode(b'', final=True)
+      if tail:
+        yield tail
+      return
+    text = decoder.decode(block)
+    if text:
+      yield text
+
+# ---- 规范化 ----
+
+CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u200b-\u200f\ufeff]')
+BLANK_LINES = re.compile(r'\n{3,}')
+INLINE_SPACES = re.compile(r'[ \t　\xa0]+')
+
+def normalize(text):
+  """统一换行与全半角，去除控制字符和多余空白，保留段落结构"""
+  text = unicodedata.normalize('NFKC', text.replace('\r\n', '\n').replace('\r', '\n'))
+  text = CONTROL_CHARS.sub('', text)
+  lines = [INLINE_SPACES.sub(' ', line).strip() for line in text.split('\n')]
+  return BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()
+
+# ---- 各格式抽取（生成器按页产出文本，metadata 记录标题、编码等） ----
+
+def extract_text_file(path, metadata):
+  with open(path, 'rb') as f:
+    sample = f.read(SNIFF_BYTES)
+    metadata['encoding'] = detect_encoding(sample)
+    f.seek(0)
+    yield from iter_decoded(f, metadata['encoding'])
+
+class _HTMLText(HTMLParser):
+  SKIP = {'script', 'style', 'noscript', 'template', 'svg', 'head'}
+  BLOCK = {'p', 'div', 'br', 'li', 'tr', 'section', 'article', 'table', 'ul', 'ol', 'blockquote', 'pre',
+           'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+  def __init__(self):
+    super().__init__(convert_charrefs=True)
+    self.parts = []
+    self.title = ''
+    self.heading = ''
+    self._skip = 0
+    self._in_title = False
+    self._in_heading = False
+
+  def handle_starttag(self, tag, attrs):
+    if tag == 'title':
+      self._in_title = True
+    elif tag in self.SKIP:
+      self._skip += 1
+    elif tag == 'h1' and not self.heading:
+      self._in_heading = True
+    if tag in self.BLOCK:
+      self.parts.append('\n')
+
+  def handle_endtag(self, tag):
+    if tag == 'title':
+      self._in_title = False
+    elif tag in self.SKIP:
+      self._skip = max(0, self._skip - 1)
+    elif tag == 'h1':
+      self._in_heading = False
+    if tag in self.BLOCK:
+      self.parts.append('\n')
+
+  def handle_data(self, data):
+    if self._in_title:
+      self.title += data
+    elif not self._skip:
+      self.parts.append(data)
+      if self._in_heading:
+        self.heading += data
+
+  def take(self):
+    text = ''.join(self.parts)
+    self.parts = []
+    return text
+
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+
+def extract_html(path, metadata):
+  with open(path, 'rb') as f:
+    sample = f.read(SNIFF_BYTES)
+    declared = META_CHARSET.search(sample)
+    encoding = declared.group(1).decode('ascii').lower() if declared else detect_encoding(sample)
+    try:
+      codecs.lookup(encoding)
+    except LookupError:
+      encoding = detect_encoding(sample)
+    metadata['encoding'] = encoding
+    f.seek(0)
+    parser = _HTMLText()
+    for text in iter_decoded(f, encoding):
+      parser.feed(text)
+      # 超过字数上限时生成器会被提前关闭，标题随解析进度更新
+      metadata['title'] = (parser.title or parser.heading).strip()
+      chunk = parser.take()
+      if chunk:
+        yield chunk
+    parser.close()
+    metadata['title'] = (parser.title or parser.heading).strip()
+    chunk = parser.take()
+    if chunk:
+      yield chunk
+
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DC_TITLE = '{http://purl.org/dc/elements/1.1/}title'
+
+def extract_docx(path, metadata):
+  try:
+    archive = zipfile.ZipFile(path)
+  except zipfile.BadZipFile as e:
+    raise ExtractError(f'不是有效的 docx 文件: {e}') from e
+  with archive:
+    if 'docProps/core.xml' in archive.namelist():
+      with archive.open('docProps/core.xml') as f:
+        title = ElementTree.parse(f).getroot().find(DC_TITLE)
+        metadata['title'] = (title.text or '').strip() if title is not None else ''
+    if 'word/document.xml' not in archive.namelist():
+      raise ExtractError('docx 中缺少 word/document.xml')
+    paragraphs = 0
+    with archive.open('word/document.xml') as f:
+      # 逐段解析并释放已处理的元素，大文档内存占用不随篇幅增长
+      for _, element in ElementTree.iterparse(f, events=('end',)):
+        if element.tag != f'{W_NS}p':
+          continue
+        parts = []
+        for node in element.iter():
+          if node.tag == f'{W_NS}t' and node.text:
+            parts.append(node.text)
+          elif node.tag == f'{W_NS}tab':
+            parts.append('\t')
+          elif node.tag in (f'{W_NS}br', f'{W_NS}cr'):
+            parts.append('\n')
+        element.clear()
+        paragraphs += 1
+        yield ''.join(parts) + '\n'
+    metadata['paragraphs'] = paragraphs
+
+def extract_pdf(path, metadata):
+  try:
+    from pypdf import PdfReader
+  except ImportError as e:
+    raise ExtractError('抽取 PDF 需要安装 pypdf') from e
+  try:
+    reader = PdfReader(path)
+  except Exception as e:
+    raise ExtractError(f'无法解析 PDF: {e}') from e
+  info = reader.metadata
+  metadata['title'] = (info.title or '').strip() if info is not None and info.title else ''
+  metadata['page_count'] = len(reader.pages)
+  for page in reader.pages:
+    yield (page.extract_text() or '') + '\n'
+
+EXTRACTORS = {
+  'text': extract_text_file,
+  'html': extract_html,
+  'docx': extract_docx,
+  'pdf': extract_pdf,
+}
+
+def detect_format(path):
+  fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+  if fmt is None:
+    raise ExtractError(f'不支持的文件格式: {os.path.basename(path)}')
+  return fmt
+
+def extract(path, max_chars=None):
+  """
+  抽取单个文件（在抽取进程中执行）
+  返回 {'doc_title', 'doc_content', 'metadata': {path, format, title, encoding, pages, chars, truncated, bytes, extract_seconds}}
+  """
+  if max_chars is None:
+    max_chars = INGEST_MAX_CHARS
+  start = time.perf_counter()
+  fmt = detect_format(path)
+  metadata = {'path': path, 'format': fmt, 'bytes': os.path.getsize(path), 'title': ''}
+  parts = []
+  chars = 0
+  pages = 0
+  truncated = False
+  pages_iter = EXTRACTORS[fmt](path, metadata)
+  try:
+    for page in pages_iter:
+      pages += 1
+      if chars + len(page) > max_chars:
+        parts.append(page[:max_chars - chars])
+        truncated = True
+        break
+      parts.append(page)
+      chars += len(page)
+  finally:
+    pages_iter.close()
+  doc_content = normalize(''.join(parts))
+  title = normalize(metadata['title']).replace('\n', ' ') or os.path.splitext(os.path.basename(path))[0]
+  metadata.update({
+    'title': title,
+    'pages': pages,
+    'chars': len(doc_content),
+    'truncated': truncated,
+    'extract_seconds': time.perf_counter() - start,
+  })
+  return {'doc_title': title, 'doc_content': doc_content, 'metadata': metadata}
+
+class Extractor:
+  """抽取进程池；spawn 方式启动，避免在多线程的父进程中 fork"""
+
+  def __init__(self, workers=None, max_chars=None):
+    self.max_chars = max_chars if max_chars is not None else INGEST_MAX_CHARS
+    self._executor = ProcessPoolExecutor(
+      max_workers=workers or INGEST_WORKERS,
+      mp_context=multiprocessing.get_context('spawn'),
+    )
+
+  def submit(self, path):
+    return self._executor.submit(extract, path, self.max_chars)
+
+  def extract(self, path):
+    return self.submit(path).result()
+
+  def close(self, cancel=False):
+    self._executor.shutdown(wait=not cancel, cancel_futures=cancel)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='抽取文档正文与元数据')
+  parser.add_argument('paths', nargs='+', help='txt / md / html / docx / pdf 文件')
+  parser.add_argument('--json', action='store_true', help='以 JSONL 输出（doc_title、doc_content、metadata）')
+  parser.add_argument('--max-chars', type=int, default=INGEST_MAX_CHARS)
+  args = parser.parse_args(argv)
+
+  with Extractor(max_chars=args.max_chars) as extractor:
+    futures = [(path, extractor.submit(path)) for path in args.paths]
+    for path, future in futures:
+      try:
+        document = future.result()
+      except ExtractError as e:
+        print(f'{Fore.RED}{path}: {e}{Style.RESET_ALL}', file=sys.stderr)
+        continue
+      if args.json:
+        print(json.dumps(document, ensure_ascii=False))
+        continue
+      metadata = document['metadata']
+      print(f'{Fore.GREEN}{Style.BRIGHT}{document["doc_title"]}{Style.RESET_ALL} '
+            f'{Fore.CYAN}({metadata["format"]}, {metadata["chars"]} 字, {metadata["pages"]} 页/段, '
+            f'{metadata["extract_seconds"] * 1000:.1f}ms{"，已截断" if metadata["truncated"] else ""}){Style.RESET_ALL}')
+      print(document['doc_content'][:500])
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from colorama import Fore,Back,Style
+from verdict_cache import CACHE_DIR
+import telemetry
+
+# 后台检测任务：POST /jobs 把文档写入 SQLite 持久化队列后立即返回任务 id，后台工作线程执行工作流 (main.invoke)，
+# 客户端通过 GET /jobs/<id> 轮询状态、各节点进度与最终状态。客户端断开连接不影响检测，服务重启后未完成的任务继续执行。
+#
+# 任务状态：queued → running → succeeded / failed / cancelled
+#   - 执行中的任务持有租约，每个节点结束时续约；进程崩溃后租约过期，任务被其他工作线程（或重启后的进程）重新领取
+#   - 执行失败按指数退避重新排队，达到最大尝试次数后标记为 failed
+#   - 取消：排队中的任务立即取消；执行中的任务在当前节点结束后中止
+#
+# 多个进程（app.py 内置的工作线程、python jobs.py 启动的独立工作进程）可以共用同一个队列，领取任务时用 BEGIN IMMEDIATE 互斥。
+#
+# 配置（环境变量）：
+#   JOB_DB              队列数据库路径，默认 CACHE_DIR/jobs.db
+#   JOB_WORKERS         app.py 内置的工作线程数，默认 4，设为 0 时只接收任务（由独立工作进程执行）；
+#                       内置工作线程在服务进程收到第一个请求时启动（仅导入 app 不会启动），没有请求时需要继续执行的任务由 python jobs.py 处理
+#   JOB_MAX_ATTEMPTS    每个任务的最大尝试次数，默认 3
+#   JOB_RETRY_BASE      重试退避基数（秒），默认 5
+#   JOB_LEASE           租约时长（秒），超过该时间没有进度的执行中任务视为已失效，默认 900
+#   JOB_POLL_INTERVAL   队列为空时的轮询间隔（秒），默认 1
+#   JOB_RETENTION       已结束任务的保留时长（秒），默认 7 天
+
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BASE = float(os.getenv('JOB_RETRY_BASE', '5'))
+JOB_LEASE = float(os.getenv('JOB_LEASE', '900'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+JOB_RETENTION = float(os.getenv('JOB_RETENTION', str(7 * 24 * 3600)))
+
+STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+class JobCancelled(Exception):
+  """任务在执行中被取消"""
+
+class JobStore:
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    self.pid = os.getpid()
+    # 手动管理事务：领取任务时 BEGIN IMMEDIATE 在进程间互斥
+    self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    self._conn.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+      id TEXT PRIMARY KEY,
+      status TEXT NOT NULL,
+      doc_title TEXT NOT NULL,
+      doc_content TEXT NOT NULL,
+      attempts INTEGER NOT NULL DEFAULT 0,
+      max_attempts INTEGER NOT NULL,
+      progress TEXT NOT NULL DEFAULT '[]',
+      result TEXT,
+      error TEXT,
+      cancel_requested INTEGER NOT NULL DEFAULT 0,
+      worker TEXT,
+      lease_until REAL,
+      next_run REAL NOT NULL,
+      created REAL NOT NULL,
+      started REAL,
+      finished REAL
+    )
+    ''')
+    self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_next_run ON jobs(status, next_run)')
+
+  def _transaction(self, fn):
+    with self._lock:
+      self._conn.execute('BEGIN IMMEDIATE')
+      try:
+        result = fn()
+        self._conn.execute('COMMIT')
+      except BaseException:
+        self._conn.execute('ROLLBACK')
+        raise
+    return result
+
+  def submit(self, doc_title, doc_content, max_attempts=None):
+    if max_attempts is not None and (isinstance(max_attempts, bool) or not isinstance(max_attempts, int) or max_attempts < 1):
+      # 非整数写入 SQLite 后 claim() 的 attempts >= max_attempts 永远不成立，任务会被无限次重新领取
+      raise ValueError(f'max_attempts 必须是正整数: {max_attempts!r}')
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with self._lock:
+      self._conn.execute(
+        'INSERT INTO jobs (id, status, doc_title, doc_content, max_attempts, next_run, created) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (job_id, 'queued', doc_title or '', doc_content, max_attempts or JOB_MAX_ATTEMPTS, now, now),
+      )
+    return job_id
+
+  def claim(self, worker):
+    """领取一个到期的排队任务，或租约已过期的执行中任务；没有时返回 None"""
+    def claim_one():
+      now = time.time()
+      # 执行进程退出前已请求取消的任务直接取消，反复导致进程退出的任务不再重新领取
+      self._conn.execute(
+        "UPDATE jobs SET status = 'cancelled', error = '已取消', finished = ?, lease_until = NULL "
+        "WHERE status = 'running' AND lease_until < ? AND cancel_requested = 1",
+        (now, now),
+      )
+      self._conn.execute(
+        "UPDATE jobs SET status = 'failed', error = '执行中断次数达到上限', finished = ?, lease_until = NULL "
+        "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+        (now, now),
+      )
+      row = self._conn.execute(
+        "SELECT id, doc_title, doc_content, attempts, next_run, status FROM jobs "
+        "WHERE (status = 'queued' AND next_run <= ?) OR (status = 'running' AND lease_until < ?) "
+        "ORDER BY next_run LIMIT 1",
+        (now, now),
+      ).fetchone()
+      if row is None:
+        return None
+      job_id, doc_title, doc_content, attempts, next_run, status = row
+      if status == 'running':
+        # 上次执行的进程已退出，算作一次失败的尝试
+        print(f'{Fore.YELLOW}任务 {job_id} 租约过期，重新执行{Style.RESET_ALL}')
+      self._conn.execute(
+        "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ?, "
+        "started = ?, progress = '[]' WHERE id = ?",
+        (worker, now + JOB_LEASE, now, job_id),
+      )
+      return {
+        'id': job_id,
+        'doc_title': doc_title,
+        'doc_content': doc_content,
+        'attempt': attempts + 1,
+        'queued_seconds': max(0.0, now - next_run),
+      }
+    return self._transaction(claim_one)
+
+  def add_progress(self, job_id, worker, entry):
+    """追加一条节点进度并续约，返回是否已请求取消"""
+    def update():
+      row = self._conn.execute(
+        'SELECT progress, cancel_requested FROM jobs WHERE id = ? AND worker = ?', (job_id, worker)
+      ).fetchone()
+      if row is None:
+        # 租约已被其他工作线程接管
+        return True
+      progress = json.loads(row[0])
+      progress.append(entry)
+      self._conn.execute(
+        'UPDATE jobs SET progress = ?, lease_until = ? WHERE id = ?',
+        (json.dumps(progress, ensure_ascii=False, default=str), time.time() + JOB_LEASE, job_id),
+      )
+      return bool(row[1])
+    return self._transaction(update)
+
+  def finish(self, job_id, worker, status, result=None, error=None):
+    now = time.time()
+    with self._lock:
+      self._conn.execute(
+        'UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_until = NULL WHERE id = ? AND worker = ?',
+        (status, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None, error, now, job_id, worker),
+      )
+
+  def fail(self, job_id, worker, error):
+    """执行失败：未达到最大尝试次数时按指数退避重新排队，返回新的状态"""
+    def update():
+      row = self._conn.execute(
+        'SELECT attempts, max_attempts, cancel_requested FROM jobs WHERE id = ? AND worker = ?', (job_id, worker)
+      ).fetchone()
+      if row is None:
+        return None
+      attempts, max_attempts, cancel_requested = row
+      now = time.time()
+      if cancel_requested:
+        status = 'cancelled'
+      elif attempts < max_attempts:
+        status = 'queued'
+      else:
+        status = 'failed'
+      if status == 'queued':
+        delay = random.uniform(0.5, 1.0) * JOB_RETRY_BASE * 2 ** (attempts - 1)
+        self._conn.execute(
+          "UPDATE jobs SET status = 'queued', error = ?, next_run = ?, worker = NULL, lease_until = NULL WHERE id = ?",
+          (error, now + delay, job_id),
+        )
+      else:
+        self._conn.execute(
+          'UPDATE jobs SET status = ?, error = ?, finished = ?, lease_until = NULL WHERE id = ?',
+          (status, error, now, job_id),
+        )
+      return status
+    return self._transaction(update)
+
+  def cancel(self, job_id):
+    """取消任务，返回取消后的状态；任务不存在时返回 None"""
+    def update():
+      row = self._conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+      if row is None:
+        return None
+      status = row[0]
+      if status == 'queued':
+        self._conn.execute(
+          "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished = ? WHERE id = ?", (time.time(), job_id)
+        )
+        return 'cancelled'
+      if status == 'running':
+        self._conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+      return status
+    return self._transaction(update)
+
+  def get(self, job_id):
+    columns = ('id', 'status', 'doc_title', 'attempts', 'max_attempts', 'progress', 'result', 'error',
+               'cancel_requested', 'created', 'started', 'finished')
+    with self._lock:
+      row = self._conn.execute(f'SELECT {", ".join(columns)} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+      return None
+    job = dict(zip(columns, row))
+    job['progress'] = json.loads(job['progress'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['cancel_requested'] = bool(job['cancel_requested'])
+    return job
+
+  def counts(self):
+    with self._lock:
+      rows = self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+    counts = {status: 0 for status in STATUSES}
+    counts.update(dict(rows))
+    return counts
+
+  def purge(self, retention=JOB_RETENTION):
+    """删除结束超过保留时长的任务"""
+    with self._lock:
+      placeholders = ','.join('?' for _ in FINISHED)
+      cursor = self._conn.execute(
+        f'DELETE FROM jobs WHERE status IN ({placeholders}) AND finished < ?', (*FINISHED, time.time() - retention)
+      )
+    return cursor.rowcount
+
+def summarize_output(node_output):
+  """进度中只保留节点的结论字段，完整内容在最终状态中"""
+  return {
+    key: value for key, value in node_output.items()
+    if key.endswith(('_result', '_confidence')) or key in ('result', 'fired_policies', 'skipped_nodes', 'degraded_agents', 'node_timings')
+  }
+
+def run_job(store, worker, job):
+  """执行一个已领取的任务"""
+  from main import invoke
+
+  def on_progress(node_name, node_output):
+    entry = {'node': node_name, 'time': time.time(), 'data': summarize_output(node_output)}
+    if store.add_progress(job['id'], worker, entry):
+      raise JobCancelled(job['id'])
+
+  telemetry.QUEUE_SECONDS.observe(job['queued_seconds'], pool='jobs')
+  start = time.perf_counter()
+  with telemetry.span('job', job_id=job['id'], attempt=job['attempt'], doc_title=job['doc_title']) as span:
+    try:
+      final_state = invoke(job['doc_title'], job['doc_content'], on_progress=on_progress)
+    except JobCancelled:
+      store.finish(job['id'], worker, 'cancelled', error='已取消')
+      span.set_attribute('status', 'cancelled')
+      telemetry.JOBS.inc(status='cancelled')
+      print(f'{Fore.YELLOW}任务 {job["id"]} 已取消{Style.RESET_ALL}')
+      return
+    except Exception as e:
+      span.record_exception(e)
+      status = store.fail(job['id'], worker, f'{type(e).__name__}: {e}')
+      span.set_attribute('status', status)
+      if status in FINISHED:
+        telemetry.JOBS.inc(status=status)
+      print(f'{Fore.RED}任务 {job["id"]} 第 {job["attempt"]} 次执行失败（{status}）: {e}{Style.RESET_ALL}')
+      return
+    result = {key: value for key, value in final_state.items() if key != 'keywords_list'}
+    store.finish(job['id'], worker, 'succeeded', result=result)
+    span.set_attributes(status='succeeded', result=final_state.get('result'))
+  telemetry.JOBS.inc(status='succeeded')
+  telemetry.DOCUMENT_SECONDS.observe(time.perf_counter() - start, entry='job', outcome='succeeded')
+
+class WorkerPool:
+  """从队列领取并执行任务的工作线程"""
+
+  def __init__(self, store, workers):
+    self.store = store
+    self.workers = workers
+    self.pid = os.getpid()
+    self.prefix = f'{socket.gethostname()}:{self.pid}'
+    self._wakeup = threading.Event()
+    self._stopping = threading.Event()
+    self._threads = []
+
+  def start(self):
+    for index in range(self.workers):
+      thread = threading.Thread(target=self._run, args=(f'{self.prefix}:{index}',), name=f'job-worker-{index}', daemon=True)
+      thread.start()
+      self._threads.append(thread)
+    print(f'{Fore.GREEN}后台任务工作线程已启动: {self.workers} 个{Style.RESET_ALL}')
+
+  def notify(self):
+    """有新任务时唤醒空闲的工作线程"""
+    self._wakeup.set()
+
+  def stop(self, timeout=None):
+    self._stopping.set()
+    self._wakeup.set()
+    for thread in self._threads:
+      thread.join(timeout)
+
+  def _run(self, worker):
+    while not self._stopping.is_set():
+      try:
+        job = self.store.claim(worker)
+      except sqlite3.OperationalError as e:
+        print(f'{Fore.RED}领取任务失败: {e}{Style.RESET_ALL}')
+        job = None
+      if job is None:
+        self._wakeup.wait(JOB_POLL_INTERVAL)
+        self._wakeup.clear()
+        continue
+      try:
+        run_job(self.store, worker, job)
+      except Exception as e:
+        # 记录结果时出错（例如数据库被锁）：工作线程继续运行，任务在租约过期后由其他线程重新领取
+        print(f'{Fore.RED}执行任务 {job["id"]} 出错: {type(e).__name__}: {e}，租约过期后重新领取{Style.RESET_ALL}')
+
+_store = None
+_pool = None
+_lock = threading.Lock()
+
+def get_store():
+  """获取进程内共享的队列实例"""
+  global _store
+  # SQLite 连接不能跨 fork 使用，子进程重新打开
+  if _store is None or _store.pid != os.getpid():
+    with _lock:
+      if _store is None or _store.pid != os.getpid():
+        _store = JobStore(os.getenv('JOB_DB', os.path.join(CACHE_DIR, 'jobs.db')))
+  return _store
+
+def ensure_workers(workers=None):
+  """启动进程内的工作线程（只启动一次），JOB_WORKERS=0 时不启动"""
+  global _pool
+  if workers is None:
+    workers = int(os.getenv('JOB_WORKERS', '4'))
+  if workers <= 0:
+    return None
+  # fork 出的子进程（例如 gunicorn --preload）继承了 _pool 但没有继承线程，需要重新启动
+  if _pool is None or _pool.pid != os.getpid():
+    store = get_store()
+    with _lock:
+      if _pool is None or _pool.pid != os.getpid():
+        _pool = WorkerPool(store, workers)
+        _pool.start()
+  return _pool
+
+def submit(doc_title, doc_content, max_attempts=None):
+  job_id = get_store().submit(doc_title, doc_content, max_attempts)
+  if _pool is not None:
+    _pool.notify()
+  return job_id
+
+def main():
+  parser = argparse.ArgumentParser(description='独立运行后台任务工作进程（与 app.py 共用 JOB_DB 队列）')
+  parser.add_argument('--workers', type=int, default=int(os.getenv('JOB_WORKERS', '4')) or 4, help='工作线程数')
+  parser.add_argument('--purge', action='store_true', help='启动前删除超过 JOB_RETENTION 的已结束任务')
+  args = parser.parse_args()
+
+  store = get_store()
+  if args.purge:
+    print(f'已删除 {store.purge()} 个过期任务')
+  print(f'队列: {store.path} {store.counts()}')
+  pool = ensure_workers(args.workers)
+  stopped = threading.Event()
+  signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+  try:
+    while not stopped.wait(1):
+      pass
+  except KeyboardInterrupt:
+    pass
+  # 执行中的任务没有结束时，租约过期后由其他进程接管
+  print('正在停止工作线程...')
+  pool.stop(timeout=5)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,242 @@
+import json
+import re
+
+# 增量 JSON 提取器：边接收大模型 token 边解析顶层对象，每个字段一完整就立即返回，
+# 例如 result / result_confidence 可以在很长的 result_detail 生成完之前拿到。
+# 兼容 ```json 代码块、对象前后的说明文字、// 注释、Python 风格的 True/False/None、
+# 字段间缺少逗号以及未加引号的多行文本值；输出被截断时 close() 会尽量保留已生成的内容。
+
+# 值结束后的下一个字段：  "key":
+_NEXT_KEY = re.compile(r'\s*"[^"\n]{1,64}"\s*:')
+_LITERALS = re.compile(r'"(?:\\.|[^"\\])*"|\bTrue\b|\bFalse\b|\bNone\b')
+_LITERAL_MAP = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+class JSONExtractError(ValueError):
+  """响应中找不到所需字段；raw 为原始响应"""
+
+  def __init__(self, message, raw=''):
+    super().__init__(message)
+    self.raw = raw
+
+def _fix_literals(raw):
+  return _LITERALS.sub(lambda match: _LITERAL_MAP.get(match.group(0), match.group(0)), raw)
+
+def _parse_value(raw):
+  """解析单个字段值，不是合法 JSON 时保留原始文本"""
+  raw = raw.strip().rstrip(',').rstrip()
+  try:
+    return json.loads(_fix_literals(raw), strict=False)
+  except ValueError:
+    # 被截断的字符串值：去掉开头的引号
+    if raw.startswith('"'):
+      return raw[1:]
+    return raw
+
+class IncrementalJSONParser:
+  def __init__(self):
+    self.fields = {}
+    self._buffer = ''
+    self._pos = 0
+    self._state = 'start'
+    self._key = None
+    self._value = []
+    self._depth = 0
+    self._in_string = False
+    self._escape = False
+
+  def feed(self, text):
+    """追加一段文本，返回本次新解析完成的字段"""
+    self._buffer += text
+    return self._advance(final=False)
+
+  def close(self):
+    """输入结束，返回剩余字段（包括被截断的最后一个字段）"""
+    completed = self._advance(final=True)
+    if self._state == 'value' and self._key is not None:
+      completed.update(self._finish_value())
+    self._state = 'done'
+    return completed
+
+  def _advance(self, final):
+    completed = {}
+    buffer = self._buffer
+    while self._pos < len(buffer) and self._state != 'done':
+      if self._state == 'start':
+        index = buffer.find('{', self._pos)
+        if index < 0:
+          self._pos = len(buffer)
+          break
+        self._pos = index + 1
+        self._state = 'key'
+      elif self._state == 'key':
+        char = buffer[self._pos]
+        if char.isspace() or char == ',':
+          self._pos += 1
+        elif char == '}':
+          self._state = 'done'
+        elif char == '/':
+          if self._pos + 1 == len(buffer) and not final:
+            break
+          end = buffer.find('\n', self._pos)
+          if end < 0:
+            break
+          self._pos = end + 1
+        elif char == '"':
+          end = self._string_end(buffer, self._pos + 1)
+          if end < 0:
+            break
+          self._key = json.loads(buffer[self._pos:end + 1])
+          self._pos = end + 1
+          self._state = 'colon'
+        else:
+          # 非法字符（例如 key 未加引号），跳过
+          self._pos += 1
+      elif self._state == 'colon':
+        char = buffer[self._pos]
+        self._pos += 1
+        if char == ':':
+          self._state = 'value'
+          self._value = []
+          self._depth = 0
+          self._in_string = False
+          self._escape = False
+        elif not char.isspace():
+          self._state = 'key'
+      elif self._state == 'value':
+        if not self._scan_value(buffer, final, completed):
+          break
+    return completed
+
+  def _scan_value(self, buffer, final, completed):
+    """扫描字段值；需要更多输入才能判断时返回 False"""
+    while self._pos < len(buffer):
+      char = buffer[self._pos]
+      if self._in_string:
+        self._value.append(char)
+        self._pos += 1
+        if self._escape:
+          self._escape = False
+        elif char == '\\':
+          self._escape = True
+        elif char == '"':
+          self._in_string = False
+        continue
+      if char == '/' and self._pos + 1 == len(buffer) and not final:
+        # 可能是注释的开头，等待下一个字符
+        return False
+      if buffer.startswith('//', self._pos):
+        end = buffer.find('\n', self._pos)
+        if end < 0:
+          if not final:
+            return False
+          self._pos = len(buffer)
+          return True
+        self._pos = end
+        continue
+      if char == '"':
+        self._in_string = True
+      elif char in '{[':
+        self._depth += 1
+      elif char in '}]' and self._depth > 0:
+        self._depth -= 1
+      elif self._depth == 0 and char == '}':
+        completed.update(self._finish_value())
+        self._state = 'done'
+        self._pos += 1
+        return True
+      elif self._depth == 0 and char in ',\n':
+        # 逗号或换行之后紧跟下一个 "key": 才视为当前值结束
+        lookahead = buffer[self._pos + 1:self._pos + 80]
+        if _NEXT_KEY.match(lookahead):
+          completed.update(self._finish_value())
+          self._pos += 1
+          self._state = 'key'
+          return True
+        if not final and len(lookahead) < 79 and self._may_become_key(lookahead):
+          return False
+      self._value.append(char)
+      self._pos += 1
+    return True
+
+  @staticmethod
+  def _may_become_key(lookahead):
+    stripped = lookahead.lstrip()
+    return stripped == '' or (stripped.startswith('"') and '\n' not in stripped)
+
+  @staticmethod
+  def _string_end(buffer, index):
+    escape = False
+    while index < len(buffer):
+      char = buffer[index]
+      if escape:
+        escape = False
+      elif char == '\\':
+        escape = True
+      elif char == '"':
+        return index
+      index += 1
+    return -1
+
+  def _finish_value(self):
+    value = _parse_value(''.join(self._value))
+    self.fields[self._key] = value
+    completed = {self._key: value}
+    self._key = None
+    self._value = []
+    return completed
+
+def parse_llm_json(text):
+  """一次性解析完整响应，返回全部字段"""
+  parser = IncrementalJSONParser()
+  parser.feed(text or '')
+  parser.close()
+  return parser.fields
+
+def to_bool(value):
+  if isinstance(value, str):
+    return value.strip().lower() in ['true', 'yes', '1', '涉密']
+  return bool(value)
+
+def to_int(value):
+  if isinstance(value, (int, float)) and not isinstance(value, bool):
+    return int(value)
+  match = re.search(r'\d+', str(value))
+  return int(match.group(0)) if match else 0
+
+def verdict_from_fields(fields):
+  """提取决策结论（不含报告正文）"""
+  return {
+    'result': to_bool(fields['result']),
+    'result_confidence': to_int(fields.get('result_confidence', 0)),
+  }
+
+def agent_parser(result_key):
+  """
+  返回智能体响应的解析函数（关键词检测为 associated，语义分析与非涉密证明为 result）：
+  容错解析后把结论转为布尔值、置信度转为整数，缺少结论字段时抛出 JSONExtractError
+  """
+  def parse(text):
+    fields = parse_llm_json(text)
+    if result_key not in fields:
+      raise JSONExtractError(f'响应中没有 {result_key} 字段', text)
+    parsed = dict(fields)
+    parsed[result_key] = to_bool(fields[result_key])
+    parsed['confidence'] = to_int(fields.get('confidence', 0))
+    parsed.setdefault('evidence', [])
+    return parsed
+  return parse
+
+def parse_decision(text):
+  """解析决策评审响应；只要能拿到 result 就返回结论，result_detail 缺失或格式异常时保留原文"""
+  return decision_from_fields(parse_llm_json(text), text)
+
+def decision_from_fields(fields, text=''):
+  if 'result' not in fields:
+    raise JSONExtractError('响应中没有 result 字段', text)
+  decision = verdict_from_fields(fields)
+  detail = fields.get('result_detail', '')
+  if not isinstance(detail, str):
+    detail = json.dumps(detail, ensure_ascii=False)
+  decision['result_detail'] = detail
+  decision['current_node'] = 'END'
+  return decision
@@ -0,0 +1,86 @@
+import math
+import os
+import threading
+from keyword_matcher import get_matcher, normalize
+
+# 关键词库的本地词法索引：以字符 n-gram 为词项、关键词为“文档”建立 BM25 倒排索引，
+# 为每篇待检文本挑选最相关的 top-k 候选关键词放进提示词，关键词库增长时提示词长度基本不变。
+#
+# 配置（环境变量）：
+#   KEYWORD_PROMPT_TOP_K    提示词中的候选关键词数（字面命中的关键词总会被包含），默认 30
+
+KEYWORD_PROMPT_TOP_K = int(os.getenv('KEYWORD_PROMPT_TOP_K', '30'))
+
+def ngrams(text, n=2):
+  """字符 n-gram，长度不足 n 的文本返回其本身"""
+  if len(text) <= n:
+    return [text] if text else []
+  return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+class KeywordIndex:
+  def __init__(self, keywords, n=2, k1=1.2, b=0.75):
+    self.keywords = list(keywords)
+    self.n = n
+    self.k1 = k1
+    self.b = b
+    self._postings = {}
+    lengths = []
+    for index, keyword in enumerate(self.keywords):
+      grams = ngrams(normalize(keyword), n)
+      lengths.append(len(grams))
+      counts = {}
+      for gram in grams:
+        counts[gram] = counts.get(gram, 0) + 1
+      for gram, count in counts.items():
+        self._postings.setdefault(gram, []).append((index, count))
+    average = sum(lengths) / len(lengths) if lengths else 1.0
+    total = len(self.keywords)
+    self._idf = {
+      gram: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+      for gram, postings in self._postings.items()
+    }
+    self._norms = [k1 * (1 - b + b * length / average) for length in lengths]
+
+  def score(self, text):
+    """返回 {关键词下标: BM25 分数}，文本中的每个 n-gram 作为一次查询词项"""
+    scores = {}
+    for gram in set(ngrams(normalize(text), self.n)):
+      postings = self._postings.get(gram)
+      if postings is None:
+        continue
+      idf = self._idf[gram]
+      for index, count in postings:
+        scores[index] = scores.get(index, 0.0) + idf * count * (self.k1 + 1) / (count + self._norms[index])
+    return scores
+
+  def top_k(self, text, k=None, required=()):
+    """挑选候选关键词：先放入必须包含的关键词（字面命中），再按分数补足到 k 个"""
+    if k is None:
+      k = KEYWORD_PROMPT_TOP_K
+    selected = []
+    for keyword in required:
+      if keyword not in selected:
+        selected.append(keyword)
+    scores = self.score(text)
+    for index in sorted(scores, key=scores.get, reverse=True):
+      if len(selected) >= k:
+        break
+      if self.keywords[index] not in selected:
+        selected.append(self.keywords[index])
+    return selected
+
+_lock = threading.Lock()
+_cached = {}
+
+def get_index():
+  """获取与当前关键词库版本对应的索引（进程内共享，关键词库变更后重建）"""
+  matcher = get_matcher()
+  index = _cached.get(matcher.version)
+  if index is None:
+    with _lock:
+      index = _cached.get(matcher.version)
+      if index is None:
+        index = KeywordIndex(matcher.keywords)
+        _cached.clear()
+        _cached[matcher.version] = index
+  return index
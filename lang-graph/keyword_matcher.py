@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import deque
+from functools import lru_cache
+
+# 本地关键词预过滤：由 keywords.json 一次性构建 Aho–Corasick 多模式自动机，
+# 单次扫描即可找出全部字面命中（含字符偏移），命中足够多时直接给出关键词检测结果，无需调用大模型。
+
+KEYWORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib', 'keywords.json')
+
+# 达到该数量的不同关键词（精确或归一化命中）即视为字面证据充分
+FASTPATH_MIN_HITS = int(os.getenv('KEYWORD_FASTPATH_MIN_HITS', '2'))
+
+# 关键词中的括号限定语，例如 “财政预算(草案)” 中的 “(草案)”
+_QUALIFIER = re.compile(r'\([^)]*\)')
+
+def normalize_with_offsets(text):
+  """
+  归一化文本（NFKC 全半角统一、小写、去除空白），
+  同时返回每个归一化字符在原文中的位置，用于把命中位置映射回原文
+  """
+  chars = []
+  offsets = []
+  for index, char in enumerate(text):
+    norm = _normalize_char(char)
+    if len(norm) == 1:
+      chars.append(norm)
+      offsets.append(index)
+    else:
+      for norm_char in norm:
+        chars.append(norm_char)
+        offsets.append(index)
+  return ''.join(chars), offsets
+
+@lru_cache(maxsize=65536)
+def _normalize_char(char):
+  return ''.join(c for c in unicodedata.normalize('NFKC', char).lower() if not c.isspace())
+
+def normalize(text):
+  return normalize_with_offsets(text)[0]
+
+class Automaton:
+  """Aho–Corasick 多模式匹配自动机，payload 为每个模式附带的任意数据"""
+
+  def __init__(self, patterns):
+    self._goto = [{}]
+    self._fail = [0]
+    self._output = [[]]
+    for pattern, payload in patterns:
+      if pattern:
+        self._add(pattern, payload)
+    self._build()
+
+  def _add(self, pattern, payload):
+    node = 0
+    for char in pattern:
+      next_node = self._goto[node].get(char)
+      if next_node is None:
+        next_node = len(self._goto)
+        self._goto[node][char] = next_node
+        self._goto.append({})
+        self._fail.append(0)
+        self._output.append([])
+      node = next_node
+    self._output[node].append((len(pattern), payload))
+
+  def _build(self):
+    queue = deque(self._goto[0].values())
+    while queue:
+      node = queue.popleft()
+      for char, child in self._goto[node].items():
+        queue.append(child)
+        fail = self._fail[node]
+        while fail and char not in self._goto[fail]:
+          fail = self._fail[fail]
+        self._fail[child] = self._goto[fail].get(char, 0)
+        self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+  def iter_matches(self, text):
+    """逐个返回 (start, end, payload)，包含重叠命中"""
+    goto = self._goto
+    fail = self._fail
+    output = self._output
+    node = 0
+    for index, char in enumerate(text):
+      while node and char not in goto[node]:
+        node = fail[node]
+      node = goto[node].get(char, 0)
+      for length, payload in output[node]:
+        yield index + 1 - length, index + 1, payload
+
+class KeywordMatcher:
+  """关键词库匹配器：精确命中、归一化命中以及去掉括号限定语后的核心词命中"""
+
+  def __init__(self, library, version=''):
+    self.library = library
+    self.version = version
+    self.keywords = []
+    self.categories = {}
+    patterns = []
+    seen = set()
+    for category in library:
+      for keyword in library[category]:
+        self.keywords.append(keyword)
+        self.categories[keyword] = category
+        full = normalize(keyword)
+        core = normalize(_QUALIFIER.sub('', unicodedata.normalize('NFKC', keyword)))
+        if (full, keyword) not in seen:
+          seen.add((full, keyword))
+          patterns.append((full, (keyword, 'normalized')))
+        if core != full and len(core) >= 2 and (core, keyword) not in seen:
+          seen.add((core, keyword))
+          patterns.append((core, (keyword, 'core')))
+    self._automaton = Automaton(patterns)
+
+  def find(self, text):
+    """返回全部命中，每个命中包含关键词、分类、原文片段、原文偏移和命中方式"""
+    normalized, offsets = normalize_with_offsets(text or '')
+    hits = []
+    for start, end, (keyword, match_type) in self._automaton.iter_matches(normalized):
+      orig_start = offsets[start]
+      orig_end = offsets[end - 1] + 1
+      matched = text[orig_start:orig_end]
+      if match_type == 'normalized' and matched == keyword:
+        match_type = 'exact'
+      hits.append({
+        'keyword': keyword,
+        'category': self.categories[keyword],
+        'matched': matched,
+        'start': orig_start,
+        'end': orig_end,
+        'match_type': match_type,
+      })
+    return hits
+
+def literal_verdict(hits, min_hits=None):
+  """
+  根据字面命中给出关键词检测结果
+  精确/归一化命中的不同关键词数达到阈值时返回结果，否则返回 None 交给大模型判断语义关联
+  """
+  if min_hits is None:
+    min_hits = FASTPATH_MIN_HITS
+  strong = []
+  for hit in hits:
+    if hit['match_type'] != 'core' and hit['keyword'] not in strong:
+      strong.append(hit['keyword'])
+  if len(strong) < min_hits:
+    return None
+  return {
+    'associated': True,
+    'confidence': min(99, 90 + 3 * len(strong)),
+    'evidence': format_evidence(hits),
+  }
+
+def format_evidence(hits):
+  """把命中转换为与大模型输出一致的证据链格式"""
+  labels = {'exact': '直接匹配', 'normalized': '归一化匹配', 'core': '核心词匹配'}
+  evidence = []
+  for hit in hits:
+    evidence.append(f"{labels[hit['match_type']]}：'{hit['matched']}' 对应 '{hit['keyword']}'（位置 {hit['start']}-{hit['end']}）")
+  return evidence
+
+_lock = threading.Lock()
+_cached = {}
+
+def get_matcher(path=KEYWORDS_PATH):
+  """获取进程内共享的匹配器，关键词库文件变更后自动重建"""
+  mtime = os.path.getmtime(path)
+  cached = _cached.get(path)
+  if cached and cached[0] == mtime:
+    return cached[1]
+  with _lock:
+    cached = _cached.get(path)
+    if cached and cached[0] == mtime:
+      return cached[1]
+    with open(path, 'rb') as f:
+      raw = f.read()
+    matcher = KeywordMatcher(json.loads(raw.decode('utf-8')), hashlib.sha256(raw).hexdigest()[:12])
+    _cached[path] = (mtime, matcher)
+    return matcher
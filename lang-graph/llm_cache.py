@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from verdict_cache import CACHE_DIR
+
+# 智能体级大模型响应缓存
+# 以 “完整渲染后的提示词 + 模型参数” 为键缓存每次调用的原始响应，各智能体共享。
+# 修改决策提示词或权重只会使决策调用失效，语义分析与非涉密证明的结果仍可复用。
+#
+# 配置（环境变量）：
+#   LLM_CACHE                     设为 0 关闭响应缓存
+#   LLM_CACHE_MEMORY_BYTES        内存 LRU 层容量（字节），默认 64MB
+#   LLM_CACHE_DISK                设为 0 只使用内存层
+#   LLM_CACHE_DISK_MAX_ENTRIES    磁盘层最大条目数，超出后按写入时间淘汰
+#
+# 磁盘层条目数在进程内维护计数，写入时不再 COUNT(*) 全表；多个进程共用同一个数据库时计数会有偏差，
+# 每 RECOUNT_INTERVAL 次写入重新统计一次校正。
+
+RECOUNT_INTERVAL = 1000
+
+def make_key(messages, settings):
+  """根据渲染后的消息与模型参数生成缓存键"""
+  payload = {
+    'messages': [[message.type, message.content] for message in messages],
+    'model': settings['model'],
+    'base_url': settings['base_url'],
+    'temperature': settings['temperature'],
+  }
+  return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+class LLMCache:
+  def __init__(self, path=None, memory_bytes=64 * 1024 * 1024, disk_max_entries=100000):
+    self.memory_bytes = memory_bytes
+    self.disk_max_entries = disk_max_entries
+    self._memory = OrderedDict()
+    self._memory_size = 0
+    self._stats = {}
+    self._lock = threading.Lock()
+    self._conn = None
+    if path:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+      self._conn.execute('PRAGMA journal_mode=WAL')
+      self._conn.execute('''
+      CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        agent TEXT NOT NULL,
+        content TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        created REAL NOT NULL
+      )
+      ''')
+      self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_created ON responses(created)')
+      self._conn.commit()
+    self._disk_entries = 0
+    self._writes = 0
+    self._recount()
+
+  def _recount(self):
+    if self._conn is not None:
+      self._disk_entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+  def _agent_stats(self, agent):
+    stats = self._stats.get(agent)
+    if stats is None:
+      stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'memory_entries': 0, 'memory_bytes': 0}
+      self._stats[agent] = stats
+    return stats
+
+  def get(self, agent, key):
+    with self._lock:
+      stats = self._agent_stats(agent)
+      entry = self._memory.get(key)
+      if entry is not None:
+        self._memory.move_to_end(key)
+        stats['memory_hits'] += 1
+        return entry[1]
+      if self._conn is not None:
+        row = self._conn.execute('SELECT content FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+          stats['disk_hits'] += 1
+          self._remember(agent, key, row[0])
+          return row[0]
+      stats['misses'] += 1
+      return None
+
+  def put(self, agent, key, content):
+    with self._lock:
+      self._remember(agent, key, content)
+      if self._conn is not None:
+        exists = self._conn.execute('SELECT 1 FROM responses WHERE key = ?', (key,)).fetchone() is not None
+        self._conn.execute(
+          'INSERT OR REPLACE INTO responses (key, agent, content, bytes, created) VALUES (?, ?, ?, ?, ?)',
+          (key, agent, content, len(content.encode('utf-8')), time.time()),
+        )
+        self._writes += 1
+        if self._writes % RECOUNT_INTERVAL == 0:
+          self._recount()
+        elif not exists:
+          self._disk_entries += 1
+        if self._disk_entries > self.disk_max_entries:
+          cursor = self._conn.execute(
+            'DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created ASC LIMIT ?)',
+            (self._disk_entries - self.disk_max_entries,),
+          )
+          self._disk_entries -= cursor.rowcount
+        self._conn.commit()
+
+  def _remember(self, agent, key, content):
+    """写入内存 LRU 层，超出容量时淘汰最久未使用的条目"""
+    size = len(content.encode('utf-8'))
+    if size > self.memory_bytes:
+      return
+    if key in self._memory:
+      self._forget(key)
+    self._memory[key] = (agent, content, size)
+    self._memory_size += size
+    stats = self._agent_stats(agent)
+    stats['memory_entries'] += 1
+    stats['memory_bytes'] += size
+    while self._memory_size > self.memory_bytes:
+      self._forget(next(iter(self._memory)))
+
+  def _forget(self, key):
+    agent, _, size = self._memory.pop(key)
+    self._memory_size -= size
+    stats = self._agent_stats(agent)
+    stats['memory_entries'] -= 1
+    stats['memory_bytes'] -= size
+
+  def stats(self):
+    """按智能体返回命中情况以及内存层、磁盘层的条目数与字节数"""
+    with self._lock:
+      result = {agent: dict(stats) for agent, stats in self._stats.items()}
+      if self._conn is not None:
+        rows = self._conn.execute('SELECT agent, COUNT(*), SUM(bytes) FROM responses GROUP BY agent').fetchall()
+        for agent, entries, size in rows:
+          stats = result.setdefault(agent, dict(self._agent_stats(agent)))
+          stats['disk_entries'] = entries
+          stats['disk_bytes'] = size or 0
+    return result
+
+  def clear(self):
+    with self._lock:
+      self._memory.clear()
+      self._memory_size = 0
+      self._stats.clear()
+      if self._conn is not None:
+        self._conn.execute('DELETE FROM responses')
+        self._conn.commit()
+        self._disk_entries = 0
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+  """获取进程内共享的响应缓存，关闭缓存时返回 None"""
+  global _cache
+  if os.getenv('LLM_CACHE', '1') == '0':
+    return None
+  if _cache is None:
+    with _cache_lock:
+      if _cache is None:
+        path = os.path.join(CACHE_DIR, 'llm_responses.db') if os.getenv('LLM_CACHE_DISK', '1') != '0' else None
+        _cache = LLMCache(
+          path,
+          memory_bytes=int(os.getenv('LLM_CACHE_MEMORY_BYTES', str(64 * 1024 * 1024))),
+          disk_max_entries=int(os.getenv('LLM_CACHE_DISK_MAX_ENTRIES', '100000')),
+        )
+  return _cache
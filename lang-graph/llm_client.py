@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+import httpx
+from langchain_openai import ChatOpenAI
+from dotenv import load_dotenv
+import llm_cache
+import rate_limiter
+import resilience
+import telemetry
+from chunker import estimate_tokens
+
+load_dotenv()
+
+# 进程级 LLM 客户端注册表
+# 每个进程只创建一次 ChatOpenAI 与底层 httpx 连接池，所有智能体（含 app.py 的流式决策）共享，
+# 避免每篇文档重复建立 HTTP 客户端与 TLS 握手。
+#
+# 配置（环境变量，智能体专属变量优先于全局变量）：
+#   <AGENT>_MODEL / MODEL                      模型名称，例如 AGENT_SEMANTICS_MODEL
+#   <AGENT>_BASE_URL / LLM_BASE_URL            接口地址
+#   <AGENT>_TIMEOUT / LLM_TIMEOUT              单次请求超时（秒），重试、对冲与熔断见 resilience.py
+#   <AGENT>_API_KEY / SILICONFLOW_API_KEY      API Key
+#   LLM_POOL_SIZE                              每个接口地址的最大连接数
+#   LLM_KEEPALIVE_EXPIRY                       空闲 keep-alive 连接保留时间（秒）
+
+DEFAULT_BASE_URL = 'https://api.siliconflow.cn/v1'
+DEFAULT_TIMEOUT = 60.0
+
+AGENTS = ('agent_keyword', 'agent_semantics', 'agent_non_secret_proof', 'agent_decision')
+
+_lock = threading.Lock()
+_http_clients = {}
+_llms = {}
+# 实际发往上游的调用次数（不含缓存命中），按智能体统计
+_call_counts = {}
+
+def _agent_env(agent_name, key, fallback_key, default=None):
+  value = os.getenv(f'{agent_name.upper()}_{key}')
+  if value:
+    return value
+  value = os.getenv(fallback_key)
+  if value:
+    return value
+  return default
+
+def agent_settings(agent_name):
+  """返回指定智能体的模型配置"""
+  return {
+    'model': _agent_env(agent_name, 'MODEL', 'MODEL'),
+    'base_url': _agent_env(agent_name, 'BASE_URL', 'LLM_BASE_URL', DEFAULT_BASE_URL),
+    'timeout': float(_agent_env(agent_name, 'TIMEOUT', 'LLM_TIMEOUT', DEFAULT_TIMEOUT)),
+    'api_key': _agent_env(agent_name, 'API_KEY', 'SILICONFLOW_API_KEY'),
+    'temperature': 0,
+  }
+
+def get_http_client(base_url):
+  """按接口地址共享 keep-alive 连接池"""
+  with _lock:
+    client = _http_clients.get(base_url)
+    if client is None:
+      pool_size = int(os.getenv('LLM_POOL_SIZE', '20'))
+      limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=float(os.getenv('LLM_KEEPALIVE_EXPIRY', '30')),
+      )
+      client = httpx.Client(limits=limits)
+      _http_clients[base_url] = client
+    return client
+
+def get_llm(agent_name):
+  """获取智能体对应的共享 ChatOpenAI 实例（进程内只构建一次）"""
+  llm = _llms.get(agent_name)
+  if llm is not None:
+    return llm
+  settings = agent_settings(agent_name)
+  http_client = get_http_client(settings['base_url'])
+  with _lock:
+    llm = _llms.get(agent_name)
+    if llm is None:
+      llm = ChatOpenAI(
+        model=settings['model'],
+        base_url=settings['base_url'],
+        api_key=settings['api_key'],
+        temperature=settings['temperature'],
+        timeout=settings['timeout'],
+        # 重试由 resilience 统一处理
+        max_retries=0,
+        http_client=http_client,
+      )
+      _llms[agent_name] = llm
+    return llm
+
+def invoke_llm(agent_name, prompt, variables, parse=None):
+  """
+  渲染提示词并调用智能体对应的大模型，相同提示词与模型参数直接复用缓存
+  parse: 可选的解析函数，返回解析结果；只有解析成功的响应才会写入缓存
+  """
+  messages = prompt.format_messages(**variables)
+  settings = agent_settings(agent_name)
+  with telemetry.span(f'llm.{agent_name}', agent=agent_name, model=settings['model'], stream=False) as span:
+    cache = llm_cache.get_cache()
+    key = None
+    if cache is not None:
+      key = llm_cache.make_key(messages, settings)
+      cached = cache.get(agent_name, key)
+      if cached is not None:
+        _record_cache(span, agent_name, 'hit')
+        return _parse(agent_name, parse, cached)
+    _record_cache(span, agent_name, 'miss' if cache is not None else 'disabled')
+    _count_call(agent_name)
+    start = time.perf_counter()
+    try:
+      response = resilience.call(agent_name, lambda: _limited(agent_name, settings, messages, get_llm(agent_name).invoke))
+    except Exception:
+      telemetry.LLM_ERRORS.inc(agent=agent_name)
+      raise
+    telemetry.LLM_SECONDS.observe(time.perf_counter() - start, agent=agent_name, mode='invoke')
+    content = response.content
+    _record_tokens(span, agent_name, settings, messages, content, getattr(response, 'usage_metadata', None))
+    result = _parse(agent_name, parse, content)
+    if cache is not None:
+      cache.put(agent_name, key, content)
+    return result
+
+def stream_llm(agent_name, prompt, variables, validate=None):
+  """
+  流式调用大模型，逐个返回 token；缓存命中时一次性返回完整响应
+  validate: 可选的校验函数，对完整响应调用；抛出 ValueError（截断或格式错误）时不写入缓存，与 invoke_llm 的 parse 一致
+  """
+  messages = prompt.format_messages(**variables)
+  settings = agent_settings(agent_name)
+  # 生成器会跨越多次调用方的迭代，span 不设为当前 span
+  span = telemetry.start_span(f'llm.{agent_name}', agent=agent_name, model=settings['model'], stream=True)
+  try:
+    cache = llm_cache.get_cache()
+    key = None
+    if cache is not None:
+      key = llm_cache.make_key(messages, settings)
+      cached = cache.get(agent_name, key)
+      if cached is not None:
+        _record_cache(span, agent_name, 'hit')
+        yield cached
+        return
+    _record_cache(span, agent_name, 'miss' if cache is not None else 'disabled')
+    tokens = []
+    usage = None
+    _count_call(agent_name)
+    start = time.perf_counter()
+    try:
+      for chunk in resilience.stream(agent_name, lambda: _limited(agent_name, settings, messages, get_llm(agent_name).stream)):
+        if not tokens:
+          first_token = time.perf_counter() - start
+          telemetry.LLM_FIRST_TOKEN_SECONDS.observe(first_token, agent=agent_name)
+          span.set_attribute('first_token_seconds', first_token)
+        usage = getattr(chunk, 'usage_metadata', None) or usage
+        tokens.append(chunk.content)
+        yield chunk.content
+    except Exception as e:
+      telemetry.LLM_ERRORS.inc(agent=agent_name)
+      span.record_exception(e)
+      raise
+    telemetry.LLM_SECONDS.observe(time.perf_counter() - start, agent=agent_name, mode='stream')
+    content = ''.join(tokens)
+    _record_tokens(span, agent_name, settings, messages, content, usage)
+    if cache is not None and _valid(validate, content):
+      cache.put(agent_name, key, content)
+  finally:
+    span.end()
+
+def _record_cache(span, agent_name, status):
+  telemetry.LLM_REQUESTS.inc(agent=agent_name, cache=status)
+  span.set_attribute('cache', status)
+
+def _prompt_tokens(messages):
+  return sum(estimate_tokens(str(message.content)) for message in messages)
+
+def _limited(agent_name, settings, messages, call):
+  """按模型的共享配额排队后发起一次上游请求（每次重试都重新排队）"""
+  try:
+    # 排队时间不超过本次调用剩余的截止时间
+    rate_limiter.acquire(settings['model'], _prompt_tokens(messages), max_wait=resilience.remaining())
+  except rate_limiter.RateLimitTimeout as e:
+    raise resilience.LLMUnavailableError(agent_name, 'rate_limit', f': {e}') from e
+  return call(messages)
+
+def _record_tokens(span, agent_name, settings, messages, content, usage):
+  """优先使用接口返回的 token 用量，没有时按字符粗略估算；同时按实际用量结算限流配额"""
+  estimated = rate_limiter.estimate(settings['model'], _prompt_tokens(messages))
+  if usage:
+    prompt_tokens = usage.get('input_tokens', 0)
+    completion_tokens = usage.get('output_tokens', 0)
+  else:
+    prompt_tokens = _prompt_tokens(messages)
+    completion_tokens = estimate_tokens(content)
+  rate_limiter.settle(settings['model'], estimated, prompt_tokens + completion_tokens)
+  telemetry.LLM_TOKENS.inc(prompt_tokens, agent=agent_name, kind='prompt')
+  telemetry.LLM_TOKENS.inc(completion_tokens, agent=agent_name, kind='completion')
+  span.set_attributes(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, usage_reported=bool(usage))
+
+def _parse(agent_name, parse, content):
+  if parse is None:
+    return content
+  try:
+    return parse(content)
+  except ValueError:
+    # json.JSONDecodeError 与 JSONExtractError 都是 ValueError
+    telemetry.PARSE_FAILURES.inc(agent=agent_name)
+    telemetry.add_event('parse_failure', agent=agent_name)
+    raise
+
+def _valid(validate, content):
+  """流式响应能否写入缓存（解析失败由调用方计数）"""
+  if validate is None:
+    return True
+  try:
+    validate(content)
+  except ValueError:
+    return False
+  return True
+
+def _count_call(agent_name):
+  with _lock:
+    _call_counts[agent_name] = _call_counts.get(agent_name, 0) + 1
+
+def call_counts():
+  """返回各智能体实际发往上游的调用次数"""
+  with _lock:
+    return dict(_call_counts)
+
+def close():
+  """关闭所有连接池（进程退出或测试时调用）"""
+  with _lock:
+    for client in _http_clients.values():
+      client.close()
+    _http_clients.clear()
+    _llms.clear()
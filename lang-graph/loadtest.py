@@ -0,0 +1,317 @@
+import argparse
+import itertools
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from colorama import Fore,Back,Style
+from evaluate import iter_db, percentiles
+
+# /check 接口压测：N 个并发 SSE 客户端循环提交测试库中的文档，统计首个事件时间、
+# 出结论时间（verdict 事件）与整条流的耗时分位数、吞吐，以及服务端进程（含子进程）的 CPU 与 RSS，
+# 结果写入 JSON 报告便于对比不同配置。
+#
+# 用法：
+#   # 压测已启动的服务（--server-pid 用于采集服务端 CPU/RSS）
+#   python lang-graph/loadtest.py --url http://127.0.0.1:5001 --clients 16 --requests 200 --server-pid 12345
+#   # 启动本地模拟大模型与 app.py 后压测，完全离线
+#   python lang-graph/loadtest.py --with-mock --clients 32 --duration 60 --output loadtest.json
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def process_tree(pid):
+  """返回进程及其全部子孙进程的 pid（Flask debug 模式下实际服务运行在重载器的子进程中）"""
+  pids = [pid]
+  index = 0
+  while index < len(pids):
+    current = pids[index]
+    index += 1
+    try:
+      for task in os.listdir(f'/proc/{current}/task'):
+        with open(f'/proc/{current}/task/{task}/children') as f:
+          pids.extend(int(child) for child in f.read().split())
+    except OSError:
+      continue
+  return pids
+
+def read_usage(pid):
+  """读取进程树的累计 CPU 秒数与 RSS 字节数"""
+  cpu = 0.0
+  rss = 0
+  for current in process_tree(pid):
+    try:
+      with open(f'/proc/{current}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+      continue
+    # 去掉 "pid (comm)" 后，utime/stime 为第 12/13 项，rss 为第 22 项
+    cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    rss += int(fields[21]) * PAGE_SIZE
+  return cpu, rss
+
+class ResourceSampler(threading.Thread):
+  """后台定期采样服务端进程的 CPU 与 RSS"""
+
+  def __init__(self, pid, interval=0.5):
+    super().__init__(daemon=True)
+    self.pid = pid
+    self.interval = interval
+    self.samples = []
+    self._done = threading.Event()
+
+  def run(self):
+    while not self._done.is_set():
+      cpu, rss = read_usage(self.pid)
+      self.samples.append((time.perf_counter(), cpu, rss))
+      self._done.wait(self.interval)
+
+  def stop(self):
+    self._done.set()
+    self.join()
+    cpu, rss = read_usage(self.pid)
+    self.samples.append((time.perf_counter(), cpu, rss))
+
+  def summary(self):
+    if len(self.samples) < 2:
+      return {}
+    start, end = self.samples[0], self.samples[-1]
+    elapsed = end[0] - start[0]
+    cpu_seconds = end[1] - start[1]
+    return {
+      'pid': self.pid,
+      'cpu_seconds': cpu_seconds,
+      'cpu_percent': cpu_seconds / elapsed * 100 if elapsed else 0.0,
+      'rss_max_mb': max(sample[2] for sample in self.samples) / 1024 / 1024,
+      'rss_end_mb': end[2] / 1024 / 1024,
+    }
+
+def check_once(client, url, document):
+  """提交一篇文档并读取完整的 SSE 流，返回各阶段耗时"""
+  start = time.perf_counter()
+  record = {'id': document['id']}
+  first_event = None
+  verdict = None
+  events = 0
+  final = None
+  try:
+    with client.stream('POST', f'{url}/check', json={
+      'doc_title': document['doc_title'],
+      'doc_content': document['doc_content'],
+    }) as response:
+      response.raise_for_status()
+      for line in response.iter_lines():
+        if not line.startswith('data: '):
+          continue
+        now = time.perf_counter() - start
+        events += 1
+        if first_event is None:
+          first_event = now
+        payload = json.loads(line[6:])
+        if payload.get('type') == 'verdict' and verdict is None:
+          verdict = now
+        elif payload.get('type') == 'final':
+          final = payload
+          if verdict is None:
+            verdict = now
+  except (httpx.HTTPError, ValueError) as e:
+    record.update({'error': str(e), 'total': time.perf_counter() - start})
+    return record
+  record.update({
+    'first_event': first_event,
+    'verdict': verdict,
+    'total': time.perf_counter() - start,
+    'events': events,
+    'cached': bool(final and final.get('cached')),
+  })
+  if final is None:
+    record['error'] = '流在 final 事件之前结束'
+  return record
+
+def run(url, documents, clients=8, requests=None, duration=None, timeout=300.0):
+  """并发压测：达到请求数或持续时间后停止（都未指定时每篇文档提交一次）"""
+  if requests is None and duration is None:
+    requests = len(documents)
+  source = itertools.cycle(documents)
+  lock = threading.Lock()
+  issued = [0]
+  deadline = time.perf_counter() + duration if duration else None
+
+  def next_document():
+    with lock:
+      if requests is not None and issued[0] >= requests:
+        return None
+      if deadline is not None and time.perf_counter() >= deadline:
+        return None
+      issued[0] += 1
+      return next(source)
+
+  limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+  with httpx.Client(timeout=timeout, limits=limits) as client:
+
+    def worker():
+      records = []
+      while True:
+        document = next_document()
+        if document is None:
+          return records
+        records.append(check_once(client, url, document))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+      futures = [executor.submit(worker) for _ in range(clients)]
+      records = [record for future in futures for record in future.result()]
+    wall_seconds = time.perf_counter() - start
+  return records, wall_seconds
+
+def summarize(records, wall_seconds):
+  ok = [record for record in records if 'error' not in record]
+  return {
+    'requests': len(records),
+    'errors': len(records) - len(ok),
+    'cached': sum(1 for record in ok if record['cached']),
+    'wall_seconds': wall_seconds,
+    'requests_per_second': len(ok) / wall_seconds if wall_seconds else 0.0,
+    'latency': {
+      'first_event': percentiles([record['first_event'] for record in ok]),
+      'verdict': percentiles([record['verdict'] for record in ok]),
+      'total': percentiles([record['total'] for record in ok]),
+    },
+    'events_per_request': sum(record['events'] for record in ok) / len(ok) if ok else 0.0,
+  }
+
+def wait_for_port(host, port, timeout=60.0):
+  deadline = time.time() + timeout
+  while time.time() < deadline:
+    try:
+      with socket.create_connection((host, port), timeout=1):
+        return True
+    except OSError:
+      time.sleep(0.2)
+  return False
+
+def start_mock_stack(app_port, mock_port, mock_args):
+  """在本进程线程中启动模拟大模型，并以子进程启动 app.py（关闭判定缓存与响应缓存）"""
+  from mock_llm import MockConfig, create_server
+  server = create_server('127.0.0.1', mock_port, MockConfig(**mock_args))
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  env = dict(os.environ)
+  env.update({
+    'LLM_BASE_URL': f'http://127.0.0.1:{mock_port}/v1',
+    'SILICONFLOW_API_KEY': env.get('SILICONFLOW_API_KEY') or 'mock',
+    'MODEL': env.get('MODEL') or 'mock',
+    'VERDICT_CACHE': '0',
+    'LLM_CACHE': '0',
+    'APP_PORT': str(app_port),
+    'APP_DEBUG': '0',
+  })
+  process = subprocess.Popen([sys.executable, os.path.join(CURRENT_DIR, 'app.py')], env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+  if not wait_for_port('127.0.0.1', app_port):
+    stop_process(process)
+    raise RuntimeError('app.py 未能在 60 秒内启动')
+  return server, process
+
+def stop_process(process):
+  """结束 app.py 及其子进程"""
+  try:
+    os.killpg(process.pid, signal.SIGTERM)
+  except ProcessLookupError:
+    pass
+  process.wait()
+
+def print_summary(summary, server):
+  print(f'{Fore.GREEN}{Style.BRIGHT}请求: {summary["requests"]}  失败: {summary["errors"]}  吞吐: {summary["requests_per_second"]:.2f} 次/秒{Style.RESET_ALL}')
+  for name, label in (('first_event', '首个事件'), ('verdict', '出结论'), ('total', '整条流')):
+    stats = summary['latency'][name]
+    if stats:
+      print(f'  {label}: p50={stats["p50"]:.3f}s p95={stats["p95"]:.3f}s p99={stats["p99"]:.3f}s max={stats["max"]:.3f}s')
+  if server:
+    print(f'{Fore.CYAN}服务端 CPU: {server["cpu_percent"]:.1f}%  RSS 峰值: {server["rss_max_mb"]:.1f} MB{Style.RESET_ALL}')
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='/check 接口并发压测')
+  parser.add_argument('--url', default='http://127.0.0.1:5001', help='服务地址')
+  parser.add_argument('--db', action='append', default=[], help='测试数据库路径，可重复指定（默认全部 test_documents*.db）')
+  parser.add_argument('--clients', type=int, default=8, help='并发客户端数')
+  parser.add_argument('--requests', type=int, help='总请求数')
+  parser.add_argument('--duration', type=float, help='持续时间（秒）')
+  parser.add_argument('--timeout', type=float, default=300.0, help='单个请求超时（秒）')
+  parser.add_argument('--server-pid', type=int, help='服务端进程 pid，用于采集 CPU/RSS')
+  parser.add_argument('--with-mock', action='store_true', help='启动本地模拟大模型与 app.py 后压测')
+  parser.add_argument('--app-port', type=int, default=5011, help='--with-mock 时 app.py 监听的端口')
+  parser.add_argument('--mock-port', type=int, default=8900)
+  parser.add_argument('--mock-latency', default='lognormal:600,0.5', help='模拟大模型首 token 延迟分布')
+  parser.add_argument('--mock-token-rate', type=float, default=50.0)
+  parser.add_argument('--mock-error-rate', type=float, default=0.0)
+  parser.add_argument('--output', help='JSON 报告输出路径')
+  args = parser.parse_args(argv)
+
+  if not args.db:
+    args.db = sorted(
+      os.path.join(CURRENT_DIR, name) for name in os.listdir(CURRENT_DIR)
+      if name.startswith('test_documents') and name.endswith('.db')
+    )
+  documents = [document for path in args.db for document in iter_db(path)]
+  if not documents:
+    parser.error('没有可用的测试文档')
+
+  mock_server = None
+  app_process = None
+  url = args.url
+  server_pid = args.server_pid
+  if args.with_mock:
+    mock_server, app_process = start_mock_stack(args.app_port, args.mock_port, {
+      'latency': args.mock_latency,
+      'token_rate': args.mock_token_rate,
+      'error_rate': args.mock_error_rate,
+    })
+    url = f'http://127.0.0.1:{args.app_port}'
+    server_pid = app_process.pid
+
+  sampler = ResourceSampler(server_pid) if server_pid else None
+  try:
+    if sampler:
+      sampler.start()
+    records, wall_seconds = run(url, documents, args.clients, args.requests, args.duration, args.timeout)
+  finally:
+    if sampler:
+      sampler.stop()
+    if app_process:
+      stop_process(app_process)
+    if mock_server:
+      mock_server.shutdown()
+
+  report = {
+    'summary': summarize(records, wall_seconds),
+    'server': sampler.summary() if sampler else {},
+    'mock_llm': mock_server.RequestHandlerClass.config.stats if mock_server else None,
+    'config': {
+      'url': url,
+      'db': args.db,
+      'clients': args.clients,
+      'requests': args.requests,
+      'duration': args.duration,
+      'with_mock': args.with_mock,
+      'mock_latency': args.mock_latency if args.with_mock else None,
+      'mock_token_rate': args.mock_token_rate if args.with_mock else None,
+      'mock_error_rate': args.mock_error_rate if args.with_mock else None,
+    },
+    'requests': records,
+  }
+  print_summary(report['summary'], report['server'])
+  if args.output:
+    with open(args.output, 'w', encoding='utf-8') as f:
+      json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'报告已写入: {args.output}')
+  return report
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
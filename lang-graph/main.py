@@ -1,15 +1,29 @@
-from typing import TypedDict
+from typing import TypedDict, Annotated
 from agents import agent_keyword, agent_semantics, agent_decision, agent_non_secret_proof
 from langgraph.graph import StateGraph, END
 from colorama import Fore,Back,Style
-import sqlite3
 import os
+import time
+import operator
+import verdict_cache
+import near_dup
+import triage
+import policy
+import telemetry
+
+# 并行模式：关键词路由后语义分析与非涉密证明同时执行，在决策节点汇合（PARALLEL_AGENTS=0 时退回串行）
+PARALLEL_AGENTS = os.getenv('PARALLEL_AGENTS', '1') != '0'
+
+def keep_last(left, right):
+  """并行分支同一步写入 current_node 时保留最后一个值"""
+  return right
 
 class State(TypedDict):
   doc_title: str # 文档标题
   doc_content: str # 文档内容
+  doc_metadata: dict # 文档来源元数据（文件路径、格式、页数、编码等，见 ingest.py）
   keywords_list: list # 关键词列表
-  current_node: str # 当前节点（用于路由）
+  current_node: Annotated[str, keep_last] # 当前节点（用于路由）
   agent_keyword_result: bool # 关键词检测结果
   agent_keyword_detail: str # 关键词检测详情
   agent_keyword_confidence: int # 关键词检测置信度
@@ -22,6 +36,13 @@ class State(TypedDict):
   result: bool # 检测结果
   result_detail: str # 检测结果详情
   result_confidence: int # 检测结果置信度
+  node_timings: Annotated[list, operator.add] # 各节点耗时（并行分支合并）
+  fired_policies: Annotated[list, operator.add] # 本次运行触发的路由策略
+  skipped_nodes: Annotated[list, operator.add] # 被策略跳过的节点
+  degraded_agents: Annotated[list, operator.add] # 大模型不可用、降级处理的智能体
+  semantics_focus: str # 近似文档只需分析的新增段落（为空时分析全文，见 near_dup.py）
+  near_duplicate: dict # 近似文档匹配信息（mode、of、similarity 等）
+  triage: dict # 本地分诊结果（涉密概率、模型版本，见 triage.py）
 
 # 开始节点
 def start_node(state:State):
@@ -29,51 +50,94 @@ def start_node(state:State):
   print(f'\n{Fore.GREEN}{Style.BRIGHT}开始检测文件: {Fore.YELLOW}{Style.BRIGHT}{state["doc_title"]}{Style.RESET_ALL}\n')
   return state
 
-# 路由函数：根据关键词检测结果决定下一步
+# 路由函数：根据已触发的策略决定下一步
 def route_after_keyword(state:State):
   """
-  如果关键词检测到涉密内容，直接进入决策节点
-  否则，继续语义检测
+  策略跳过语义检测与非涉密证明时（例如关键词快速通道），直接进入决策节点
+  否则，继续语义检测（并行模式下同时执行非涉密证明）；只被跳过其中一个时该节点以空操作执行，保证汇合边完整
   """
-  current_node = state.get('current_node', 'agent_semantics')
+  if policy.is_skipped('agent_semantics', state) and policy.is_skipped('agent_non_secret_proof', state):
+    current_node = 'agent_decision'
+  elif PARALLEL_AGENTS:
+    current_node = ['agent_semantics', 'agent_non_secret_proof']
+  else:
+    current_node = 'agent_semantics'
   print(f'{Fore.BLUE}路由判断: 下一个节点为 {current_node}{Style.RESET_ALL}')
+  route = '+'.join(current_node) if isinstance(current_node, list) else current_node
+  telemetry.ROUTE_DECISIONS.inc(next=route)
+  telemetry.add_event('route', next=route)
   return current_node
 
+def timed(node_name, node):
+  """包装节点函数，把节点耗时写入 node_timings 与节点 span / 指标（被策略跳过的节点不计耗时）"""
+  def wrapper(state):
+    with telemetry.span(f'node.{node_name}', node=node_name) as span:
+      start = time.perf_counter()
+      try:
+        output = dict(node(state))
+      except Exception:
+        telemetry.NODE_ERRORS.inc(node=node_name)
+        raise
+      seconds = time.perf_counter() - start
+      if node_name in output.get('skipped_nodes', []):
+        span.set_attribute('skipped', True)
+        return output
+      output['node_timings'] = [{'node': node_name, 'seconds': seconds}]
+      telemetry.NODE_SECONDS.observe(seconds, node=node_name)
+      if output.get('fired_policies'):
+        span.set_attribute('fired_policies', output['fired_policies'])
+      return output
+  return wrapper
+
+# 工作流节点：策略跳过、耗时与追踪的包装由工作流图和 app.py 的流式接口共用
+nodes = {
+  'agent_keyword': timed('agent_keyword', policy.guard('agent_keyword', agent_keyword)),
+  'agent_semantics': timed('agent_semantics', policy.guard('agent_semantics', agent_semantics)),
+  'agent_non_secret_proof': timed('agent_non_secret_proof', policy.guard('agent_non_secret_proof', agent_non_secret_proof)),
+  'agent_decision': timed('agent_decision', agent_decision),
+}
+
 # 工作流
 workflow = StateGraph(State)
 
-workflow.add_node('start_node',start_node)
-workflow.add_node('agent_semantics',agent_semantics)
-workflow.add_node('agent_keyword',agent_keyword)
-workflow.add_node('agent_non_secret_proof',agent_non_secret_proof)
-workflow.add_node('agent_decision',agent_decision)
+workflow.add_node('start_node',timed('start_node', start_node))
+workflow.add_node('agent_semantics',nodes['agent_semantics'])
+workflow.add_node('agent_keyword',nodes['agent_keyword'])
+workflow.add_node('agent_non_secret_proof',nodes['agent_non_secret_proof'])
+workflow.add_node('agent_decision',nodes['agent_decision'])
 # 入口
 workflow.set_entry_point('start_node')
 
-# 第一步：从开始节点到关键词检测和非涉密判断（并行）
+# 第一步：从开始节点到关键词检测
 workflow.add_edge('start_node', 'agent_keyword')
-# workflow.add_edge('start_node', 'agent_non_secret_proof')
 
 # 第二步：关键词检测后的条件路由
 workflow.add_conditional_edges(
   'agent_keyword',
   route_after_keyword,
   {
-    'agent_decision': 'agent_decision',  # 如果检测到关键词，直接决策
-    'agent_semantics': 'agent_semantics'  # 否则继续语义检测
+    'agent_decision': 'agent_decision',  # 策略跳过后续智能体时直接决策
+    'agent_semantics': 'agent_semantics',  # 否则继续语义检测
+    'agent_non_secret_proof': 'agent_non_secret_proof',  # 并行模式下同时进行非涉密证明
   }
 )
 
-workflow.add_edge('agent_semantics', 'agent_non_secret_proof')
-workflow.add_edge('agent_non_secret_proof', 'agent_decision')
+# 第三步：语义检测与非涉密证明汇合到决策节点
+if PARALLEL_AGENTS:
+  workflow.add_edge(['agent_semantics', 'agent_non_secret_proof'], 'agent_decision')
+else:
+  workflow.add_edge('agent_semantics', 'agent_non_secret_proof')
+  workflow.add_edge('agent_non_secret_proof', 'agent_decision')
 workflow.add_edge('agent_decision', END)
 
 app = workflow.compile()
 
-def invoke(doc_title, doc_content):
-  input_state = {
+def initial_state(doc_title, doc_content, doc_metadata=None):
+  """构造工作流输入状态"""
+  return {
     'doc_title': doc_title,
     'doc_content': doc_content,
+    'doc_metadata': doc_metadata or {},
     'keywords_list': [],
     'current_node': 'start_node',
     'agent_keyword_result': False,
@@ -88,29 +152,74 @@ def invoke(doc_title, doc_content):
     'result': False,
     'result_detail': '',
     'result_confidence': 0,
+    'node_timings': [],
+    'fired_policies': [],
+    'skipped_nodes': [],
+    'degraded_agents': [],
+    'semantics_focus': '',
+    'near_duplicate': {},
+    'triage': {},
   }
-  final_state = app.invoke(input_state)
+
+def invoke(doc_title, doc_content, on_progress=None, doc_metadata=None):
+  """
+  执行工作流并返回最终状态
+  on_progress(node_name, node_output) 在每个节点结束后调用（后台任务用于记录进度），抛出异常会中止本次运行
+  doc_metadata 为文档来源元数据（ingest.py 抽取的文件信息），不影响判定与缓存键
+  """
+  start = time.perf_counter()
+  # 相同文档直接返回缓存的最终状态
+  cache_key, cached = verdict_cache.lookup(doc_title, doc_content)
+  if cached is not None:
+    telemetry.DOCUMENT_SECONDS.observe(time.perf_counter() - start, entry='invoke', outcome='cache')
+    return cached['state']
+  # 已判定过的近似版本：直接复用判定，或只对新增段落做语义分析
+  near = near_dup.check(doc_title, doc_content)
+  if near is not None and near['mode'] == 'reuse':
+    telemetry.DOCUMENT_SECONDS.observe(time.perf_counter() - start, entry='invoke', outcome='near_dup')
+    return near['state']
+  # 本地分诊模型有把握的文档直接判定，不调用大模型
+  verdict, triage_info = triage.route(doc_title, doc_content)
+  if verdict is not None:
+    telemetry.DOCUMENT_SECONDS.observe(time.perf_counter() - start, entry='invoke', outcome='triage')
+    return {**initial_state(doc_title, doc_content, doc_metadata), **verdict}
+
+  with telemetry.span('workflow.invoke', doc_title=doc_title, doc_length=len(doc_content or '')) as span:
+    final_state = {}
+    events = [{'type': 'progress', 'node': 'start_node', 'data': {}}]
+    # 同时收集节点输出（用于流式接口回放）与最终状态
+    input_state = initial_state(doc_title, doc_content, doc_metadata)
+    if near is not None:
+      input_state.update(near['fields'])
+    if triage_info is not None:
+      input_state['triage'] = triage_info
+    for mode, chunk in app.stream(input_state, stream_mode=['updates', 'values']):
+      if mode == 'values':
+        final_state = chunk
+      else:
+        for node_name, node_output in chunk.items():
+          if node_name == 'start_node':
+            continue
+          if node_name == 'agent_decision':
+            events.append({'type': 'progress', 'node': 'agent_decision', 'data': {'status': 'started'}})
+            events.append({'type': 'verdict', 'node': 'agent_decision', 'data': {'result': node_output.get('result'), 'result_confidence': node_output.get('result_confidence')}})
+            events.append({'type': 'stream_token', 'node': 'agent_decision', 'token': node_output.get('result_detail', '')})
+          events.append({'type': 'progress', 'node': node_name, 'data': node_output})
+          if node_output.get('fired_policies'):
+            events.append({'type': 'policy', 'node': node_name, 'data': {'fired': node_output['fired_policies']}})
+          if on_progress is not None:
+            on_progress(node_name, node_output)
+    span.set_attributes(result=final_state.get('result'), fired_policies=final_state.get('fired_policies', []))
+  telemetry.DOCUMENT_SECONDS.observe(time.perf_counter() - start, entry='invoke', outcome='workflow')
+  verdict_cache.store(cache_key, final_state, events)
+  # 只分析了部分段落的结果不作为后续近似匹配的基准
+  if not final_state.get('semantics_focus'):
+    near_dup.remember(doc_title, doc_content, final_state)
   return final_state
 
 def invoke_stream(doc_title, doc_content):
   """流式执行工作流，打印过程并返回最终状态"""
-  input_state = {
-    'doc_title': doc_title,
-    'doc_content': doc_content,
-    'keywords_list': [],
-    'current_node': 'start_node',
-    'agent_keyword_result': False,
-    'agent_keyword_detail': '',
-    'agent_keyword_confidence': 0,
-    'agent_semantics_result': False,
-    'agent_semantics_detail': '',
-    'agent_non_secret_proof_result': False,
-    'agent_non_secret_proof_detail': '',
-    'agent_non_secret_proof_confidence': 0,
-    'result': False,
-    'result_detail': '',
-    'result_confidence': 0,
-  }
+  input_state = initial_state(doc_title, doc_content)
   
   # 收集最终状态
   final_state = {}
@@ -128,59 +237,11 @@ def invoke_stream(doc_title, doc_content):
   return final_state
 
 def test():
-  # 读取测试数据库
+  """并行评测 test_documents_3.db（完整参数见 evaluate.py）"""
+  import evaluate
+  # 经过 evaluate.main，与命令行评测一样默认关闭判定缓存与近似文档复用，重复运行时测量的仍是真实耗时
   current_dir = os.path.dirname(os.path.abspath(__file__))
-  conn = sqlite3.connect(os.path.join(current_dir, 'test_documents_3.db'))
-  cursor = conn.cursor()
-  cursor.execute('SELECT * FROM test')
-  test_data = cursor.fetchall()
-  conn.close()
-
-  result_arr = []
-  test_arr = []
-
-  for data in test_data:
-    input_state = {
-      'doc_title': data[1],
-      'doc_content': data[2],
-      'agent_keyword_result': False,
-      'agent_keyword_detail': '',
-      'agent_keyword_confidence': 0,
-      'agent_semantics_result': False,
-      'agent_semantics_detail': '',
-      'agent_semantics_confidence': 0,
-      'agent_non_secret_proof_result': False,
-      'agent_non_secret_proof_detail': '',
-      'agent_non_secret_proof_confidence': 0,
-      'result': False,
-      'result_detail': '',
-      'result_confidence': 0,
-      'current_node': 'start_node'
-    }
-
-    final_state = app.invoke(input_state)
-    result_arr.append(final_state['result'].__str__())
-    print(f'\n{Fore.BLUE}{Style.BRIGHT}最终结果:{Style.RESET_ALL}',flush=True)
-    print(f'{Fore.CYAN}{Style.BRIGHT}决策评审结果:{Style.RESET_ALL}{Fore.YELLOW}{final_state["result"]}{Style.RESET_ALL}',flush=True)
-    print(f'{Fore.CYAN}{Style.BRIGHT}检测结果置信度:{Style.RESET_ALL}{Fore.YELLOW}{final_state["result_confidence"]}{Style.RESET_ALL}',flush=True)
-    print(f'{Fore.CYAN}{Style.BRIGHT}检测结果详情:{Style.RESET_ALL}{Fore.YELLOW}{final_state["result_detail"]}{Style.RESET_ALL}',flush=True)
-    print('-' * 20)
-    print('\n')
-  print(result_arr)
-
-
-  for test in test_data:
-    if test[3] == 1:
-      test_arr.append('True')
-    else:
-      test_arr.append('False')
-  print(test_arr)
-
-  successIndex = 0
-  for index, test_a in enumerate(test_arr):
-    if test_a == result_arr[index]:
-      successIndex += 1
-  print(f'{Fore.GREEN}{Style.BRIGHT}准确率:{Style.RESET_ALL}{Fore.YELLOW}{successIndex / len(test_arr) * 100}%{Style.RESET_ALL}')
+  return evaluate.main(['--db', os.path.join(current_dir, 'test_documents_3.db')])
 
 # test()
 # final_state = app.invoke({'doc_title':'a','doc_content':'为深入推进“放管服”改革，切实提升群众和企业的办事体验，我局拟对政务服务大厅的窗口工作效率进行全面优化。现向社会公开征求意见，重点围绕简化办事流程、优化线上预约系统、延长服务时间等具体措施。公众可通过官方网站或政务邮箱提交意见和建议。本通知旨在广泛听取民意，所有反馈意见将在汇总整理后，适时向社会公开。本次征求意见截止日期为下个月 15 日，欢迎社会各界积极参与。'})
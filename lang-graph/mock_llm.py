@@ -0,0 +1,285 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 本地 OpenAI 兼容的模拟大模型服务：实现 /v1/chat/completions（流式与非流式），
+# 按提示词识别是哪个智能体并返回符合其输出格式的 JSON，可配置首 token 延迟分布、token 速率与错误注入，
+# 用于在无网络、不消耗额度的情况下压测 /check 与工作流的吞吐、并发与尾延迟。
+#
+# 用法：
+#   python lang-graph/mock_llm.py --port 8900 --latency lognormal:800,0.5 --token-rate 40
+#   LLM_BASE_URL=http://127.0.0.1:8900/v1 SILICONFLOW_API_KEY=mock MODEL=mock python lang-graph/app.py
+#
+# 延迟分布写法（毫秒）：fixed:500 / uniform:200,1500 / exp:600 / lognormal:中位数,sigma
+# 错误注入：--error-rate 返回 --error-status 状态码，--malformed-rate 返回无法解析的内容，
+#           --hang-rate 挂起 --hang-seconds 秒（用于验证客户端超时）
+# GET /stats 返回各智能体的请求数与注入的错误数，POST /stats/reset 清零。
+
+# 系统提示词中用于识别智能体的角色设定（最具体的决策模块排在最前）
+# 提示词中会插入文档正文与其他智能体的证据，其中可能出现别的智能体的特征文本，因此只在系统消息中查找，
+# 并取最先出现的角色设定：角色设定总是写在插入的数据之前。
+AGENT_MARKERS = (
+  ('agent_decision', '你是一名高权限的信息安全决策模块'),
+  ('agent_semantics', '你是一名顶尖的信息安全与保密分析专家'),
+  ('agent_non_secret_proof', '你是一名文件解密与公开审核专员'),
+  ('agent_keyword', '你是一个高精准度的文本分析专家'),
+)
+
+_TOKEN = re.compile(r'[一-鿿]{1,2}|\s+|[^\s一-鿿]{1,4}')
+
+def parse_distribution(spec):
+  """把 'lognormal:800,0.5' 之类的写法转换为返回秒数的采样函数"""
+  kind, _, raw = spec.partition(':')
+  params = [float(value) for value in raw.split(',') if value]
+  if kind == 'fixed':
+    return lambda rng: params[0] / 1000
+  if kind == 'uniform':
+    return lambda rng: rng.uniform(params[0], params[1]) / 1000
+  if kind == 'exp':
+    return lambda rng: rng.expovariate(1 / params[0]) / 1000 if params[0] else 0.0
+  if kind == 'lognormal':
+    median, sigma = params[0], params[1] if len(params) > 1 else 0.5
+    return lambda rng: rng.lognormvariate(0, sigma) * median / 1000
+  raise ValueError(f'未知的延迟分布: {spec}')
+
+def detect_agent(messages):
+  """返回 (智能体名称, 全部消息文本)；没有系统消息时退回在全部消息中查找"""
+  text = '\n'.join(str(message.get('content', '')) for message in messages)
+  system = '\n'.join(str(message.get('content', '')) for message in messages if message.get('role') == 'system') or text
+  found = [(system.find(marker), order, agent_name) for order, (agent_name, marker) in enumerate(AGENT_MARKERS) if marker in system]
+  if not found:
+    return 'unknown', text
+  return min(found)[2], text
+
+def agent_response(agent_name, rng, secret_rate=0.3):
+  """生成符合各智能体输出格式的响应，以 secret_rate 的概率判定为涉密"""
+  secret = rng.random() < secret_rate
+  confidence = rng.randint(60, 99)
+  if agent_name == 'agent_keyword':
+    payload = {
+      'associated': secret,
+      'confidence': confidence,
+      'evidence': ['模拟响应：关键词关联分析'],
+    }
+  elif agent_name == 'agent_semantics':
+    payload = {'result': secret, 'confidence': confidence, 'evidence': ['模拟响应：语义分析']}
+  elif agent_name == 'agent_non_secret_proof':
+    payload = {'result': not secret, 'confidence': confidence, 'evidence': ['模拟响应：非涉密证明']}
+  elif agent_name == 'agent_decision':
+    verdict = '涉密' if secret else '非涉密'
+    payload = {
+      'result': secret,
+      'result_confidence': confidence,
+      'result_detail': f'最终裁决：{verdict}\n决策路径与依据：\n判定依据：模拟响应',
+    }
+  else:
+    payload = {'result': secret, 'confidence': confidence}
+  return json.dumps(payload, ensure_ascii=False)
+
+def tokenize(content):
+  """粗略模拟 token 切分：中文 1-2 字一块，其他字符 1-4 个一块"""
+  return _TOKEN.findall(content) or ['']
+
+class MockConfig:
+  def __init__(self, latency='lognormal:600,0.5', agent_latency=None, token_rate=50.0, secret_rate=0.3,
+               error_rate=0.0, error_status=500, malformed_rate=0.0, hang_rate=0.0, hang_seconds=120.0, seed=None):
+    self.latency = parse_distribution(latency)
+    self.agent_latency = {agent: parse_distribution(spec) for agent, spec in (agent_latency or {}).items()}
+    self.token_rate = token_rate
+    self.secret_rate = secret_rate
+    self.error_rate = error_rate
+    self.error_status = error_status
+    self.malformed_rate = malformed_rate
+    self.hang_rate = hang_rate
+    self.hang_seconds = hang_seconds
+    self.seed = seed
+    self._lock = threading.Lock()
+    self.stats = {}
+
+  def count(self, agent_name, key):
+    with self._lock:
+      counts = self.stats.setdefault(agent_name, {'requests': 0, 'errors': 0, 'malformed': 0, 'hangs': 0})
+      counts[key] += 1
+
+  def first_token_delay(self, agent_name, rng):
+    return self.agent_latency.get(agent_name, self.latency)(rng)
+
+  def token_interval(self):
+    return 1 / self.token_rate if self.token_rate > 0 else 0.0
+
+class MockHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  config = None
+
+  def log_message(self, format, *args):
+    pass
+
+  def _send_json(self, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    if self.path.rstrip('/').endswith('/models'):
+      self._send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model', 'owned_by': 'mock'}]})
+    elif self.path.rstrip('/') == '/stats':
+      self._send_json(200, self.config.stats)
+    else:
+      self._send_json(404, {'error': {'message': 'not found'}})
+
+  def do_POST(self):
+    length = int(self.headers.get('Content-Length') or 0)
+    raw = self.rfile.read(length) if length else b''
+    if self.path.rstrip('/') == '/stats/reset':
+      self.config.stats.clear()
+      self._send_json(200, {})
+      return
+    if not self.path.rstrip('/').endswith('/chat/completions'):
+      self._send_json(404, {'error': {'message': 'not found'}})
+      return
+    try:
+      request = json.loads(raw or b'{}')
+    except ValueError:
+      self._send_json(400, {'error': {'message': 'invalid json'}})
+      return
+    self.complete(request)
+
+  def complete(self, request):
+    config = self.config
+    agent_name, text = detect_agent(request.get('messages', []))
+    # 未指定 seed 时按提示词内容取随机数，相同输入得到相同结论
+    seed = config.seed if config.seed is not None else hashlib.sha256(text.encode('utf-8')).hexdigest()
+    rng = random.Random(seed)
+    fault = random.random()
+    config.count(agent_name, 'requests')
+    time.sleep(config.first_token_delay(agent_name, random))
+
+    if fault < config.error_rate:
+      config.count(agent_name, 'errors')
+      self._send_json(config.error_status, {'error': {'message': 'injected error', 'type': 'mock_error'}})
+      return
+    fault -= config.error_rate
+    if fault < config.hang_rate:
+      config.count(agent_name, 'hangs')
+      time.sleep(config.hang_seconds)
+      self._send_json(504, {'error': {'message': 'injected hang', 'type': 'mock_error'}})
+      return
+    fault -= config.hang_rate
+
+    content = agent_response(agent_name, rng, config.secret_rate)
+    if fault < config.malformed_rate:
+      config.count(agent_name, 'malformed')
+      content = content[:len(content) // 2] + ' <truncated'
+    tokens = tokenize(content)
+    completion_id = f'chatcmpl-mock-{uuid.uuid4().hex[:12]}'
+    model = request.get('model') or 'mock'
+    usage = {
+      'prompt_tokens': len(tokenize(text)),
+      'completion_tokens': len(tokens),
+      'total_tokens': len(tokenize(text)) + len(tokens),
+    }
+    if request.get('stream'):
+      self._stream(completion_id, model, tokens, usage, request)
+    else:
+      time.sleep(config.token_interval() * len(tokens))
+      self._send_json(200, {
+        'id': completion_id,
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': usage,
+      })
+
+  def _stream(self, completion_id, model, tokens, usage, request):
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/event-stream')
+    self.send_header('Cache-Control', 'no-cache')
+    self.send_header('Transfer-Encoding', 'chunked')
+    self.end_headers()
+    created = int(time.time())
+
+    def chunk(delta, finish_reason=None, extra=None):
+      payload = {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': created,
+        'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+      }
+      if extra:
+        payload.update(extra)
+      self._write_chunk(f'data: {json.dumps(payload, ensure_ascii=False)}\n\n')
+
+    interval = self.config.token_interval()
+    chunk({'role': 'assistant', 'content': ''})
+    for token in tokens:
+      chunk({'content': token})
+      if interval:
+        time.sleep(interval)
+    include_usage = (request.get('stream_options') or {}).get('include_usage')
+    chunk({}, 'stop', {'usage': usage} if include_usage else None)
+    self._write_chunk('data: [DONE]\n\n')
+    self.wfile.write(b'0\r\n\r\n')
+
+  def _write_chunk(self, text):
+    data = text.encode('utf-8')
+    self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+    self.wfile.flush()
+
+def create_server(host='127.0.0.1', port=8900, config=None):
+  """创建模拟服务（调用 serve_forever() 启动），便于在压测脚本中以线程方式启动"""
+  handler = type('ConfiguredMockHandler', (MockHandler,), {'config': config or MockConfig()})
+  server = ThreadingHTTPServer((host, port), handler)
+  server.daemon_threads = True
+  return server
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='OpenAI 兼容的模拟大模型服务')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8900)
+  parser.add_argument('--latency', default='lognormal:600,0.5', help='首 token 延迟分布（毫秒）')
+  parser.add_argument('--agent-latency', action='append', default=[], metavar='AGENT=SPEC', help='单个智能体的延迟分布，可重复指定')
+  parser.add_argument('--token-rate', type=float, default=50.0, help='每秒输出 token 数，0 表示不限速')
+  parser.add_argument('--secret-rate', type=float, default=0.3, help='模拟结论为涉密的比例')
+  parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误状态码的比例')
+  parser.add_argument('--error-status', type=int, default=500, help='注入错误的 HTTP 状态码，例如 429/500/503')
+  parser.add_argument('--malformed-rate', type=float, default=0.0, help='返回截断 JSON 的比例')
+  parser.add_argument('--hang-rate', type=float, default=0.0, help='挂起请求的比例')
+  parser.add_argument('--hang-seconds', type=float, default=120.0)
+  parser.add_argument('--seed', help='固定随机种子（默认按提示词内容决定结论）')
+  args = parser.parse_args(argv)
+
+  config = MockConfig(
+    latency=args.latency,
+    agent_latency=dict(item.split('=', 1) for item in args.agent_latency),
+    token_rate=args.token_rate,
+    secret_rate=args.secret_rate,
+    error_rate=args.error_rate,
+    error_status=args.error_status,
+    malformed_rate=args.malformed_rate,
+    hang_rate=args.hang_rate,
+    hang_seconds=args.hang_seconds,
+    seed=args.seed,
+  )
+  server = create_server(args.host, args.port, config)
+  print(f'模拟大模型服务已启动: http://{args.host}:{args.port}/v1')
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
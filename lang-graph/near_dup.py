@@ -0,0 +1,338 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from colorama import Fore,Back,Style
+import telemetry
+from verdict_cache import CACHE_DIR, normalize_text
+
+# 近似重复文档：同一份通知常有多个轻微修改的版本，精确哈希缓存（verdict_cache）无法命中。
+# 这里为每个已判定文档计算 64 位 SimHash（正文字符 4-gram），按汉明距离查找近似文档：
+#   - 分段索引：64 位分成 (最大距离 + 1) 段，距离不超过阈值的两个指纹至少有一段完全相同（抽屉原理），
+#     查找只需检查各段相同的候选，耗时在微秒级
+#   - 持久化在 SQLite 中，启动时按最近访问顺序加载到内存，内存占用超过 NEAR_DUP_MEMORY_MB 时按 LRU 淘汰
+#
+# 找到近似文档后，按段落（段落过少时按句子）对比两个版本：
+#   - reuse    相似度达到 NEAR_DUP_REUSE_THRESHOLD，且没有新增段落（只有删改格式、段落顺序调整，
+#              或只删除了段落且原判定为非涉密）：直接复用原判定。
+#              SimHash 对长文档中新增的一句话不敏感（指纹可能完全不变），因此无论相似度多高都必须对比段落
+#   - partial  原语义分析结论为非涉密，且新增段落占比不超过 NEAR_DUP_MAX_CHANGED：
+#              语义分析只分析新增/修改的段落（state.semantics_focus），其余智能体照常执行
+#   - full     其他情况完整执行工作流
+# 影响判定的版本信息（关键词库、模型、提示词、决策配置、策略）变化后，旧条目不再匹配。
+# 每个进程维护自己的内存索引，其他进程新写入的条目在重启后可见。
+#
+# 配置（环境变量）：
+#   NEAR_DUP                    设为 0 关闭
+#   NEAR_DUP_THRESHOLD          视为近似文档的最低相似度（1 - 汉明距离 / 64），默认 0.9
+#   NEAR_DUP_REUSE_THRESHOLD    允许复用判定的最低相似度（在段落对比之外的额外限制），默认同 NEAR_DUP_THRESHOLD
+#   NEAR_DUP_MAX_CHANGED        partial 模式允许的新增段落字符占比上限，默认 0.5
+#   NEAR_DUP_MEMORY_MB          内存索引的内存预算，默认 64
+
+SHINGLE = 4
+BITS = 64
+SENTENCE = re.compile(r'[^。！？!?；;\n]+[。！？!?；;]?')
+MIN_PARAGRAPHS = 3
+# 内存预算估算：每个条目的固定开销与每个段落哈希的开销（字节）
+ENTRY_BYTES = 400
+UNIT_BYTES = 80
+
+def _hash64(text):
+  return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+def shingles(text):
+  """规范化正文（去空白）的字符 4-gram 及其出现次数"""
+  compact = normalize_text(text).replace(' ', '')
+  if len(compact) <= SHINGLE:
+    return {compact: 1} if compact else {}
+  counts = {}
+  for index in range(len(compact) - SHINGLE + 1):
+    gram = compact[index:index + SHINGLE]
+    counts[gram] = counts.get(gram, 0) + 1
+  return counts
+
+def simhash(features):
+  """
+  加权 SimHash。按字节累计权重（每个特征 8 次累加而不是 64 次），
+  最后对每一位统计该位为 1 的权重是否超过一半
+  """
+  byte_weights = [[0] * 256 for _ in range(BITS // 8)]
+  total = 0
+  for feature, weight in features.items():
+    total += weight
+    for position, value in enumerate(_hash64(feature)):
+      byte_weights[position][value] += weight
+  fingerprint = 0
+  for position, weights in enumerate(byte_weights):
+    for bit in range(8):
+      ones = sum(weight for value, weight in enumerate(weights) if weight and value >> bit & 1)
+      if ones * 2 > total:
+        fingerprint |= 1 << (position * 8 + bit)
+  return fingerprint
+
+def distance(left, right):
+  return bin(left ^ right).count('1')
+
+def split_units(text):
+  """按段落切分，段落过少（例如摘要只有一段）时按句子切分"""
+  paragraphs = [line.strip() for line in (text or '').split('\n') if line.strip()]
+  if len(paragraphs) >= MIN_PARAGRAPHS:
+    return paragraphs
+  return [sentence.strip() for sentence in SENTENCE.findall(text or '') if sentence.strip()]
+
+def unit_hash(unit):
+  return _hash64(normalize_text(unit)).hex()
+
+def band_ranges(bands):
+  """把 64 位尽量均匀地分成 bands 段，返回 [(起始位, 位数)]"""
+  ranges = []
+  start = 0
+  for index in range(bands):
+    width = BITS // bands + (1 if index < BITS % bands else 0)
+    ranges.append((start, width))
+    start += width
+  return ranges
+
+class NearDupIndex:
+  def __init__(self, path, threshold=0.9, memory_mb=64):
+    self.path = path
+    self.max_distance = int(BITS * (1 - threshold) + 1e-9)
+    self.memory_budget = int(memory_mb * 1024 * 1024)
+    self.bands = band_ranges(self.max_distance + 1)
+    self._index = [{} for _ in self.bands]
+    # key -> (指纹, 段落哈希集合, 配置版本)，按最近访问排序
+    self._entries = OrderedDict()
+    self._memory = 0
+    self._lock = threading.Lock()
+    self.lookups = 0
+    self.outcomes = {'reuse': 0, 'partial': 0, 'full': 0}
+    self._latencies = deque(maxlen=1000)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    self._conn.execute('''
+    CREATE TABLE IF NOT EXISTS fingerprints (
+      key TEXT PRIMARY KEY,
+      simhash TEXT NOT NULL,
+      units TEXT NOT NULL,
+      config_version TEXT NOT NULL,
+      state TEXT NOT NULL,
+      last_access REAL NOT NULL
+    )
+    ''')
+    self._conn.commit()
+    self._load()
+
+  def _load(self):
+    rows = self._conn.execute('SELECT key, simhash, units, config_version FROM fingerprints ORDER BY last_access').fetchall()
+    for key, fingerprint, units, config_version in rows:
+      self._insert(key, int(fingerprint, 16), frozenset(json.loads(units)), config_version)
+    evicted = self._evict()
+    if evicted:
+      self._delete(evicted)
+      self._conn.commit()
+
+  def _bands(self, fingerprint):
+    return [(fingerprint >> start) & ((1 << width) - 1) for start, width in self.bands]
+
+  def _insert(self, key, fingerprint, units, config_version):
+    if key in self._entries:
+      self._remove(key)
+    self._entries[key] = (fingerprint, units, config_version)
+    self._memory += ENTRY_BYTES + UNIT_BYTES * len(units)
+    for band, value in zip(self._index, self._bands(fingerprint)):
+      band.setdefault(value, set()).add(key)
+
+  def _remove(self, key):
+    fingerprint, units, _ = self._entries.pop(key)
+    self._memory -= ENTRY_BYTES + UNIT_BYTES * len(units)
+    for band, value in zip(self._index, self._bands(fingerprint)):
+      keys = band.get(value)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del band[value]
+
+  def _evict(self):
+    """超出内存预算时淘汰最久未访问的条目，返回被淘汰的键"""
+    evicted = []
+    while self._memory > self.memory_budget and self._entries:
+      key = next(iter(self._entries))
+      self._remove(key)
+      evicted.append(key)
+    return evicted
+
+  def _delete(self, keys):
+    self._conn.executemany('DELETE FROM fingerprints WHERE key = ?', [(key,) for key in keys])
+
+  def find(self, fingerprint, config_version, exclude=None):
+    """查找距离最近的近似文档，返回 (键, 距离) 或 None"""
+    best = None
+    seen = set()
+    with self._lock:
+      for band, value in zip(self._index, self._bands(fingerprint)):
+        for key in band.get(value, ()):
+          if key in seen or key == exclude:
+            continue
+          seen.add(key)
+          candidate, _, version = self._entries[key]
+          if version != config_version:
+            continue
+          hamming = distance(fingerprint, candidate)
+          if hamming <= self.max_distance and (best is None or hamming < best[1]):
+            best = (key, hamming)
+      if best is not None:
+        self._entries.move_to_end(best[0])
+    return best
+
+  def units(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+    return entry[1] if entry else frozenset()
+
+  def state(self, key):
+    with self._lock:
+      row = self._conn.execute('SELECT state FROM fingerprints WHERE key = ?', (key,)).fetchone()
+      if row is not None:
+        self._conn.execute('UPDATE fingerprints SET last_access = ? WHERE key = ?', (time.time(), key))
+        self._conn.commit()
+    return json.loads(row[0]) if row else None
+
+  def add(self, key, fingerprint, units, config_version, state):
+    with self._lock:
+      self._conn.execute(
+        'INSERT OR REPLACE INTO fingerprints (key, simhash, units, config_version, state, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+        (key, f'{fingerprint:016x}', json.dumps(sorted(units)), config_version, json.dumps(state, ensure_ascii=False), time.time()),
+      )
+      self._insert(key, fingerprint, frozenset(units), config_version)
+      self._delete(self._evict())
+      self._conn.commit()
+
+  def record(self, outcome, seconds):
+    with self._lock:
+      self.lookups += 1
+      if outcome in self.outcomes:
+        self.outcomes[outcome] += 1
+      self._latencies.append(seconds)
+
+  def stats(self):
+    with self._lock:
+      latencies = sorted(self._latencies)
+      matched = sum(self.outcomes.values())
+      return {
+        'entries': len(self._entries),
+        'memory_bytes': self._memory,
+        'memory_budget': self.memory_budget,
+        'max_distance': self.max_distance,
+        'lookups': self.lookups,
+        'matched': matched,
+        'outcomes': dict(self.outcomes),
+        'reuse_rate': self.outcomes['reuse'] / self.lookups if self.lookups else 0.0,
+        'partial_rate': self.outcomes['partial'] / self.lookups if self.lookups else 0.0,
+        'lookup_p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        'lookup_p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+      }
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+  """获取进程内共享的索引，关闭时返回 None"""
+  global _index
+  if os.getenv('NEAR_DUP', '1') == '0':
+    return None
+  if _index is None:
+    with _index_lock:
+      if _index is None:
+        _index = NearDupIndex(
+          os.path.join(CACHE_DIR, 'near_dup.db'),
+          threshold=float(os.getenv('NEAR_DUP_THRESHOLD', '0.9')),
+          memory_mb=float(os.getenv('NEAR_DUP_MEMORY_MB', '64')),
+        )
+  return _index
+
+def document_key(doc_title, doc_content):
+  return hashlib.sha256(f'{normalize_text(doc_title)}\x00{normalize_text(doc_content)}'.encode('utf-8')).hexdigest()
+
+def secret_semantics(state):
+  """原判定的语义分析是否给出了涉密结论（或未执行、已降级，无法据此只分析改动部分）"""
+  if state.get('agent_semantics_result'):
+    return True
+  skipped = 'agent_semantics' in (state.get('skipped_nodes') or [])
+  degraded = 'agent_semantics' in (state.get('degraded_agents') or [])
+  return skipped or degraded
+
+def check(doc_title, doc_content):
+  """
+  查找近似文档并决定处理方式，未找到或已关闭时返回 None；否则返回
+  {'mode': reuse/partial/full, 'of': 近似文档键, 'similarity', 'state': reuse 时的判定, 'fields': 需要并入初始状态的字段}
+  """
+  index = get_index()
+  if index is None:
+    return None
+  from verdict_cache import config_version
+  start = time.perf_counter()
+  fingerprint = simhash(shingles(doc_content))
+  key = document_key(doc_title, doc_content)
+  match = index.find(fingerprint, config_version(), exclude=key)
+  if match is None:
+    index.record('miss', time.perf_counter() - start)
+    telemetry.NEAR_DUP.inc(outcome='miss')
+    return None
+  match_key, hamming = match
+  similarity = 1 - hamming / BITS
+  prior = index.state(match_key)
+  if prior is None:
+    index.record('miss', time.perf_counter() - start)
+    telemetry.NEAR_DUP.inc(outcome='miss')
+    return None
+  units = split_units(doc_content)
+  prior_units = index.units(match_key)
+  current_hashes = {unit_hash(unit) for unit in units}
+  added = [unit for unit in units if unit_hash(unit) not in prior_units]
+  removed = len(prior_units - current_hashes)
+  added_chars = sum(len(unit) for unit in added)
+  total_chars = sum(len(unit) for unit in units) or 1
+  info = {'of': match_key, 'similarity': similarity, 'added_units': len(added), 'removed_units': removed}
+
+  reuse_threshold = float(os.getenv('NEAR_DUP_REUSE_THRESHOLD', os.getenv('NEAR_DUP_THRESHOLD', '0.9')))
+  if similarity >= reuse_threshold and not added and (not removed or not prior.get('result')):
+    mode = 'reuse'
+  elif not secret_semantics(prior) and added_chars / total_chars <= float(os.getenv('NEAR_DUP_MAX_CHANGED', '0.5')):
+    mode = 'partial'
+  else:
+    mode = 'full'
+  info['mode'] = mode
+  seconds = time.perf_counter() - start
+  index.record(mode, seconds)
+  telemetry.NEAR_DUP.inc(outcome=mode)
+  telemetry.add_event('near_duplicate', **info)
+  print(f'{Fore.GREEN}近似文档: {match_key[:12]} 相似度 {similarity:.3f}，新增 {len(added)} 段，删除 {removed} 段 → {mode}{Style.RESET_ALL}')
+
+  result = {**info, 'state': None, 'fields': {'near_duplicate': info}}
+  if mode == 'reuse':
+    result['state'] = {**prior, 'doc_title': doc_title, 'doc_content': doc_content, 'near_duplicate': info}
+  elif mode == 'partial':
+    result['fields']['semantics_focus'] = '\n'.join(added)
+  return result
+
+def remember(doc_title, doc_content, final_state):
+  """把完整判定写入索引（解析失败或降级的结果不写入）"""
+  index = get_index()
+  if index is None:
+    return
+  from verdict_cache import config_version, is_cacheable
+  if not is_cacheable(final_state):
+    return
+  state = {key: value for key, value in final_state.items() if key not in ('doc_content', 'near_duplicate', 'semantics_focus')}
+  index.add(
+    document_key(doc_title, doc_content),
+    simhash(shingles(doc_content)),
+    {unit_hash(unit) for unit in split_units(doc_content)},
+    config_version(),
+    state,
+  )
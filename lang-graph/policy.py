@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+from colorama import Fore,Back,Style
+from decision_engine import SECRET_VALUES
+import telemetry
+
+# 路由策略：根据已执行智能体的结论与文档元数据提前结束工作流，每跳过一个智能体就省下一次大模型往返。
+# 策略从 lib/policies.json 加载，工作流图 (main.app) 与流式接口 (app.py /check) 共用这里的判断，
+# 每次运行触发的策略名写入状态的 fired_policies，被跳过的节点写入 skipped_nodes。
+#
+# policies.json 中每条策略：
+#   name          策略名
+#   stage         评估时机：after_agent_keyword / after_agent_semantics / after_agent_non_secret_proof / before_decision
+#   when          条件，全部满足才触发：{"字段": {"运算符": 值}}，运算符见 OPERATORS
+#   skip          跳过的节点：agent_semantics / agent_non_secret_proof / decision_llm（决策只用本地加权结果）
+#   verdict_from  可选，直接以该智能体的结论作为最终判定
+#
+# 并行模式下语义分析与非涉密证明同时开始，after_agent_semantics 阶段的跳过只在串行模式 (PARALLEL_AGENTS=0) 下生效。
+
+POLICIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib', 'policies.json')
+
+STAGES = ('after_agent_keyword', 'after_agent_semantics', 'after_agent_non_secret_proof', 'before_decision')
+SKIPPABLE = ('agent_semantics', 'agent_non_secret_proof', 'decision_llm')
+
+OPERATORS = {
+  'eq': lambda value, target: value == target,
+  'ne': lambda value, target: value != target,
+  'gt': lambda value, target: value > target,
+  'gte': lambda value, target: value >= target,
+  'lt': lambda value, target: value < target,
+  'lte': lambda value, target: value <= target,
+  'in': lambda value, target: value in target,
+  'contains': lambda value, target: target in value,
+  'not_contains': lambda value, target: target not in value,
+}
+
+VERDICT_LABELS = {
+  'agent_keyword': '关键词检测',
+  'agent_semantics': '语义分析',
+  'agent_non_secret_proof': '非涉密证明',
+}
+
+class PolicyError(ValueError):
+  """策略配置不合法"""
+
+def validate(policies):
+  """加载时校验策略，配置错误尽早暴露而不是在某次运行中静默不生效"""
+  names = set()
+  for policy in policies:
+    name = policy.get('name')
+    if not name or name in names:
+      raise PolicyError(f'策略名缺失或重复: {name}')
+    names.add(name)
+    if policy.get('stage') not in STAGES:
+      raise PolicyError(f'策略 {name} 的 stage 无效: {policy.get("stage")}')
+    for field, conditions in policy.get('when', {}).items():
+      for operator in conditions:
+        if operator not in OPERATORS:
+          raise PolicyError(f'策略 {name} 的字段 {field} 使用了未知运算符: {operator}')
+    for node in policy.get('skip', []):
+      if node not in SKIPPABLE:
+        raise PolicyError(f'策略 {name} 不能跳过节点: {node}')
+    if policy.get('verdict_from') not in (None, *VERDICT_LABELS):
+      raise PolicyError(f'策略 {name} 的 verdict_from 无效: {policy["verdict_from"]}')
+
+_lock = threading.Lock()
+_cached = {}
+
+def _load(path):
+  mtime = os.path.getmtime(path)
+  cached = _cached.get(path)
+  if cached and cached[0] == mtime:
+    return cached[1]
+  with _lock:
+    with open(path, 'rb') as f:
+      raw = f.read()
+    policies = json.loads(raw.decode('utf-8'))['policies']
+    validate(policies)
+    loaded = {
+      'policies': policies,
+      'by_name': {policy['name']: policy for policy in policies},
+      'version': hashlib.sha256(raw).hexdigest()[:12],
+    }
+    _cached[path] = (mtime, loaded)
+    return loaded
+
+def load_policies(path=POLICIES_PATH):
+  """读取策略列表，文件变更后自动重新加载"""
+  return _load(path)['policies']
+
+def version(path=POLICIES_PATH):
+  """策略文件内容的哈希，参与判定缓存键"""
+  return _load(path)['version']
+
+def matches(policy, state):
+  """策略条件全部满足时返回 True；状态中缺少字段或类型不匹配视为不满足"""
+  for field, conditions in policy.get('when', {}).items():
+    if field not in state:
+      return False
+    for operator, target in conditions.items():
+      try:
+        if not OPERATORS[operator](state[field], target):
+          return False
+      except TypeError:
+        return False
+  return True
+
+def evaluate(stage, state):
+  """评估某一阶段的策略，返回新触发的策略名"""
+  already = set(state.get('fired_policies') or [])
+  fired = []
+  for policy in load_policies():
+    if policy['stage'] == stage and policy['name'] not in already and matches(policy, state):
+      print(f'{Fore.BLUE}触发策略: {policy["name"]}（{policy.get("description", "")}）{Style.RESET_ALL}')
+      telemetry.POLICY_FIRED.inc(policy=policy['name'])
+      fired.append(policy['name'])
+  return fired
+
+def actions(fired):
+  """合并已触发策略的动作：{skip: 跳过的节点集合, verdict_from: 直接采用其结论的智能体}"""
+  by_name = _load(POLICIES_PATH)['by_name']
+  skip = set()
+  verdict_from = None
+  for name in fired:
+    policy = by_name.get(name)
+    if policy is None:
+      continue
+    skip.update(policy.get('skip', []))
+    if verdict_from is None:
+      verdict_from = policy.get('verdict_from')
+  return {'skip': skip, 'verdict_from': verdict_from}
+
+def is_skipped(node_name, state):
+  return node_name in actions(state.get('fired_policies') or [])['skip']
+
+def run_node(node_name, node, state):
+  """执行智能体节点：已被触发的策略跳过时直接返回，否则执行后评估该节点之后的策略"""
+  if is_skipped(node_name, state):
+    print(f'{Fore.BLUE}策略跳过: {node_name}{Style.RESET_ALL}')
+    telemetry.NODE_SKIPPED.inc(node=node_name)
+    return {'current_node': node_name, 'skipped_nodes': [node_name]}
+  output = dict(node(state))
+  output['fired_policies'] = evaluate(f'after_{node_name}', {**state, **output})
+  return output
+
+def guard(node_name, node):
+  """包装为工作流节点"""
+  def wrapper(state):
+    return run_node(node_name, node, state)
+  return wrapper
+
+def merge(state, output):
+  """把节点输出合并进状态，列表字段追加而不是覆盖（与工作流图的 reducer 一致）"""
+  for key, value in output.items():
+    if key in ('fired_policies', 'skipped_nodes', 'node_timings', 'degraded_agents'):
+      state[key] = list(state.get(key) or []) + list(value)
+    else:
+      state[key] = value
+  return state
+
+def policy_verdict(agent_name, state):
+  """直接采用某个智能体的结论作为最终判定"""
+  secret = state.get(f'{agent_name}_result') == SECRET_VALUES[agent_name]
+  confidence = state.get(f'{agent_name}_confidence', 0)
+  verdict = '涉密' if secret else '非涉密'
+  return {
+    'result': secret,
+    'result_detail': f'{VERDICT_LABELS[agent_name]}结果为{verdict}，置信度为{confidence}，最终判定为{verdict}',
+    'result_confidence': confidence,
+    'current_node': 'END',
+  }
@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from colorama import Fore,Back,Style
+from verdict_cache import CACHE_DIR
+import telemetry
+
+# 跨进程共享的上游配额限流：每个模型一个请求数令牌桶和一个 token 数令牌桶，状态保存在 SQLite 中，
+# 同一台机器上的所有 Flask/gunicorn 进程、批量任务共用同一份配额。配额不足时计算需要等待的时间并排队，
+# 而不是直接拒绝；等待时间导出为 classifier_rate_limit_wait_seconds 指标。
+#
+# lib/rate_limits.json：
+#   default   未单独配置的模型使用的限额
+#   models    {"模型名": {"requests_per_minute": n, "tokens_per_minute": n}}，0 表示不限制
+#
+# 配置（环境变量）：
+#   RATE_LIMIT_DB                  令牌桶数据库路径，默认 CACHE_DIR/rate_limit.db
+#   RATE_LIMIT_MAX_WAIT            单次调用最多排队多少秒（同时不超过该调用剩余的截止时间），超过则视为大模型不可用，默认 300
+#   RATE_LIMIT_COMPLETION_TOKENS   调用前预估的输出 token 数（返回后按实际用量结算），默认 512
+
+RATE_LIMITS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib', 'rate_limits.json')
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '300'))
+RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv('RATE_LIMIT_COMPLETION_TOKENS', '512'))
+
+class RateLimitTimeout(RuntimeError):
+  """排队时间超过上限"""
+
+class RateLimiter:
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 手动管理事务：BEGIN IMMEDIATE 在进程间互斥地读写令牌桶
+    self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    self._conn.execute('''
+    CREATE TABLE IF NOT EXISTS buckets (
+      name TEXT PRIMARY KEY,
+      tokens REAL NOT NULL,
+      updated REAL NOT NULL
+    )
+    ''')
+
+  def _take(self, buckets):
+    """
+    buckets: [(桶名, 容量, 每秒补充量, 本次消耗)]
+    配额足够时扣除并返回 0，否则返回需要等待的秒数（不扣除）
+    """
+    now = time.time()
+    with self._lock:
+      self._conn.execute('BEGIN IMMEDIATE')
+      try:
+        levels = {}
+        wait = 0.0
+        for name, capacity, rate, cost in buckets:
+          row = self._conn.execute('SELECT tokens, updated FROM buckets WHERE name = ?', (name,)).fetchone()
+          level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+          levels[name] = level
+          # 单次消耗超过容量时只要求桶满，避免永远等不到
+          needed = min(cost, capacity)
+          if level < needed:
+            wait = max(wait, (needed - level) / rate)
+        if wait == 0.0:
+          for name, capacity, rate, cost in buckets:
+            levels[name] -= cost
+        for name, level in levels.items():
+          self._conn.execute(
+            'INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+            (name, level, now),
+          )
+        self._conn.execute('COMMIT')
+      except BaseException:
+        self._conn.execute('ROLLBACK')
+        raise
+    return wait
+
+  def acquire(self, model, limits, tokens, max_wait=None):
+    """排队直到请求数与 token 数配额都足够，返回等待的秒数"""
+    if max_wait is None:
+      max_wait = RATE_LIMIT_MAX_WAIT
+    buckets = bucket_specs(model, limits, tokens)
+    if not buckets:
+      return 0.0
+    start = time.monotonic()
+    while True:
+      wait = self._take(buckets)
+      waited = time.monotonic() - start
+      if wait == 0.0:
+        telemetry.RATE_LIMIT_WAIT.observe(waited, model=model)
+        if waited > 0:
+          telemetry.add_event('rate_limit_wait', model=model, seconds=waited)
+        return waited
+      if waited + wait > max_wait:
+        telemetry.RATE_LIMIT_WAIT.observe(waited, model=model)
+        raise RateLimitTimeout(f'{model} 限流排队超过 {max_wait:.0f}s')
+      time.sleep(wait)
+
+  def settle(self, model, limits, estimated, actual):
+    """按实际 token 用量结算预估差额（可以透支，后续调用会相应等待）"""
+    tokens_per_minute = limits.get('tokens_per_minute', 0)
+    if not tokens_per_minute or actual == estimated:
+      return
+    name = f'{model}:tokens'
+    rate = tokens_per_minute / 60
+    now = time.time()
+    with self._lock:
+      self._conn.execute('BEGIN IMMEDIATE')
+      try:
+        row = self._conn.execute('SELECT tokens, updated FROM buckets WHERE name = ?', (name,)).fetchone()
+        level = tokens_per_minute if row is None else min(tokens_per_minute, row[0] + (now - row[1]) * rate)
+        self._conn.execute(
+          'INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) '
+          'ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+          (name, level - (actual - estimated), now),
+        )
+        self._conn.execute('COMMIT')
+      except BaseException:
+        self._conn.execute('ROLLBACK')
+        raise
+
+  def levels(self):
+    with self._lock:
+      rows = self._conn.execute('SELECT name, tokens, updated FROM buckets').fetchall()
+    return {name: {'tokens': tokens, 'updated': updated} for name, tokens, updated in rows}
+
+def bucket_specs(model, limits, tokens):
+  buckets = []
+  requests_per_minute = limits.get('requests_per_minute', 0)
+  tokens_per_minute = limits.get('tokens_per_minute', 0)
+  if requests_per_minute:
+    buckets.append((f'{model}:requests', requests_per_minute, requests_per_minute / 60, 1))
+  if tokens_per_minute:
+    buckets.append((f'{model}:tokens', tokens_per_minute, tokens_per_minute / 60, tokens))
+  return buckets
+
+_config_lock = threading.Lock()
+_config = {}
+
+def load_limits(path=RATE_LIMITS_PATH):
+  """读取限额配置，文件变更后自动重新加载"""
+  mtime = os.path.getmtime(path)
+  cached = _config.get(path)
+  if cached and cached[0] == mtime:
+    return cached[1]
+  with _config_lock:
+    with open(path, 'r', encoding='utf-8') as f:
+      config = json.load(f)
+    _config[path] = (mtime, config)
+    return config
+
+def model_limits(model):
+  config = load_limits()
+  return config.get('models', {}).get(model or '', config.get('default', {}))
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_limiter():
+  """获取进程内共享的限流器实例"""
+  global _limiter
+  if _limiter is None:
+    with _limiter_lock:
+      if _limiter is None:
+        _limiter = RateLimiter(os.getenv('RATE_LIMIT_DB', os.path.join(CACHE_DIR, 'rate_limit.db')))
+  return _limiter
+
+def estimate(model, prompt_tokens):
+  """调用前预估的 token 消耗；该模型未配置 token 限额时返回 0"""
+  limits = model_limits(model)
+  if not limits.get('requests_per_minute') and not limits.get('tokens_per_minute'):
+    return 0
+  return prompt_tokens + RATE_LIMIT_COMPLETION_TOKENS
+
+def acquire(model, prompt_tokens, max_wait=None):
+  """
+  调用上游前排队获取配额，未配置限额时直接返回；返回预估消耗的 token 数，用于调用后结算
+  max_wait 为调用方剩余的截止时间（秒），排队时间不超过它与 RATE_LIMIT_MAX_WAIT 中较小者
+  """
+  estimated = estimate(model, prompt_tokens)
+  if not estimated:
+    return 0
+  max_wait = RATE_LIMIT_MAX_WAIT if max_wait is None else min(max(0.0, max_wait), RATE_LIMIT_MAX_WAIT)
+  waited = get_limiter().acquire(model, model_limits(model), estimated, max_wait)
+  if waited > 1:
+    print(f'{Fore.YELLOW}{model} 限流排队 {waited:.1f}s{Style.RESET_ALL}')
+  return estimated
+
+def settle(model, estimated, actual):
+  """调用结束后按实际用量结算"""
+  if not estimated:
+    return
+  get_limiter().settle(model, model_limits(model), estimated, actual)
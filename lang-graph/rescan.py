@@ -0,0 +1,148 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from colorama import Fore,Back,Style
+import doc_records
+from keyword_matcher import KeywordMatcher, get_matcher
+
+# 关键词库变更后的增量重扫：对比文档记录（doc_records.py）中保存的旧关键词库快照与当前 lib/keywords.json，
+#   - 新增关键词：在记录的正文上用只包含新增关键词的自动机本地匹配，命中的文档需要重新判定
+#   - 删除关键词：判定依赖（verdict_terms）被删除关键词的文档需要重新判定
+# 其余文档的结论不受影响，直接升级到新库版本，不调用大模型。
+# 新增关键词只按字面（精确、归一化、核心词）命中计算，只有语义关联、没有字面出现的文档不会被重新判定。
+#
+# 用法：
+#   python lang-graph/rescan.py                           # 只列出受影响的文档（不修改记录）
+#   python lang-graph/rescan.py --run --concurrency 8     # 重新判定受影响的文档，并升级其余文档的库版本
+#   python lang-graph/rescan.py --run --output rescan.jsonl
+
+def library_terms(library):
+  return {keyword for keywords in library.values() for keyword in keywords}
+
+def diff_libraries(old, new):
+  """返回 (新增关键词, 删除关键词)"""
+  old_terms = library_terms(old)
+  new_terms = library_terms(new)
+  return sorted(new_terms - old_terms), sorted(old_terms - new_terms)
+
+def plan(records, matcher):
+  """
+  找出需要重新判定的文档
+  返回 {'changes': [{version, documents, added, removed, affected}], 'affected': {doc_id: {'added': [...], 'removed': [...]}}}
+  """
+  changes = []
+  affected = {}
+  for version, documents in sorted(records.versions().items()):
+    if version == matcher.version:
+      continue
+    old = records.library(version)
+    change = {'version': version, 'documents': documents, 'affected': 0}
+    if old is None:
+      # 没有旧版本快照时无法计算差异，该版本下的文档全部重新判定
+      change.update({'added': None, 'removed': None})
+      for doc_id, _, _ in records.iter_contents(version):
+        affected[doc_id] = {'version': version, 'added': [], 'removed': [], 'reason': 'no_snapshot'}
+        change['affected'] += 1
+      changes.append(change)
+      continue
+    added, removed = diff_libraries(old, matcher.library)
+    change.update({'added': added, 'removed': removed})
+    for doc_id, terms in records.depending_on(removed, version).items():
+      affected.setdefault(doc_id, {'version': version, 'added': [], 'removed': []})['removed'] = sorted(terms)
+    if added:
+      added_matcher = KeywordMatcher({'added': added})
+      for doc_id, _, doc_content in records.iter_contents(version):
+        hits = sorted({hit['keyword'] for hit in added_matcher.find(doc_content)})
+        if hits:
+          affected.setdefault(doc_id, {'version': version, 'added': [], 'removed': []})['added'] = hits
+    change['affected'] = sum(1 for item in affected.values() if item['version'] == version)
+    changes.append(change)
+  return {'changes': changes, 'affected': affected}
+
+def reclassify(records, doc_id):
+  from main import invoke
+  document = records.get(doc_id)
+  start = time.perf_counter()
+  try:
+    final_state = invoke(document['doc_title'], document['doc_content'])
+  except Exception as e:
+    return {'doc_id': doc_id, 'status': 'error', 'error': f'{type(e).__name__}: {e}', 'seconds': time.perf_counter() - start}
+  doc_records.record(doc_id, document['doc_title'], document['doc_content'], final_state, records)
+  result = bool(final_state.get('result'))
+  return {
+    'doc_id': doc_id,
+    'status': 'ok',
+    'previous_result': document['result'],
+    'result': result,
+    'changed': document['result'] is not None and document['result'] != result,
+    'result_confidence': final_state.get('result_confidence', 0),
+    'seconds': time.perf_counter() - start,
+  }
+
+def run(records, matcher, result_plan, concurrency=4, out=None):
+  """重新判定受影响的文档，并把其余文档升级到当前库版本"""
+  affected = result_plan['affected']
+  results = []
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    futures = {executor.submit(reclassify, records, doc_id): doc_id for doc_id in affected}
+    for future in as_completed(futures):
+      result = future.result()
+      result.update({'added': affected[result['doc_id']]['added'], 'removed': affected[result['doc_id']]['removed']})
+      results.append(result)
+      if out is not None:
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        out.flush()
+      color = Fore.RED if result['status'] == 'error' else (Fore.YELLOW if result.get('changed') else Fore.GREEN)
+      print(f'{color}[{len(results)}/{len(affected)}] {result["doc_id"]}: {result.get("result", result.get("error"))}{Style.RESET_ALL}')
+  # 重新判定成功的文档已按新库版本写入记录；失败的文档保持旧版本，下次重扫时再次处理
+  advanced = 0
+  for change in result_plan['changes']:
+    advanced += records.advance(change['version'], matcher.version, change['removed'] or [], exclude=affected)
+  return results, advanced
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='关键词库变更后的增量重扫')
+  parser.add_argument('--records', help='文档记录数据库，默认 DOC_RECORDS_DB 或 CACHE_DIR/documents.db')
+  parser.add_argument('--run', action='store_true', help='重新判定受影响的文档并升级其余文档的库版本（默认只列出）')
+  parser.add_argument('--concurrency', type=int, default=4, help='并行重新判定的文档数')
+  parser.add_argument('--output', help='JSONL 输出：受影响文档列表，--run 时为重新判定结果')
+  args = parser.parse_args(argv)
+
+  records = doc_records.DocumentRecords(args.records) if args.records else doc_records.get_records()
+  matcher = get_matcher()
+  records.save_library(matcher)
+  total = sum(records.versions().values())
+  start = time.perf_counter()
+  result_plan = plan(records, matcher)
+  affected = result_plan['affected']
+  print(f'{Fore.CYAN}当前关键词库版本: {matcher.version}，记录文档 {total} 篇（计划耗时 {time.perf_counter() - start:.2f}s）{Style.RESET_ALL}')
+  for change in result_plan['changes']:
+    if change['added'] is None:
+      print(f'  {change["version"]}: {change["documents"]} 篇，缺少库快照，全部重新判定')
+    else:
+      print(f'  {change["version"]}: {change["documents"]} 篇，新增 {len(change["added"])} 个关键词，'
+            f'删除 {len(change["removed"])} 个关键词，受影响 {change["affected"]} 篇')
+  print(f'{Fore.GREEN}{Style.BRIGHT}需要重新判定: {len(affected)} / {total} 篇'
+        f'（{len(affected) / total * 100 if total else 0:.2f}%）{Style.RESET_ALL}')
+
+  out = open(args.output, 'w', encoding='utf-8') if args.output else None
+  try:
+    if not args.run:
+      if out is not None:
+        for doc_id, item in affected.items():
+          out.write(json.dumps({'doc_id': doc_id, **item}, ensure_ascii=False) + '\n')
+      return result_plan
+    results, advanced = run(records, matcher, result_plan, args.concurrency, out)
+  finally:
+    if out is not None:
+      out.close()
+  changed = sum(1 for result in results if result.get('changed'))
+  failed = sum(1 for result in results if result['status'] == 'error')
+  print(f'{Fore.GREEN}{Style.BRIGHT}重新判定 {len(results)} 篇，结论变化 {changed} 篇，失败 {failed} 篇；'
+        f'{advanced} 篇未受影响，直接升级到新库版本{Style.RESET_ALL}')
+  return result_plan
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,319 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
+from colorama import Fore,Back,Style
+import telemetry
+
+# 大模型调用的容错层：每次调用有总截止时间，可重试的错误（429、5xx、超时、连接错误）按带抖动的指数退避重试，
+# 可选在延迟超过近期 p95 后发出一个对冲请求、取先返回的结果，连续失败后熔断快速失败。
+# 调用最终失败时抛出 LLMUnavailableError，由各智能体降级为已有结果（见 agents.py）。
+#
+# 配置（环境变量，智能体专属变量优先于全局变量，与 llm_client 一致）：
+#   <AGENT>_DEADLINE / LLM_DEADLINE                  单次调用（含重试）的总截止时间（秒），默认 120
+#   <AGENT>_MAX_RETRIES / LLM_MAX_RETRIES            最大重试次数，默认 3
+#   LLM_RETRY_BASE / LLM_RETRY_MAX                   退避基数与上限（秒），默认 0.5 / 8
+#   <AGENT>_HEDGE / LLM_HEDGE                        对冲：off（默认）/ p95（按近期延迟）/ 毫秒数
+#   LLM_HEDGE_MIN_SAMPLES                            按 p95 对冲前至少需要的延迟样本数，默认 20
+#   LLM_BREAKER_FAILURES                             连续失败多少次后熔断，默认 5
+#   LLM_BREAKER_RESET                                熔断后多少秒放行一个探测请求，默认 30
+#
+# 单次请求的超时由 llm_client 中的 <AGENT>_TIMEOUT 控制（传给 ChatOpenAI，其内置重试已关闭）；
+# 每次尝试都在线程池中执行并最多等待到截止时间，单次请求超时大于剩余时间时也不会拖过截止时间；
+# 流式调用在线程池中等待第一个 chunk（同样受截止时间约束并可对冲），只在收到第一个 chunk 之前重试。
+#   LLM_ATTEMPT_WORKERS                              执行调用（含对冲请求、流式调用的第一个 chunk）的线程数，默认 64
+
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+# 当前调用的截止时间（time.monotonic()），供请求内部的排队（例如限流）使用
+_deadline = contextvars.ContextVar('llm_deadline', default=None)
+
+def remaining():
+  """当前大模型调用剩余的截止时间（秒），不在 call / stream 中时返回 None"""
+  deadline = _deadline.get()
+  return None if deadline is None else deadline - time.monotonic()
+
+class LLMUnavailableError(RuntimeError):
+  """大模型暂不可用（熔断、超过截止时间或重试耗尽），调用方应降级处理"""
+
+  def __init__(self, agent_name, reason, message=''):
+    super().__init__(f'{agent_name} 大模型不可用（{reason}）{message}')
+    self.agent_name = agent_name
+    self.reason = reason
+
+def _agent_env(agent_name, key, fallback_key, default):
+  return os.getenv(f'{agent_name.upper()}_{key}') or os.getenv(fallback_key) or default
+
+def agent_policy(agent_name):
+  """返回智能体的容错配置"""
+  return {
+    'deadline': float(_agent_env(agent_name, 'DEADLINE', 'LLM_DEADLINE', '120')),
+    'max_retries': int(_agent_env(agent_name, 'MAX_RETRIES', 'LLM_MAX_RETRIES', '3')),
+    'retry_base': float(os.getenv('LLM_RETRY_BASE', '0.5')),
+    'retry_max': float(os.getenv('LLM_RETRY_MAX', '8')),
+    'hedge': _agent_env(agent_name, 'HEDGE', 'LLM_HEDGE', 'off'),
+    'hedge_min_samples': int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20')),
+  }
+
+def status_code(error):
+  status = getattr(error, 'status_code', None)
+  if status is None and getattr(error, 'response', None) is not None:
+    status = getattr(error.response, 'status_code', None)
+  return status
+
+def is_retryable(error):
+  """429、5xx、超时与连接错误可以重试；参数错误、鉴权失败等不重试"""
+  status = status_code(error)
+  if status is not None:
+    return status in RETRYABLE_STATUS
+  if isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError)):
+    return True
+  # openai.APIConnectionError / APITimeoutError 没有状态码
+  return type(error).__name__ in ('APIConnectionError', 'APITimeoutError')
+
+def retry_reason(error):
+  status = status_code(error)
+  return str(status) if status is not None else type(error).__name__
+
+def retry_after(error):
+  """读取 Retry-After 响应头（秒）"""
+  response = getattr(error, 'response', None)
+  headers = getattr(response, 'headers', None)
+  if not headers:
+    return None
+  try:
+    return float(headers.get('retry-after'))
+  except (TypeError, ValueError):
+    return None
+
+def backoff(attempt, base, cap):
+  """全抖动指数退避：在 [0, min(cap, base * 2^attempt)] 内随机"""
+  return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class CircuitBreaker:
+  """连续失败达到阈值后打开；冷却时间后进入半开状态，只放行一个探测请求"""
+
+  CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+  def __init__(self, agent_name, failures=None, reset_seconds=None):
+    self.agent_name = agent_name
+    self.failure_threshold = failures if failures is not None else int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+    self.reset_seconds = reset_seconds if reset_seconds is not None else float(os.getenv('LLM_BREAKER_RESET', '30'))
+    self.state = self.CLOSED
+    self.failures = 0
+    self.opened_at = 0.0
+    self._probing = False
+    self._lock = threading.Lock()
+
+  def check(self):
+    """熔断打开时抛出 LLMUnavailableError"""
+    with self._lock:
+      if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+        self._set_state(self.HALF_OPEN)
+      if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._probing):
+        raise LLMUnavailableError(self.agent_name, 'circuit_open')
+      if self.state == self.HALF_OPEN:
+        self._probing = True
+
+  def record_success(self):
+    with self._lock:
+      self.failures = 0
+      self._probing = False
+      self._set_state(self.CLOSED)
+
+  def record_failure(self):
+    with self._lock:
+      self.failures += 1
+      self._probing = False
+      if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+        if self.state != self.OPEN:
+          print(f'{Fore.RED}熔断: {self.agent_name} 连续失败 {self.failures} 次{Style.RESET_ALL}')
+        self.opened_at = time.monotonic()
+        self._set_state(self.OPEN)
+
+  def _set_state(self, state):
+    self.state = state
+    telemetry.CIRCUIT_STATE.set(state, agent=self.agent_name)
+
+_lock = threading.Lock()
+_breakers = {}
+_latencies = {}
+# 执行大模型请求（含对冲请求、流式调用的第一个 chunk）的线程池：调用方只等待到截止时间，超时的请求在后台结束
+attempt_executor = ThreadPoolExecutor(max_workers=int(os.getenv('LLM_ATTEMPT_WORKERS', '64')))
+
+def get_breaker(agent_name):
+  with _lock:
+    breaker = _breakers.get(agent_name)
+    if breaker is None:
+      breaker = _breakers[agent_name] = CircuitBreaker(agent_name)
+    return breaker
+
+def record_latency(agent_name, seconds):
+  with _lock:
+    _latencies.setdefault(agent_name, deque(maxlen=200)).append(seconds)
+
+def hedge_delay(agent_name, policy):
+  """返回发出对冲请求前的等待秒数，不对冲时返回 None"""
+  hedge = policy['hedge']
+  if hedge in ('', 'off', '0'):
+    return None
+  if hedge != 'p95':
+    return float(hedge) / 1000
+  with _lock:
+    samples = sorted(_latencies.get(agent_name, ()))
+  if len(samples) < policy['hedge_min_samples']:
+    return None
+  return samples[int(len(samples) * 0.95) - 1]
+
+def _attempt(agent_name, fn, policy, deadline, discard=None):
+  """
+  执行一次调用，最多等待到截止时间；开启对冲且超过对冲延迟仍未返回时再发一个相同请求，取先成功的结果
+  discard: 可选，对未被采用的请求（对冲的落败方、超过截止时间后才返回的请求）的结果调用，用于释放连接
+  """
+  delay = hedge_delay(agent_name, policy)
+  token = _deadline.set(deadline)
+  try:
+    context = contextvars.copy_context()
+  finally:
+    _deadline.reset(token)
+  futures = [attempt_executor.submit(context.copy().run, fn)]
+  if delay is not None:
+    done, _ = wait(futures, timeout=min(delay, max(0.0, deadline - time.monotonic())))
+    if not done and time.monotonic() < deadline:
+      futures.append(attempt_executor.submit(context.copy().run, fn))
+      telemetry.add_event('hedge', agent=agent_name, delay=delay)
+  errors = []
+  pending = list(futures)
+  while pending:
+    done, _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+    if not done:
+      _discard(pending, discard)
+      raise LLMUnavailableError(agent_name, 'deadline')
+    for future in done:
+      pending.remove(future)
+      if future.exception() is None:
+        if len(futures) > 1:
+          telemetry.LLM_HEDGES.inc(agent=agent_name, winner='hedge' if future is futures[1] else 'primary')
+        _discard(pending, discard)
+        return future.result()
+      errors.append(future.exception())
+  raise errors[0]
+
+def _discard(futures, discard):
+  if discard is None:
+    return
+  for future in futures:
+    future.add_done_callback(lambda f: discard(f.result()) if f.exception() is None else None)
+
+_EMPTY = object()
+
+def _first_chunk(fn):
+  """发起流式请求并读取第一个 chunk，返回 (chunk 迭代器, 第一个 chunk)；没有输出时第一个 chunk 为 _EMPTY"""
+  chunks = iter(fn())
+  return chunks, next(chunks, _EMPTY)
+
+def _close_stream(opened):
+  close = getattr(opened[0], 'close', None)
+  if close is not None:
+    close()
+
+def _handle_failure(agent_name, error, attempt, policy, deadline, breaker):
+  """记录失败；可以重试时返回退避秒数，否则抛出异常"""
+  if isinstance(error, LLMUnavailableError):
+    # 本地限流排队超时不代表上游故障，不计入熔断
+    if error.reason != 'rate_limit':
+      breaker.record_failure()
+    telemetry.LLM_UNAVAILABLE.inc(agent=agent_name, reason=error.reason)
+    raise error
+  if not is_retryable(error):
+    # 上游有响应（例如参数错误），不计入熔断；包装为 LLMUnavailableError 交给智能体降级处理
+    breaker.record_success()
+    telemetry.LLM_UNAVAILABLE.inc(agent=agent_name, reason='error')
+    raise LLMUnavailableError(agent_name, 'error', f': {type(error).__name__}: {error}') from error
+  breaker.record_failure()
+  reason = retry_reason(error)
+  if attempt >= policy['max_retries']:
+    telemetry.LLM_UNAVAILABLE.inc(agent=agent_name, reason='retries_exhausted')
+    raise LLMUnavailableError(agent_name, 'retries_exhausted', f': {error}') from error
+  delay = max(retry_after(error) or 0.0, backoff(attempt, policy['retry_base'], policy['retry_max']))
+  if time.monotonic() + delay >= deadline:
+    telemetry.LLM_UNAVAILABLE.inc(agent=agent_name, reason='deadline')
+    raise LLMUnavailableError(agent_name, 'deadline', f': {error}') from error
+  print(f'{Fore.YELLOW}{agent_name} 调用失败（{reason}），{delay:.2f}s 后第 {attempt + 1} 次重试{Style.RESET_ALL}')
+  telemetry.LLM_RETRIES.inc(agent=agent_name, reason=reason)
+  telemetry.add_event('retry', agent=agent_name, reason=reason, delay=delay)
+  return delay
+
+def _check_open(agent_name, breaker, deadline):
+  try:
+    breaker.check()
+  except LLMUnavailableError:
+    telemetry.LLM_UNAVAILABLE.inc(agent=agent_name, reason='circuit_open')
+    raise
+  if time.monotonic() >= deadline:
+    telemetry.LLM_UNAVAILABLE.inc(agent=agent_name, reason='deadline')
+    raise LLMUnavailableError(agent_name, 'deadline')
+
+def call(agent_name, fn):
+  """带截止时间、重试、对冲与熔断地执行 fn()（一次完整的非流式大模型请求）"""
+  policy = agent_policy(agent_name)
+  breaker = get_breaker(agent_name)
+  deadline = time.monotonic() + policy['deadline']
+  attempt = 0
+  while True:
+    _check_open(agent_name, breaker, deadline)
+    start = time.monotonic()
+    try:
+      result = _attempt(agent_name, fn, policy, deadline)
+    except Exception as e:
+      time.sleep(_handle_failure(agent_name, e, attempt, policy, deadline, breaker))
+      attempt += 1
+      continue
+    record_latency(agent_name, time.monotonic() - start)
+    breaker.record_success()
+    return result
+
+def stream(agent_name, fn):
+  """
+  流式版本：fn() 返回 chunk 迭代器；只在收到第一个 chunk 之前重试，之后超过截止时间则中止
+  第一个 chunk 与非流式调用一样在线程池中等待，最多等到截止时间，开启对冲时超过对冲延迟再发一个请求
+  """
+  policy = agent_policy(agent_name)
+  breaker = get_breaker(agent_name)
+  deadline = time.monotonic() + policy['deadline']
+  attempt = 0
+  while True:
+    _check_open(agent_name, breaker, deadline)
+    start = time.monotonic()
+    started = False
+    try:
+      chunks, first = _attempt(agent_name, lambda: _first_chunk(fn), policy, deadline, discard=_close_stream)
+      if first is not _EMPTY:
+        started = True
+        record_latency(agent_name, time.monotonic() - start)
+        yield first
+        if time.monotonic() >= deadline:
+          raise LLMUnavailableError(agent_name, 'deadline', ': 流式输出超过截止时间')
+      for chunk in chunks:
+        yield chunk
+        if time.monotonic() >= deadline:
+          raise LLMUnavailableError(agent_name, 'deadline', ': 流式输出超过截止时间')
+    except Exception as e:
+      if started:
+        # 已经输出了部分内容，不能重试；统一包装为 LLMUnavailableError，由调用方降级处理
+        if isinstance(e, LLMUnavailableError):
+          breaker.record_failure()
+          raise
+        if is_retryable(e):
+          breaker.record_failure()
+        telemetry.LLM_UNAVAILABLE.inc(agent=agent_name, reason='stream_interrupted')
+        raise LLMUnavailableError(agent_name, 'stream_interrupted', f': {type(e).__name__}: {e}') from e
+      time.sleep(_handle_failure(agent_name, e, attempt, policy, deadline, breaker))
+      attempt += 1
+      continue
+    breaker.record_success()
+    return
@@ -0,0 +1,347 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from colorama import Fore,Back,Style
+from keyword_matcher import Automaton
+
+try:
+  from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+  import sre_parse, sre_constants
+
+# 关键词 + 正则规则引擎（first_main.py 的 keyword_match / regex_match 使用）
+# 加载时一次性编译全部规则，每篇文档只扫描一遍：
+#   - 全部关键词与每条正则规则的 “必需字面量” 放进同一个 Aho–Corasick 自动机（keyword_matcher.Automaton），
+#     在小写后的正文上扫描一遍，得到关键词命中位置以及必需字面量出现过的候选规则
+#   - 只对候选规则执行预编译的正则确认；提取不出必需字面量的规则（例如纯 \d{6} 之类）每篇文档都执行
+# 必需字面量由正则语法树得到：任何匹配都一定包含其中至少一个字面量，因此跳过的规则一定没有匹配，结果与逐条 re.findall 一致。
+#
+# 规则在加载时校验（空关键词、缺少字段、重复 id、正则语法错误、可以匹配空串），配置错误在启动时暴露，而不是每篇文档打印警告。
+#
+# 用法：
+#   python lang-graph/rule_engine.py 文档.txt                                   # 使用 ../rule.json 与 ../regex.json
+#   python lang-graph/rule_engine.py --rule-file rule.json --regex-file regex.json 文档.txt
+#   python lang-graph/rule_engine.py --bench --keywords 5000 --rules 1000 --chars 20000
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RULE_PATH = os.path.join(ROOT_DIR, 'rule.json')
+REGEX_PATH = os.path.join(ROOT_DIR, 'regex.json')
+
+# 必需字面量的最短长度，过短的字面量几乎每篇文档都会出现，起不到过滤作用
+MIN_LITERAL = 2
+RULE_FIELDS = ('id', 'name', 'regex', 'category')
+_REPEATS = tuple(op for op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, getattr(sre_constants, 'POSSESSIVE_REPEAT', None)) if op is not None)
+_ATOMIC = getattr(sre_constants, 'ATOMIC_GROUP', None)
+
+class RuleError(ValueError):
+  """规则配置不合法"""
+
+def lower(text):
+  """小写并保持字符位置不变（小写后长度变化的字符保留原样），命中位置可以直接对应原文"""
+  lowered = text.lower()
+  if len(lowered) == len(text):
+    return lowered
+  return ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+def _usable(char, ignorecase):
+  """字面字符能否用于预过滤：忽略大小写的规则只使用无大小写之分的字符（中文、数字、标点）"""
+  if len(char.lower()) != 1:
+    return False
+  return not ignorecase or char.lower() == char.upper()
+
+def _better(current, candidate):
+  """优先选择最短字面量更长的一组（候选更少），其次选择字面量个数更少的一组"""
+  if candidate is None:
+    return current
+  if current is None:
+    return candidate
+  return max(current, candidate, key=lambda literals: (min(len(literal) for literal in literals), -len(literals)))
+
+def required_literals(items, ignorecase=False):
+  """
+  从正则语法树中找出一组字面量，任何匹配都至少包含其中一个；找不到时返回 None
+  顺序连续的字面字符组成一个字面量；分组与至少重复一次的部分递归处理；每个分支都有字面量时取并集
+  """
+  best = None
+  run = []
+
+  def flush():
+    nonlocal best
+    if len(run) >= MIN_LITERAL:
+      best = _better(best, [lower(''.join(run))])
+    run.clear()
+
+  for op, av in items:
+    if op is sre_constants.LITERAL and _usable(chr(av), ignorecase):
+      run.append(chr(av))
+      continue
+    flush()
+    if op is sre_constants.SUBPATTERN:
+      best = _better(best, required_literals(av[-1], ignorecase))
+    elif op in _REPEATS and av[0] >= 1:
+      best = _better(best, required_literals(av[2], ignorecase))
+    elif _ATOMIC is not None and op is _ATOMIC:
+      best = _better(best, required_literals(av, ignorecase))
+    elif op is sre_constants.BRANCH:
+      branches = [required_literals(branch, ignorecase) for branch in av[1]]
+      if branches and all(branches):
+        best = _better(best, sorted({literal for branch in branches for literal in branch}))
+  flush()
+  return best
+
+def validate_keywords(keywords):
+  for keyword, _ in keywords:
+    if not isinstance(keyword, str) or not keyword.strip():
+      raise RuleError(f'关键词为空或不是字符串: {keyword!r}')
+
+def validate_rule(rule, ids):
+  """校验单条正则规则，返回 (编译后的正则, 语法树)"""
+  if not isinstance(rule, dict):
+    raise RuleError(f'正则规则必须是对象: {rule!r}')
+  for field in RULE_FIELDS:
+    if not isinstance(rule.get(field), str) or not rule[field]:
+      raise RuleError(f'正则规则 {rule.get("id")} 缺少字段: {field}')
+  if rule['id'] in ids:
+    raise RuleError(f'正则规则 id 重复: {rule["id"]}')
+  try:
+    compiled = re.compile(rule['regex'])
+    parsed = sre_parse.parse(rule['regex'])
+  except re.error as e:
+    raise RuleError(f'正则规则 {rule["id"]} 的表达式无效: {e}') from None
+  if parsed.getwidth()[0] == 0:
+    raise RuleError(f'正则规则 {rule["id"]} 可以匹配空串: {rule["regex"]}')
+  return compiled, parsed
+
+def matched_text(match, groups):
+  """与 re.findall 的返回值一致：没有分组时为整个匹配，一个分组时为该分组，多个分组时拼接非空分组"""
+  if groups == 0:
+    return match.group(0)
+  if groups == 1:
+    return match.group(1) or ''
+  return ''.join(str(group) for group in match.groups() if group)
+
+class RuleEngine:
+  def __init__(self, keywords, rules):
+    """
+    keywords: [(关键词, 分类)]，重复的关键词只保留第一次出现的分类
+    rules: regex.json 中的规则列表 [{id, name, regex, category}]
+    """
+    validate_keywords(keywords)
+    self.keywords = []
+    self.categories = {}
+    for keyword, category in keywords:
+      if keyword not in self.categories:
+        self.keywords.append(keyword)
+        self.categories[keyword] = category
+    self.rules = list(rules)
+    self._compiled = []
+    self._always = []
+    patterns = [(lower(keyword), ('keyword', keyword)) for keyword in self.keywords]
+    ids = set()
+    for index, rule in enumerate(self.rules):
+      compiled, parsed = validate_rule(rule, ids)
+      ids.add(rule['id'])
+      self._compiled.append(compiled)
+      literals = required_literals(parsed, bool(parsed.state.flags & re.IGNORECASE) or '(?i' in rule['regex'])
+      if literals is None:
+        self._always.append(index)
+      else:
+        patterns.extend((literal, ('rule', index)) for literal in literals)
+    self.prefiltered = len(self.rules) - len(self._always)
+    self._automaton = Automaton(patterns)
+
+  def scan(self, text):
+    """
+    扫描一遍正文，返回
+    {'keywords': {关键词: {category, count, spans}}, 'regex': {规则 id: {rule_name, category, count, matches}},
+     'total_keyword_matches', 'total_regex_matches', 'evaluated_rules'}
+    关键词计数与 re.findall 一致（同一关键词的命中不重叠），位置为原文偏移
+    """
+    text = text or ''
+    spans = {}
+    last_end = {}
+    candidates = set(self._always)
+    for start, end, (kind, value) in self._automaton.iter_matches(lower(text)):
+      if kind == 'rule':
+        candidates.add(value)
+      elif start >= last_end.get(value, 0):
+        spans.setdefault(value, []).append([start, end])
+        last_end[value] = end
+    keyword_result = {
+      keyword: {'category': self.categories[keyword], 'count': len(spans[keyword]), 'spans': spans[keyword]}
+      for keyword in self.keywords if keyword in spans
+    }
+    regex_result = {}
+    for index in sorted(candidates):
+      rule = self.rules[index]
+      compiled = self._compiled[index]
+      matches = [
+        {'matched_text': matched_text(match, compiled.groups), 'category': rule['category'], 'start': match.start(), 'end': match.end()}
+        for match in compiled.finditer(text)
+      ]
+      if matches:
+        regex_result[rule['id']] = {'rule_name': rule['name'], 'category': rule['category'], 'matches': matches, 'count': len(matches)}
+    return {
+      'keywords': keyword_result,
+      'regex': regex_result,
+      'total_keyword_matches': sum(item['count'] for item in keyword_result.values()),
+      'total_regex_matches': sum(item['count'] for item in regex_result.values()),
+      'evaluated_rules': len(candidates),
+    }
+
+def load_keywords(path):
+  """读取 rule.json：{"categories": [{"name": 分类, "keywords": [...]}]}"""
+  with open(path, 'r', encoding='utf-8') as f:
+    data = json.load(f)
+  keywords = []
+  for category in data['categories']:
+    name = category.get('name', category.get('category', ''))
+    keywords.extend((keyword, name) for keyword in category['keywords'])
+  return keywords
+
+def load_rules(path):
+  """读取 regex.json：{"rules": [{id, name, regex, category}]}"""
+  with open(path, 'r', encoding='utf-8') as f:
+    return json.load(f)['rules']
+
+_lock = threading.Lock()
+_cached = {}
+
+def get_engine(rule_path=RULE_PATH, regex_path=REGEX_PATH):
+  """获取进程内共享的规则引擎，任一规则文件变更后自动重新编译"""
+  mtimes = (os.path.getmtime(rule_path), os.path.getmtime(regex_path))
+  key = (rule_path, regex_path)
+  cached = _cached.get(key)
+  if cached and cached[0] == mtimes:
+    return cached[1]
+  with _lock:
+    cached = _cached.get(key)
+    if cached and cached[0] == mtimes:
+      return cached[1]
+    engine = RuleEngine(load_keywords(rule_path), load_rules(regex_path))
+    _cached[key] = (mtimes, engine)
+    return engine
+
+def naive_scan(text, keywords, rules):
+  """原 first_main 的逐条匹配（每个关键词一次 re.findall、每条规则一次 re.findall），用于基准对比"""
+  lowered = text.lower()
+  keyword_counts = {}
+  for keyword in keywords:
+    count = len(re.findall(re.escape(keyword.lower()), lowered))
+    if count:
+      keyword_counts[keyword] = count
+  rule_counts = {}
+  for rule in rules:
+    count = len(re.findall(rule['regex'], text))
+    if count:
+      rule_counts[rule['id']] = count
+  return keyword_counts, rule_counts
+
+def synthetic_rules(keyword_count, rule_count, seed=0):
+  """生成基准用的关键词与正则规则：大部分规则带有字面量前缀，约五分之一没有可提取的字面量"""
+  rng = random.Random(seed)
+  word = lambda low, high: ''.join(chr(0x4e00 + rng.randrange(3000)) for _ in range(rng.randint(low, high)))
+  keywords = [(word(2, 6), f'分类{index % 20}') for index in range(keyword_count)]
+  rules = []
+  for index in range(rule_count):
+    kind = index % 5
+    if kind == 0:
+      regex = rf'[A-Z]{{{rng.randint(2, 4)}}}\d{{{rng.randint(4, 8)}}}'
+    elif kind == 1:
+      regex = rf'{word(2, 4)}[A-Z]{{2}}\d{{3,6}}'
+    elif kind == 2:
+      regex = rf'(?:{word(2, 3)}|{word(2, 3)})第\d+号'
+    elif kind == 3:
+      regex = rf'({word(2, 3)})[一-龥]{{1,4}}({word(2, 3)})'
+    else:
+      regex = rf'{word(2, 3)}\s*[:：]\s*\d{{6,}}'
+    rules.append({'id': f'R{index:05d}', 'name': f'规则{index}', 'regex': regex, 'category': f'类别{index % 10}'})
+  return keywords, rules
+
+def synthetic_document(keywords, chars, seed):
+  """随机正文，按约每 200 字植入一个关键词和一个编号"""
+  rng = random.Random(seed)
+  parts = []
+  length = 0
+  while length < chars:
+    part = ''.join(chr(0x4e00 + rng.randrange(3000)) for _ in range(200))
+    part += keywords[rng.randrange(len(keywords))][0] + f'AB{rng.randrange(10 ** 6):06d}'
+    parts.append(part)
+    length += len(part)
+  return '\n'.join(parts)[:chars]
+
+def bench(keyword_count, rule_count, chars, documents):
+  keywords, rules = synthetic_rules(keyword_count, rule_count)
+  texts = [synthetic_document(keywords, chars, seed) for seed in range(documents)]
+  start = time.perf_counter()
+  engine = RuleEngine(keywords, rules)
+  compile_seconds = time.perf_counter() - start
+  print(f'{Fore.CYAN}{len(engine.keywords)} 个关键词，{len(rules)} 条正则规则（{engine.prefiltered} 条可预过滤），'
+        f'{documents} 篇 × {chars} 字；编译耗时 {compile_seconds:.3f}s{Style.RESET_ALL}')
+
+  start = time.perf_counter()
+  results = [engine.scan(text) for text in texts]
+  engine_seconds = time.perf_counter() - start
+  start = time.perf_counter()
+  baseline = [naive_scan(text, [keyword for keyword, _ in keywords], rules) for text in texts]
+  naive_seconds = time.perf_counter() - start
+
+  consistent = all(
+    {keyword: item['count'] for keyword, item in result['keywords'].items()} == keyword_counts
+    and {rule_id: item['count'] for rule_id, item in result['regex'].items()} == rule_counts
+    for result, (keyword_counts, rule_counts) in zip(results, baseline)
+  )
+  evaluated = sum(result['evaluated_rules'] for result in results) / documents
+  print(f'  规则引擎: {engine_seconds / documents * 1000:.2f}ms/篇（平均执行 {evaluated:.0f} 条正则）')
+  print(f'  逐条匹配: {naive_seconds / documents * 1000:.2f}ms/篇')
+  color = Fore.GREEN if consistent else Fore.RED
+  print(f'{color}{Style.BRIGHT}加速 {naive_seconds / engine_seconds:.1f}x，结果{"一致" if consistent else "不一致"}{Style.RESET_ALL}')
+  return {
+    'keywords': len(engine.keywords),
+    'rules': len(rules),
+    'prefiltered_rules': engine.prefiltered,
+    'chars': chars,
+    'documents': documents,
+    'compile_seconds': compile_seconds,
+    'engine_ms_per_document': engine_seconds / documents * 1000,
+    'naive_ms_per_document': naive_seconds / documents * 1000,
+    'evaluated_rules_per_document': evaluated,
+    'consistent': consistent,
+  }
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='关键词 + 正则规则单遍扫描')
+  parser.add_argument('files', nargs='*', help='待扫描的文本文件')
+  parser.add_argument('--rule-file', default=RULE_PATH, help='关键词规则文件（rule.json）')
+  parser.add_argument('--regex-file', default=REGEX_PATH, help='正则规则文件（regex.json）')
+  parser.add_argument('--bench', action='store_true', help='用合成规则与文档对比逐条匹配的耗时')
+  parser.add_argument('--keywords', type=int, default=2000, help='基准：关键词数')
+  parser.add_argument('--rules', type=int, default=500, help='基准：正则规则数')
+  parser.add_argument('--chars', type=int, default=20000, help='基准：每篇文档字数')
+  parser.add_argument('--documents', type=int, default=10, help='基准：文档篇数')
+  args = parser.parse_args(argv)
+
+  if args.bench:
+    return bench(args.keywords, args.rules, args.chars, args.documents)
+  try:
+    engine = get_engine(args.rule_file, args.regex_file)
+  except RuleError as e:
+    print(f'{Fore.RED}规则加载失败: {e}{Style.RESET_ALL}')
+    sys.exit(1)
+  for path in args.files:
+    with open(path, 'r', encoding='utf-8') as f:
+      result = engine.scan(f.read())
+    print(f'{Fore.GREEN}{path}: 关键词 {result["total_keyword_matches"]} 次，正则 {result["total_regex_matches"]} 次'
+          f'（执行 {result["evaluated_rules"]}/{len(engine.rules)} 条正则）{Style.RESET_ALL}')
+    for keyword, item in sorted(result['keywords'].items(), key=lambda pair: -pair[1]['count'])[:10]:
+      print(f'  [{item["category"]}] {keyword}: {item["count"]} 次')
+    for rule_id, item in result['regex'].items():
+      print(f'  [{item["category"]}] {item["rule_name"]}（{rule_id}）: {item["count"]} 次')
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,359 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from colorama import Fore,Back,Style
+import doc_records
+import ingest
+
+# 目录批量扫描：遍历目录树，用工作流并行判定每个文件，边扫描边把结果追加写入 JSONL，
+# 并在 SQLite 检查点中记录已完成的文件，中断后重新运行同一命令会跳过已完成（且大小、修改时间未变）的文件。
+# 扫描过程中实时输出进度、吞吐与预计剩余时间（总数由后台线程统计）。
+# 文件先在 ingest.py 的抽取进程池中解析为正文（txt / md / html / docx / pdf），再交给判定线程池；
+# 抽取耗时 extract_seconds 与判定耗时 classify_seconds 分开记录。
+# 判定成功的文件写入文档记录（doc_records.py，以路径为文档 id），关键词库变更后用 rescan.py 增量重扫。
+#
+# 用法：
+#   python lang-graph/scan.py docs/ --output scan.jsonl --concurrency 8
+#   python lang-graph/scan.py docs/ --output scan.jsonl --retry-errors     # 重新运行并重试失败的文件
+#
+# 结果先写入 JSONL 再提交检查点，进程被强制结束时最后一批文件可能在恢复后重复输出（至少一次）。
+
+DEFAULT_EXTENSIONS = ingest.SUPPORTED_EXTENSIONS
+
+def iter_files(root, extensions):
+  """按目录顺序流式遍历文件（不预先收集完整列表），返回 (路径, stat)；不跟随符号链接目录"""
+  stack = [root]
+  while stack:
+    directory = stack.pop()
+    try:
+      with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    except OSError as e:
+      print(f'\n{Fore.RED}无法读取目录 {directory}: {e}{Style.RESET_ALL}')
+      continue
+    subdirectories = []
+    for entry in entries:
+      if entry.name.startswith('.'):
+        continue
+      if entry.is_dir(follow_symlinks=False):
+        subdirectories.append(entry.path)
+      elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+        yield entry.path, entry.stat()
+    # 逆序入栈，保证按名称顺序深度优先遍历
+    stack.extend(reversed(subdirectories))
+
+class Checkpoint:
+  """已完成文件的检查点，按批提交"""
+
+  def __init__(self, path, commit_every=200):
+    self.path = path
+    self.commit_every = commit_every
+    self._pending = 0
+    self._last_commit = time.monotonic()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    self._conn = sqlite3.connect(path)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    self._conn.execute('''
+    CREATE TABLE IF NOT EXISTS files (
+      path TEXT PRIMARY KEY,
+      size INTEGER NOT NULL,
+      mtime REAL NOT NULL,
+      status TEXT NOT NULL,
+      result INTEGER,
+      error TEXT,
+      finished REAL NOT NULL
+    )
+    ''')
+    self._conn.commit()
+
+  def is_done(self, path, stat, retry_errors=False):
+    row = self._conn.execute('SELECT size, mtime, status FROM files WHERE path = ?', (path,)).fetchone()
+    if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime:
+      return False
+    return not (retry_errors and row[2] == 'error')
+
+  def record(self, path, stat, status, result=None, error=None):
+    self._conn.execute(
+      'INSERT OR REPLACE INTO files (path, size, mtime, status, result, error, finished) VALUES (?, ?, ?, ?, ?, ?, ?)',
+      (path, stat.st_size, stat.st_mtime, status, None if result is None else int(result), error, time.time()),
+    )
+    self._pending += 1
+    if self._pending >= self.commit_every or time.monotonic() - self._last_commit > 5:
+      self.commit()
+
+  def commit(self):
+    self._conn.commit()
+    self._pending = 0
+    self._last_commit = time.monotonic()
+
+  def counts(self):
+    return dict(self._conn.execute('SELECT status, COUNT(*) FROM files GROUP BY status').fetchall())
+
+  def close(self):
+    self.commit()
+    self._conn.close()
+
+class Progress:
+  """实时进度：已处理数、近期吞吐（滑动窗口）与预计剩余时间"""
+
+  def __init__(self, interval=1.0, window=30.0):
+    self.interval = interval
+    self.window = window
+    self.total = None
+    self.processed = 0
+    self.skipped = 0
+    self.errors = 0
+    self.secret = 0
+    self.start = time.monotonic()
+    self._samples = deque()
+    self._last_print = 0.0
+
+  def rate(self):
+    now = time.monotonic()
+    self._samples.append((now, self.processed))
+    while self._samples and now - self._samples[0][0] > self.window:
+      self._samples.popleft()
+    first_time, first_count = self._samples[0]
+    if now - first_time < 1e-6:
+      elapsed = now - self.start
+      return self.processed / elapsed if elapsed else 0.0
+    return (self.processed - first_count) / (now - first_time)
+
+  def line(self):
+    rate = self.rate()
+    done = self.processed + self.skipped
+    parts = [f'已处理 {self.processed}', f'跳过 {self.skipped}', f'失败 {self.errors}', f'涉密 {self.secret}', f'{rate:.2f} 篇/秒']
+    if self.total is not None:
+      remaining = max(0, self.total - done)
+      eta = remaining / rate if rate > 0 else float('inf')
+      parts.insert(0, f'{done}/{self.total} ({done / self.total * 100 if self.total else 100:.1f}%)')
+      parts.append(f'剩余 {format_seconds(eta)}')
+    else:
+      parts.append('统计总数中...')
+    return '  '.join(parts)
+
+  def tick(self, force=False):
+    now = time.monotonic()
+    if force or now - self._last_print >= self.interval:
+      self._last_print = now
+      sys.stderr.write(f'\r{Fore.CYAN}{self.line()}{Style.RESET_ALL}\033[K')
+      sys.stderr.flush()
+
+def format_seconds(seconds):
+  if seconds == float('inf'):
+    return '--'
+  seconds = int(seconds)
+  hours, rest = divmod(seconds, 3600)
+  minutes, seconds = divmod(rest, 60)
+  return f'{hours}:{minutes:02d}:{seconds:02d}' if hours else f'{minutes}:{seconds:02d}'
+
+def error_record(path, stage, error, **extra):
+  return {
+    'path': path,
+    'doc_title': os.path.splitext(os.path.basename(path))[0],
+    'status': 'error',
+    'stage': stage,
+    'error': f'{type(error).__name__}: {error}',
+    **extra,
+  }
+
+def classify_document(document):
+  """判定一个已抽取的文档，失败只影响该文件"""
+  from main import invoke
+  metadata = document['metadata']
+  record = {
+    'path': metadata['path'],
+    'doc_title': document['doc_title'],
+    'format': metadata['format'],
+    'pages': metadata['pages'],
+    'truncated': metadata['truncated'],
+    'extract_seconds': metadata['extract_seconds'],
+  }
+  start = time.perf_counter()
+  try:
+    if not document['doc_content']:
+      raise ValueError('文件内容为空')
+    final_state = invoke(document['doc_title'], document['doc_content'], doc_metadata=metadata)
+  except Exception as e:
+    record.update(error_record(metadata['path'], 'classify', e, doc_title=document['doc_title']))
+    record['classify_seconds'] = time.perf_counter() - start
+    return record
+  try:
+    doc_records.record(metadata['path'], document['doc_title'], document['doc_content'], final_state)
+  except Exception as e:
+    print(f'\n{Fore.YELLOW}写入文档记录失败 {metadata["path"]}: {e}{Style.RESET_ALL}')
+  record.update({
+    'status': 'ok',
+    'result': bool(final_state.get('result')),
+    'result_confidence': final_state.get('result_confidence', 0),
+    'result_detail': final_state.get('result_detail', ''),
+    'fired_policies': final_state.get('fired_policies', []),
+    'degraded_agents': final_state.get('degraded_agents', []),
+    'classify_seconds': time.perf_counter() - start,
+  })
+  return record
+
+def count_files(root, extensions, progress, stopped):
+  total = 0
+  for _ in iter_files(root, extensions):
+    if stopped.is_set():
+      return
+    total += 1
+  progress.total = total
+
+def scan(root, output, checkpoint_path, concurrency=4, extensions=DEFAULT_EXTENSIONS, max_bytes=10 * 1024 * 1024,
+         retry_errors=False, count=True, extract_workers=None):
+  """扫描目录并返回汇总信息"""
+  checkpoint = Checkpoint(checkpoint_path)
+  progress = Progress()
+  stopped = threading.Event()
+  if count:
+    threading.Thread(target=count_files, args=(root, extensions, progress, stopped), daemon=True).start()
+  # future -> (阶段, 路径, stat)
+  pending = {}
+  timings = {'extract': 0.0, 'classify': 0.0}
+  interrupted = False
+
+  def write(out, path, stat, record):
+    record['size'] = stat.st_size
+    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+    progress.processed += 1
+    timings['extract'] += record.get('extract_seconds', 0.0)
+    timings['classify'] += record.get('classify_seconds', 0.0)
+    if record['status'] == 'ok':
+      progress.secret += int(record['result'])
+    else:
+      progress.errors += 1
+
+  def collect(done, out, executor):
+    finished = []
+    for future in done:
+      stage, path, stat = pending.pop(future)
+      if future.cancelled():
+        continue
+      if stage == 'extract':
+        try:
+          document = future.result()
+        except Exception as e:
+          record = error_record(path, 'extract', e)
+        else:
+          # 抽取完成后交给判定线程池
+          pending[executor.submit(classify_document, document)] = ('classify', path, stat)
+          continue
+      else:
+        record = future.result()
+      write(out, path, stat, record)
+      finished.append((path, stat, record))
+    # 结果写入磁盘后再记录检查点
+    out.flush()
+    for path, stat, record in finished:
+      checkpoint.record(path, stat, record['status'], record.get('result'), record.get('error'))
+
+  extractor = ingest.Extractor(workers=extract_workers)
+  with open(output, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+    try:
+      for path, stat in iter_files(root, extensions):
+        if checkpoint.is_done(path, stat, retry_errors):
+          progress.skipped += 1
+          progress.tick()
+          continue
+        if stat.st_size > max_bytes:
+          record = error_record(path, 'extract', ValueError(f'文件超过 {max_bytes} 字节'))
+          write(out, path, stat, record)
+          # 与正常路径一致：结果写入磁盘后再记录检查点
+          out.flush()
+          checkpoint.record(path, stat, 'error', error=record['error'])
+          continue
+        # 在途文件数（抽取中 + 判定中）有上限，遍历数百万文件时内存占用保持稳定
+        while len(pending) >= concurrency * 2:
+          done, _ = wait(pending, timeout=progress.interval, return_when=FIRST_COMPLETED)
+          collect(done, out, executor)
+          progress.tick()
+        pending[extractor.submit(path)] = ('extract', path, stat)
+      while pending:
+        done, _ = wait(pending, timeout=progress.interval, return_when=FIRST_COMPLETED)
+        collect(done, out, executor)
+        progress.tick()
+    except KeyboardInterrupt:
+      interrupted = True
+      sys.stderr.write(f'\n{Fore.YELLOW}中断：等待判定中的文件完成后保存检查点...{Style.RESET_ALL}\n')
+      # 抽取中的文件下次重新处理，已开始判定的文件等待完成
+      for future, (stage, _, _) in list(pending.items()):
+        if stage == 'extract' or future.cancel():
+          pending.pop(future)
+      if pending:
+        collect(wait(pending).done, out, executor)
+    finally:
+      stopped.set()
+      extractor.close(cancel=True)
+      progress.tick(force=True)
+      sys.stderr.write('\n')
+      checkpoint.close()
+
+  elapsed = time.monotonic() - progress.start
+  return {
+    'root': root,
+    'output': output,
+    'checkpoint': checkpoint_path,
+    'processed': progress.processed,
+    'skipped': progress.skipped,
+    'errors': progress.errors,
+    'secret': progress.secret,
+    'total': progress.total,
+    'wall_seconds': elapsed,
+    'documents_per_second': progress.processed / elapsed if elapsed else 0.0,
+    'extract_seconds': timings['extract'],
+    'classify_seconds': timings['classify'],
+    'interrupted': interrupted,
+  }
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='目录批量扫描（可中断续扫）')
+  parser.add_argument('root', help='要扫描的目录')
+  parser.add_argument('--output', required=True, help='JSONL 结果文件（追加写入）')
+  parser.add_argument('--checkpoint', help='检查点数据库路径，默认 <output>.checkpoint.db')
+  parser.add_argument('--concurrency', type=int, default=4, help='并行判定的文件数')
+  parser.add_argument('--ext', action='append', help='扫描的扩展名，可重复指定，默认 ingest.py 支持的全部格式')
+  parser.add_argument('--extract-workers', type=int, help='抽取进程数，默认 INGEST_WORKERS')
+  parser.add_argument('--max-bytes', type=int, default=10 * 1024 * 1024, help='跳过超过该大小的文件')
+  parser.add_argument('--retry-errors', action='store_true', help='重新判定检查点中失败的文件')
+  parser.add_argument('--no-count', action='store_true', help='不统计文件总数（不显示预计剩余时间）')
+  args = parser.parse_args(argv)
+
+  if not os.path.isdir(args.root):
+    parser.error(f'目录不存在: {args.root}')
+  extensions = DEFAULT_EXTENSIONS
+  if args.ext:
+    extensions = tuple(ext.lower() if ext.startswith('.') else f'.{ext.lower()}' for ext in args.ext)
+    unsupported = [ext for ext in extensions if ext not in ingest.SUPPORTED_EXTENSIONS]
+    if unsupported:
+      parser.error(f'不支持的扩展名: {", ".join(unsupported)}')
+
+  summary = scan(
+    os.path.abspath(args.root),
+    args.output,
+    args.checkpoint or f'{args.output}.checkpoint.db',
+    concurrency=args.concurrency,
+    extensions=extensions,
+    max_bytes=args.max_bytes,
+    retry_errors=args.retry_errors,
+    count=not args.no_count,
+    extract_workers=args.extract_workers,
+  )
+  color = Fore.YELLOW if summary['interrupted'] else Fore.GREEN
+  print(f'{color}{Style.BRIGHT}扫描{"中断" if summary["interrupted"] else "完成"}:{Style.RESET_ALL} '
+        f'处理 {summary["processed"]}，跳过 {summary["skipped"]}，失败 {summary["errors"]}，涉密 {summary["secret"]}')
+  print(f'{Fore.CYAN}总耗时: {summary["wall_seconds"]:.2f}s  吞吐: {summary["documents_per_second"]:.2f} 篇/秒{Style.RESET_ALL}')
+  if summary['processed']:
+    print(f'{Fore.CYAN}抽取耗时: 合计 {summary["extract_seconds"]:.2f}s（平均 {summary["extract_seconds"] / summary["processed"] * 1000:.1f}ms）  '
+          f'判定耗时: 合计 {summary["classify_seconds"]:.2f}s（平均 {summary["classify_seconds"] / summary["processed"] * 1000:.1f}ms）{Style.RESET_ALL}')
+  return summary
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,114 @@
+import json
+import os
+import time
+import zlib
+
+# SSE 合并输出：大模型 token 先缓冲，超过时间窗口或字节数后合并为一条 stream_token 消息发送，
+# 避免每个 token 单独序列化、单独写一次 socket；其他事件到来前先冲刷已缓冲的 token，保证顺序不变。
+# 可选 gzip 压缩（每次写出都 Z_SYNC_FLUSH，客户端能立即解出已发送的内容）。
+#
+# 配置（环境变量）：
+#   SSE_FLUSH_MS          token 缓冲的最长时间（毫秒），默认 50；0 表示每个 token 立即发送
+#   SSE_FLUSH_BYTES       token 缓冲的最大字节数，默认 4096
+#   SSE_COMPRESSION       gzip 开启压缩（仅当客户端 Accept-Encoding 包含 gzip），默认 off
+#
+# 时间窗口在收到下一个 token 或事件时检查，不使用定时线程；大模型停顿时缓冲的 token 会在下一次写入时发出。
+
+SSE_FLUSH_MS = float(os.getenv('SSE_FLUSH_MS', '50'))
+SSE_FLUSH_BYTES = int(os.getenv('SSE_FLUSH_BYTES', '4096'))
+SSE_COMPRESSION = os.getenv('SSE_COMPRESSION', 'off')
+
+def format_event(payload):
+  """格式化一条 SSE 消息"""
+  return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def accepts_gzip(accept_encoding):
+  return SSE_COMPRESSION == 'gzip' and 'gzip' in (accept_encoding or '').lower()
+
+class SSEWriter:
+  def __init__(self, flush_ms=None, flush_bytes=None, compress=False):
+    self.flush_seconds = (SSE_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+    self.flush_bytes = SSE_FLUSH_BYTES if flush_bytes is None else flush_bytes
+    self.compress = compress
+    self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    self._node = None
+    self._tokens = []
+    self._size = 0
+    self._since = 0.0
+    self._started = set()
+    self.frames = 0
+
+  def headers(self):
+    """响应头：禁止代理缓冲，压缩时声明 Content-Encoding"""
+    headers = {
+      'Cache-Control': 'no-cache',
+      'X-Accel-Buffering': 'no',
+    }
+    if self.compress:
+      headers['Content-Encoding'] = 'gzip'
+    return headers
+
+  def token(self, node, text):
+    """缓冲一个 token，达到时间窗口或字节数时返回待写出的数据，否则返回空"""
+    if not text:
+      return self._encode('')
+    pending = ''
+    if self._tokens and node != self._node:
+      pending = self._drain()
+    if not self._tokens:
+      self._node = node
+      self._since = time.monotonic()
+    self._tokens.append(text)
+    self._size += len(text.encode('utf-8'))
+    # 每个节点的第一个 token 立即发送，不增加首字延迟
+    if node not in self._started or self._size >= self.flush_bytes or time.monotonic() - self._since >= self.flush_seconds:
+      self._started.add(node)
+      pending += self._drain()
+    return self._encode(pending)
+
+  def event(self, payload):
+    """先冲刷缓冲的 token，再写出一条事件"""
+    return self._encode(self._drain() + self._frame(payload))
+
+  def events(self, payloads):
+    """一次写出多条事件（例如缓存回放）"""
+    return self._encode(self._drain() + ''.join(self._frame(payload) for payload in payloads))
+
+  def flush(self):
+    return self._encode(self._drain())
+
+  def close(self):
+    """写出剩余 token 并结束压缩流"""
+    data = self.flush()
+    if self._compressor is not None:
+      data += self._compressor.flush(zlib.Z_FINISH)
+      self._compressor = None
+    return data
+
+  def _frame(self, payload):
+    self.frames += 1
+    return format_event(payload)
+
+  def _drain(self):
+    if not self._tokens:
+      return ''
+    frame = self._frame({'type': 'stream_token', 'node': self._node, 'token': ''.join(self._tokens)})
+    self._tokens = []
+    self._size = 0
+    return frame
+
+  def _encode(self, text):
+    if self._compressor is None:
+      return text
+    if not text:
+      return b''
+    return self._compressor.compress(text.encode('utf-8')) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+def stream(writer, frames):
+  """过滤掉空数据块，结束时写出剩余内容"""
+  for data in frames:
+    if data:
+      yield data
+  tail = writer.close()
+  if tail:
+    yield tail
@@ -0,0 +1,255 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# 结构化观测：OpenTelemetry 风格的追踪 span（trace_id / span_id / parent_span_id、属性、事件），
+# 以及 Prometheus 文本格式的指标注册表（app.py 的 /metrics 接口输出）。
+# 工作流节点、大模型调用、线程池排队、路由与策略都在这里记录，用于定位慢文档慢在哪个节点。
+#
+# 配置（环境变量）：
+#   TRACE_BUFFER    内存中保留的最近 span 数（/traces 接口查询），默认 2000
+#   TRACE_FILE      设置后把结束的 span 以 JSONL 追加写入该文件，便于导入其他追踪系统
+
+TRACE_BUFFER = int(os.getenv('TRACE_BUFFER', '2000'))
+TRACE_FILE = os.getenv('TRACE_FILE')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _escape(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values, extra=()):
+  pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+  pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+  return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_number(value):
+  if value == float('inf'):
+    return '+Inf'
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+  def __init__(self, name, help, labelnames=()):
+    self.name = name
+    self.help = help
+    self.labelnames = tuple(labelnames)
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def inc(self, amount=1, **labels):
+    key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+    with self._lock:
+      for key, value in sorted(self._values.items()):
+        lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}')
+    return lines
+
+class Gauge(Counter):
+  def set(self, value, **labels):
+    key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+    with self._lock:
+      self._values[key] = value
+
+  def render(self):
+    lines = super().render()
+    lines[1] = f'# TYPE {self.name} gauge'
+    return lines
+
+class Histogram:
+  def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    self.name = name
+    self.help = help
+    self.labelnames = tuple(labelnames)
+    self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def observe(self, value, **labels):
+    key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+    with self._lock:
+      counts = self._values.get(key)
+      if counts is None:
+        counts = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+      for index, bound in enumerate(self.buckets):
+        if value <= bound:
+          counts['buckets'][index] += 1
+          break
+      counts['sum'] += value
+      counts['count'] += 1
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+    with self._lock:
+      for key, counts in sorted(self._values.items()):
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts['buckets']):
+          cumulative += count
+          labels = _format_labels(self.labelnames, key, [('le', _format_number(bound))])
+          lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_number(counts["sum"])}')
+        lines.append(f'{self.name}_count{labels} {counts["count"]}')
+    return lines
+
+class Registry:
+  def __init__(self):
+    self._metrics = []
+
+  def counter(self, name, help, labelnames=()):
+    metric = Counter(name, help, labelnames)
+    self._metrics.append(metric)
+    return metric
+
+  def gauge(self, name, help, labelnames=()):
+    metric = Gauge(name, help, labelnames)
+    self._metrics.append(metric)
+    return metric
+
+  def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, help, labelnames, buckets)
+    self._metrics.append(metric)
+    return metric
+
+  def render(self):
+    """Prometheus 文本格式（0.0.4）"""
+    lines = []
+    for metric in self._metrics:
+      lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+NODE_SECONDS = REGISTRY.histogram('classifier_node_duration_seconds', '工作流节点耗时', ['node'])
+NODE_SKIPPED = REGISTRY.counter('classifier_node_skipped_total', '被路由策略跳过的节点次数', ['node'])
+NODE_ERRORS = REGISTRY.counter('classifier_node_errors_total', '工作流节点异常次数', ['node'])
+QUEUE_SECONDS = REGISTRY.histogram('classifier_executor_queue_seconds', '任务在线程池中的排队时间', ['pool'])
+LLM_REQUESTS = REGISTRY.counter('classifier_llm_requests_total', '大模型调用次数（按缓存命中与否）', ['agent', 'cache'])
+LLM_SECONDS = REGISTRY.histogram('classifier_llm_duration_seconds', '大模型调用耗时（不含缓存命中）', ['agent', 'mode'])
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.histogram('classifier_llm_first_token_seconds', '流式调用首 token 延迟', ['agent'])
+LLM_TOKENS = REGISTRY.counter('classifier_llm_tokens_total', '大模型 token 数', ['agent', 'kind'])
+LLM_ERRORS = REGISTRY.counter('classifier_llm_errors_total', '大模型调用异常次数', ['agent'])
+LLM_RETRIES = REGISTRY.counter('classifier_llm_retries_total', '大模型调用重试次数', ['agent', 'reason'])
+LLM_HEDGES = REGISTRY.counter('classifier_llm_hedges_total', '大模型对冲请求次数（winner 为先返回的请求）', ['agent', 'winner'])
+LLM_UNAVAILABLE = REGISTRY.counter('classifier_llm_unavailable_total', '大模型不可用（熔断、超过截止时间或重试耗尽）次数', ['agent', 'reason'])
+CIRCUIT_STATE = REGISTRY.gauge('classifier_llm_circuit_state', '熔断器状态：0 关闭，1 半开，2 打开', ['agent'])
+DEGRADED = REGISTRY.counter('classifier_degraded_total', '大模型不可用时降级处理的智能体次数', ['agent'])
+RATE_LIMIT_WAIT = REGISTRY.histogram('classifier_rate_limit_wait_seconds', '上游配额限流的排队时间', ['model'])
+PARSE_FAILURES = REGISTRY.counter('classifier_parse_failures_total', '大模型响应解析失败次数', ['agent'])
+ROUTE_DECISIONS = REGISTRY.counter('classifier_route_decisions_total', '关键词检测后的路由结果', ['next'])
+POLICY_FIRED = REGISTRY.counter('classifier_policy_fired_total', '路由策略触发次数', ['policy'])
+JOBS = REGISTRY.counter('classifier_jobs_total', '后台任务结束次数', ['status'])
+NEAR_DUP = REGISTRY.counter('classifier_near_dup_total', '近似文档查找结果（miss / reuse / partial / full）', ['outcome'])
+TRIAGE = REGISTRY.counter('classifier_triage_total', '本地分诊结果（public / secret 为直接判定，uncertain 交给工作流）', ['outcome'])
+TRIAGE_SECONDS = REGISTRY.histogram('classifier_triage_duration_seconds', '本地分诊耗时', buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+DOCUMENT_SECONDS = REGISTRY.histogram('classifier_document_duration_seconds', '单篇文档端到端耗时（outcome 为判定来源：cache / near_dup / triage / workflow，后台任务为任务状态）', ['entry', 'outcome'])
+
+def render_metrics():
+  return REGISTRY.render()
+
+# ---- 追踪 ----
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_finished = deque(maxlen=TRACE_BUFFER)
+_file_lock = threading.Lock()
+
+class Span:
+  def __init__(self, name, attributes=None, parent=None):
+    self.name = name
+    self.parent = parent
+    self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+    self.span_id = uuid.uuid4().hex[:16]
+    self.attributes = dict(attributes or {})
+    self.events = []
+    self.status = 'OK'
+    self.start_ns = time.time_ns()
+    self._start = time.perf_counter()
+    self.duration = None
+
+  def set_attribute(self, key, value):
+    self.attributes[key] = value
+
+  def set_attributes(self, **attributes):
+    self.attributes.update(attributes)
+
+  def add_event(self, name, **attributes):
+    self.events.append({'name': name, 'time_unix_nano': time.time_ns(), 'attributes': attributes})
+
+  def record_exception(self, error):
+    self.status = 'ERROR'
+    self.add_event('exception', type=type(error).__name__, message=str(error))
+
+  def end(self):
+    if self.duration is not None:
+      return
+    self.duration = time.perf_counter() - self._start
+    record = self.to_dict()
+    _finished.append(record)
+    if TRACE_FILE:
+      with _file_lock:
+        with open(TRACE_FILE, 'a', encoding='utf-8') as f:
+          f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+  def to_dict(self):
+    return {
+      'name': self.name,
+      'trace_id': self.trace_id,
+      'span_id': self.span_id,
+      'parent_span_id': self.parent.span_id if self.parent else None,
+      'start_time_unix_nano': self.start_ns,
+      'end_time_unix_nano': self.start_ns + int((self.duration or 0) * 1e9),
+      'duration_seconds': self.duration,
+      'attributes': self.attributes,
+      'events': self.events,
+      'status': self.status,
+    }
+
+def current_span():
+  return _current_span.get()
+
+def start_span(name, **attributes):
+  """创建以当前 span 为父节点的 span，但不设为当前 span（用于生成器等跨越多次调用的场景），需手动 end()"""
+  return Span(name, attributes, _current_span.get())
+
+@contextmanager
+def span(name, **attributes):
+  """在 with 块内设为当前 span，块内创建的 span 自动成为其子节点"""
+  current = Span(name, attributes, _current_span.get())
+  token = _current_span.set(current)
+  try:
+    yield current
+  except BaseException as e:
+    current.record_exception(e)
+    raise
+  finally:
+    _current_span.reset(token)
+    current.end()
+
+def add_event(name, **attributes):
+  """给当前 span 添加事件（没有当前 span 时忽略）"""
+  current = _current_span.get()
+  if current is not None:
+    current.add_event(name, **attributes)
+
+def recent_spans(trace_id=None, limit=200):
+  spans = [record for record in list(_finished) if trace_id is None or record['trace_id'] == trace_id]
+  return spans[-limit:]
+
+def submit(executor, pool, fn, *args):
+  """提交到线程池：记录排队时间，并把当前上下文（追踪 span）带入工作线程"""
+  context = contextvars.copy_context()
+  enqueued = time.perf_counter()
+
+  def run():
+    QUEUE_SECONDS.observe(time.perf_counter() - enqueued, pool=pool)
+    return context.run(fn, *args)
+
+  return executor.submit(run)
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# 测试直接导入 lang-graph 下的模块（与 python lang-graph/xxx.py 运行时一致）
+LANG_GRAPH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if LANG_GRAPH_DIR not in sys.path:
+  sys.path.insert(0, LANG_GRAPH_DIR)
+
+# 缓存、队列与限流数据库写到临时目录，不污染 lang-graph/.cache；必须在导入各模块之前设置
+os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='lang-graph-tests-'))
@@ -0,0 +1,51 @@
+import pytest
+from chunker import chunk_document, estimate_tokens, split_sentences
+
+def test_estimate_tokens():
+  assert estimate_tokens('涉密文件') == 4
+  assert estimate_tokens('abcdefgh') == 2
+  assert estimate_tokens('文件abc') == 3
+
+def test_split_sentences_keeps_paragraph_breaks():
+  assert split_sentences('第一句。第二句！\n\n第三段？') == ['第一句。', '第二句！\n\n', '第三段？']
+
+def test_short_document_is_a_single_chunk():
+  assert chunk_document('短文档。', max_tokens=100) == ['短文档。']
+  assert chunk_document(None, max_tokens=100) == ['']
+
+def test_chunks_respect_budget_and_cover_every_sentence():
+  sentences = [f'第{index:02d}句内容。' for index in range(40)]
+  chunks = chunk_document(''.join(sentences), max_tokens=30, overlap_tokens=8)
+  assert len(chunks) > 1
+  assert all(estimate_tokens(chunk) <= 30 for chunk in chunks)
+  assert all(any(sentence in chunk for chunk in chunks) for sentence in sentences)
+
+def test_adjacent_chunks_overlap():
+  chunks = chunk_document(''.join(f'第{index:02d}句内容。' for index in range(40)), max_tokens=30, overlap_tokens=8)
+  for previous, current in zip(chunks, chunks[1:]):
+    first_sentence = current.split('。')[0] + '。'
+    assert first_sentence in previous
+
+def test_sentence_without_punctuation_is_hard_split():
+  chunks = chunk_document('密' * 250, max_tokens=100, overlap_tokens=0)
+  assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+
+def test_reduce_chunks_any_secret_chunk_wins():
+  agents = pytest.importorskip('agents')
+  results = {
+    0: {'result': False, 'confidence': 80, 'evidence': ['公开内容']},
+    2: {'result': True, 'confidence': 70, 'evidence': '涉密段落'},
+    3: {'result': True, 'confidence': 90, 'evidence': []},
+  }
+  reduced = agents.reduce_chunks(results, 4, True, failed=1)
+  assert reduced['result'] is True
+  assert reduced['confidence'] == 90
+  assert reduced['evidence'][:2] == ['[第 1/4 部分] 公开内容', '[第 3/4 部分] 涉密段落']
+  assert '1/4 部分分析失败，结论只依据其余部分' in reduced['evidence']
+
+def test_reduce_chunks_all_public_takes_lowest_confidence():
+  agents = pytest.importorskip('agents')
+  results = {0: {'result': True, 'confidence': 95, 'evidence': []}, 1: {'result': True, 'confidence': 60, 'evidence': []}}
+  # 非涉密证明：result 为 False 表示涉密
+  reduced = agents.reduce_chunks(results, 2, False)
+  assert reduced == {'result': True, 'confidence': 60, 'evidence': []}
@@ -0,0 +1,73 @@
+import os
+import decision_engine
+from decision_engine import decide, needs_llm, render_report, render_weights, secret_score
+
+CONFIG = {
+  'weights': {'agent_keyword': 0.4, 'agent_semantics': 0.3, 'agent_non_secret_proof': 0.3},
+  'secret_threshold': 50,
+  'ambiguity_band': 10,
+  'llm_on_ambiguity': True,
+}
+
+def state(keyword=None, semantics=None, proof=None):
+  """每个参数为 (result, confidence)，None 表示该智能体未执行"""
+  fields = {}
+  for agent_name, value in (('agent_keyword', keyword), ('agent_semantics', semantics), ('agent_non_secret_proof', proof)):
+    if value is not None:
+      fields[f'{agent_name}_result'], fields[f'{agent_name}_confidence'] = value
+      fields[f'{agent_name}_detail'] = ['证据']
+  return fields
+
+def test_secret_score():
+  assert secret_score(state(semantics=(True, 80)), 'agent_semantics') == 80
+  assert secret_score(state(semantics=(False, 80)), 'agent_semantics') == 20
+  # 非涉密证明为 False 表示无法证明非涉密
+  assert secret_score(state(proof=(False, 70)), 'agent_non_secret_proof') == 70
+  assert secret_score(state(keyword=(False, 90)), 'agent_keyword') == 10
+  assert secret_score(state(keyword=(False, 30)), 'agent_keyword') == 30
+
+def test_unanimous_secret():
+  decision = decide(state((True, 90), (True, 80), (False, 70)), CONFIG)
+  assert decision['result'] is True
+  assert decision['score'] == 0.4 * 90 + 0.3 * 80 + 0.3 * 70
+  assert decision['result_confidence'] == 81
+  assert decision['ambiguous'] is False
+
+def test_agents_that_did_not_run_are_excluded():
+  decision = decide(state(semantics=(False, 90)), CONFIG)
+  assert decision['votes'] == {'agent_semantics': 10}
+  assert decision['result'] is False
+  assert decision['result_confidence'] == 90
+
+def test_disagreement_near_threshold_is_ambiguous():
+  decision = decide(state((True, 60), (False, 60), (True, 60)), CONFIG)
+  assert 40 < decision['score'] < 60
+  assert decision['ambiguous'] is True
+  assert needs_llm(decision, CONFIG) is True
+  assert needs_llm(decision, dict(CONFIG, llm_on_ambiguity=False)) is False
+
+def test_nothing_ran_is_ambiguous_public():
+  assert decide({}, CONFIG) == {'result': False, 'result_confidence': 0, 'score': 0.0, 'ambiguous': True, 'votes': {}}
+
+def test_render_weights_follows_config():
+  config = dict(CONFIG, weights={'agent_keyword': 0.5, 'agent_semantics': 0.25, 'agent_non_secret_proof': 0.25})
+  assert render_weights(config).splitlines() == [
+    '关键词匹配 (M1) 权重： 50%',
+    '语义推断 (M2) 权重： 25%',
+    '非涉密证明 (M3) 权重： 25%',
+  ]
+
+def test_render_report_lists_every_rule():
+  decision = decide(state((True, 90), None, (True, 80)), CONFIG)
+  report = render_report(decision, CONFIG)
+  assert report.startswith('最终裁决：')
+  assert '规则 2 (语义推断) 检查结果：未执行' in report
+  assert '规则 1 (关键词匹配) 检查结果：满足（涉密得分 90，权重 40%）' in report
+
+def test_load_config_reloads_on_change(tmp_path):
+  path = tmp_path / 'decision.json'
+  path.write_text('{"weights": {}}', encoding='utf-8')
+  assert decision_engine.load_config(str(path)) == {'weights': {}}
+  path.write_text('{"weights": {"agent_keyword": 1}}', encoding='utf-8')
+  os.utime(path, (1, 1))
+  assert decision_engine.load_config(str(path)) == {'weights': {'agent_keyword': 1}}
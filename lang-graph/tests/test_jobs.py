@@ -0,0 +1,94 @@
+import time
+import pytest
+import jobs
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+  # 重试不退避，便于立即重新领取
+  monkeypatch.setattr(jobs, 'JOB_RETRY_BASE', 0.0)
+  return jobs.JobStore(str(tmp_path / 'jobs.db'))
+
+def expire_lease(store, job_id):
+  with store._lock:
+    store._conn.execute('UPDATE jobs SET lease_until = ? WHERE id = ?', (time.time() - 1, job_id))
+
+@pytest.mark.parametrize('max_attempts', ['3', 2.5, True, 0, -1])
+def test_submit_rejects_invalid_max_attempts(store, max_attempts):
+  with pytest.raises(ValueError):
+    store.submit('标题', '正文', max_attempts)
+  assert store.counts()['queued'] == 0
+
+def test_claim_returns_queued_job_once(store):
+  job_id = store.submit('标题', '正文')
+  job = store.claim('w1')
+  assert job['id'] == job_id
+  assert job['attempt'] == 1
+  assert job['doc_content'] == '正文'
+  assert store.claim('w2') is None
+  assert store.get(job_id)['status'] == 'running'
+
+def test_fail_requeues_until_max_attempts(store):
+  job_id = store.submit('标题', '正文', max_attempts=2)
+  store.claim('w1')
+  assert store.fail(job_id, 'w1', 'boom') == 'queued'
+  job = store.claim('w1')
+  assert job['attempt'] == 2
+  assert store.fail(job_id, 'w1', 'boom') == 'failed'
+  assert store.get(job_id)['status'] == 'failed'
+  assert store.claim('w1') is None
+
+def test_expired_lease_is_reclaimed_as_new_attempt(store):
+  job_id = store.submit('标题', '正文', max_attempts=3)
+  store.claim('w1')
+  expire_lease(store, job_id)
+  job = store.claim('w2')
+  assert job['id'] == job_id
+  assert job['attempt'] == 2
+  # 原工作线程的结果不再写入
+  store.finish(job_id, 'w1', 'succeeded', result={'result': True})
+  assert store.get(job_id)['status'] == 'running'
+  store.finish(job_id, 'w2', 'succeeded', result={'result': False})
+  assert store.get(job_id)['result'] == {'result': False}
+
+def test_expired_lease_at_max_attempts_fails(store):
+  job_id = store.submit('标题', '正文', max_attempts=1)
+  store.claim('w1')
+  expire_lease(store, job_id)
+  assert store.claim('w2') is None
+  job = store.get(job_id)
+  assert job['status'] == 'failed'
+  assert job['attempts'] == 1
+
+def test_cancel_queued_job(store):
+  job_id = store.submit('标题', '正文')
+  assert store.cancel(job_id) == 'cancelled'
+  assert store.claim('w1') is None
+  assert store.cancel('missing') is None
+
+def test_cancel_running_job_stops_at_next_progress(store):
+  job_id = store.submit('标题', '正文')
+  store.claim('w1')
+  assert store.add_progress(job_id, 'w1', {'node': 'agent_keyword'}) is False
+  assert store.cancel(job_id) == 'running'
+  assert store.add_progress(job_id, 'w1', {'node': 'agent_semantics'}) is True
+  assert store.fail(job_id, 'w1', '已取消') == 'cancelled'
+  assert [entry['node'] for entry in store.get(job_id)['progress']] == ['agent_keyword', 'agent_semantics']
+
+def test_run_errors_do_not_kill_worker(store, monkeypatch):
+  calls = []
+  def run_job(store, worker, job):
+    calls.append(job['id'])
+    raise RuntimeError('database is locked')
+  monkeypatch.setattr(jobs, 'run_job', run_job)
+  job_id = store.submit('标题', '正文')
+  pool = jobs.WorkerPool(store, 1)
+  pool.start()
+  try:
+    deadline = time.time() + 5
+    while not calls and time.time() < deadline:
+      time.sleep(0.05)
+    assert calls == [job_id]
+    time.sleep(0.1)
+    assert all(thread.is_alive() for thread in pool._threads)
+  finally:
+    pool.stop(timeout=5)
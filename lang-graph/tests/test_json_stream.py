@@ -0,0 +1,61 @@
+import pytest
+from json_stream import IncrementalJSONParser, JSONExtractError, agent_parser, parse_decision, parse_llm_json, to_bool, to_int
+
+def feed_all(text, size):
+  parser = IncrementalJSONParser()
+  completed = []
+  for index in range(0, len(text), size):
+    completed.append(parser.feed(text[index:index + size]))
+  completed.append(parser.close())
+  return parser, [fields for fields in completed if fields]
+
+@pytest.mark.parametrize('size', [1, 3, 7, 1000])
+def test_fields_complete_in_order_regardless_of_chunking(size):
+  text = '好的，结果如下：\n```json\n{"result": true, "result_confidence": 85, // 注释\n"result_detail": "第一行\\n第二行"}\n```'
+  parser, completed = feed_all(text, size)
+  assert parser.fields == {'result': True, 'result_confidence': 85, 'result_detail': '第一行\n第二行'}
+  keys = [key for fields in completed for key in fields]
+  assert keys == ['result', 'result_confidence', 'result_detail']
+
+def test_verdict_available_before_detail_finishes():
+  parser = IncrementalJSONParser()
+  parser.feed('{"result": false, "result_confidence": 70, "result_detail": "很长的报告')
+  assert parser.fields == {'result': False, 'result_confidence': 70}
+
+def test_truncated_output_keeps_partial_value():
+  parser = IncrementalJSONParser()
+  parser.feed('{"result": true, "result_detail": "被截断的报')
+  assert parser.close() == {'result_detail': '被截断的报'}
+  assert parser.fields['result'] is True
+
+def test_python_literals_missing_commas_and_unquoted_values():
+  assert parse_llm_json('{"result": None, "evidence": ["a", "b"]}') == {'result': None, 'evidence': ['a', 'b']}
+  assert parse_llm_json('{"result": False\n  "confidence": "90"}') == {'result': False, 'confidence': '90'}
+  assert parse_llm_json('{"result_detail": 第一行\n第二行,\n"result": True}') == {'result_detail': '第一行\n第二行', 'result': True}
+
+def test_no_object_yields_no_fields():
+  assert parse_llm_json('') == {}
+  assert parse_llm_json('模型拒绝回答') == {}
+
+@pytest.mark.parametrize('value, expected', [(True, True), ('true', True), (' 涉密 ', True), ('False', False), ('否', False), (0, False)])
+def test_to_bool(value, expected):
+  assert to_bool(value) is expected
+
+@pytest.mark.parametrize('value, expected', [(85, 85), (90.7, 90), ('置信度 80', 80), ('无', 0)])
+def test_to_int(value, expected):
+  assert to_int(value) == expected
+
+def test_agent_parser_normalizes_fields():
+  parse = agent_parser('associated')
+  assert parse('```json\n{"associated": "true", "confidence": "置信度 80"}\n```') == {'associated': True, 'confidence': 80, 'evidence': []}
+
+def test_agent_parser_requires_result_field():
+  with pytest.raises(JSONExtractError) as info:
+    agent_parser('result')('{"confidence": 90}')
+  assert info.value.raw == '{"confidence": 90}'
+
+def test_parse_decision():
+  decision = parse_decision('{"result": "涉密", "result_confidence": 90.5, "result_detail": {"规则 1": "满足"}}')
+  assert decision == {'result': True, 'result_confidence': 90, 'result_detail': '{"规则 1": "满足"}', 'current_node': 'END'}
+  with pytest.raises(JSONExtractError):
+    parse_decision('{"result_detail": "缺少结论"}')
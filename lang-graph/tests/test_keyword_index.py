@@ -0,0 +1,27 @@
+from keyword_index import KeywordIndex, ngrams
+
+KEYWORDS = ['内部会议纪要', '涉密人员名单', '作战部署方案', '干部考察报告', '政策评估报告']
+
+def test_ngrams():
+  assert ngrams('abcd') == ['ab', 'bc', 'cd']
+  assert ngrams('a') == ['a']
+  assert ngrams('') == []
+
+def test_scores_rank_the_most_related_keyword_first():
+  index = KeywordIndex(KEYWORDS)
+  assert index.top_k('本次人员名单涉密，请妥善保管', k=1) == ['涉密人员名单']
+  assert index.top_k('关于作战部署的补充说明', k=1) == ['作战部署方案']
+
+def test_shared_grams_weigh_less_than_rare_ones():
+  index = KeywordIndex(KEYWORDS)
+  scores = index.score('考察报告')
+  # “报告” 出现在两个关键词中，“考察” 只在一个关键词中
+  assert scores[KEYWORDS.index('干部考察报告')] > scores[KEYWORDS.index('政策评估报告')]
+
+def test_top_k_keeps_required_keywords_first():
+  index = KeywordIndex(KEYWORDS)
+  selected = index.top_k('作战部署', k=2, required=['政策评估报告', '政策评估报告'])
+  assert selected == ['政策评估报告', '作战部署方案']
+
+def test_unrelated_text_selects_nothing():
+  assert KeywordIndex(KEYWORDS).top_k('今天天气很好', k=5) == []
@@ -0,0 +1,41 @@
+from keyword_matcher import Automaton, KeywordMatcher, literal_verdict, normalize, normalize_with_offsets
+
+LIBRARY = {
+  'government': ['内部会议纪要', '政策评估报告(内部)', '涉密人员名单'],
+  'military': ['作战部署', 'ＡＢＣ'],
+}
+
+def test_automaton_finds_overlapping_matches():
+  automaton = Automaton([('he', 1), ('she', 2), ('his', 3), ('hers', 4)])
+  assert sorted(automaton.iter_matches('ushers')) == [(1, 4, 2), (2, 4, 1), (2, 6, 4)]
+
+def test_automaton_ignores_empty_patterns():
+  automaton = Automaton([('', 0), ('ab', 1)])
+  assert list(automaton.iter_matches('xaby')) == [(1, 3, 1)]
+
+def test_normalize_maps_offsets_back_to_original():
+  normalized, offsets = normalize_with_offsets('Ａ b　Ｃ')
+  assert normalized == 'abc'
+  assert offsets == [0, 2, 4]
+  assert normalize('内部 会议') == '内部会议'
+
+def test_match_types_and_offsets():
+  matcher = KeywordMatcher(LIBRARY)
+  text = '附件：内部会议纪要；另附 政策评估 报告 与 abc 清单'
+  hits = {hit['keyword']: hit for hit in matcher.find(text)}
+  assert hits['内部会议纪要']['match_type'] == 'exact'
+  assert text[hits['内部会议纪要']['start']:hits['内部会议纪要']['end']] == '内部会议纪要'
+  # 去掉括号限定语后的核心词，原文中带空白也能命中
+  assert hits['政策评估报告(内部)']['match_type'] == 'core'
+  assert hits['政策评估报告(内部)']['matched'] == '政策评估 报告'
+  assert hits['ＡＢＣ']['match_type'] == 'normalized'
+  assert hits['ＡＢＣ']['category'] == 'military'
+
+def test_literal_verdict_counts_distinct_strong_keywords():
+  matcher = KeywordMatcher(LIBRARY)
+  assert literal_verdict(matcher.find('内部会议纪要 内部会议纪要'), min_hits=2) is None
+  assert literal_verdict(matcher.find('政策评估报告 作战部署'), min_hits=2) is None
+  verdict = literal_verdict(matcher.find('内部会议纪要 作战部署'), min_hits=2)
+  assert verdict['associated'] is True
+  assert verdict['confidence'] == 96
+  assert len(verdict['evidence']) == 2
@@ -0,0 +1,79 @@
+import pytest
+import near_dup
+import verdict_cache
+
+PARAGRAPHS = [f'第{index}段：关于做好年度工作安排的通知内容，请各单位按照要求认真落实并及时反馈情况。' for index in range(12)]
+DOCUMENT = '\n'.join(PARAGRAPHS)
+PUBLIC_STATE = {'result': False, 'result_confidence': 90, 'result_detail': '非涉密', 'agent_semantics_result': False}
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+  index = near_dup.NearDupIndex(str(tmp_path / 'near_dup.db'), threshold=0.9)
+  monkeypatch.setattr(near_dup, 'get_index', lambda: index)
+  monkeypatch.setattr(verdict_cache, 'config_version', lambda: 'v1')
+  monkeypatch.delenv('NEAR_DUP_REUSE_THRESHOLD', raising=False)
+  monkeypatch.delenv('NEAR_DUP_THRESHOLD', raising=False)
+  return index
+
+def test_simhash_is_stable_and_close_for_small_edits():
+  original = near_dup.simhash(near_dup.shingles(DOCUMENT))
+  assert original == near_dup.simhash(near_dup.shingles(DOCUMENT))
+  edited = near_dup.simhash(near_dup.shingles(DOCUMENT.replace('第3段', '第三段')))
+  unrelated = near_dup.simhash(near_dup.shingles('完全不同的另一份文件，讨论采购合同与设备验收事项。' * 5))
+  assert near_dup.distance(original, edited) <= 6
+  assert near_dup.distance(original, unrelated) > 6
+
+def test_band_ranges_cover_all_bits():
+  for bands in (1, 5, 7, 64):
+    ranges = near_dup.band_ranges(bands)
+    assert len(ranges) == bands
+    assert sum(width for _, width in ranges) == near_dup.BITS
+    assert ranges[-1][0] + ranges[-1][1] == near_dup.BITS
+
+def test_find_within_max_distance_and_config_version(index):
+  fingerprint = 0b1011 << 20
+  index.add('a', fingerprint, {'u'}, 'v1', PUBLIC_STATE)
+  assert index.find(fingerprint ^ 0b111, 'v1') == ('a', 3)
+  assert index.find(fingerprint ^ ((1 << 7) - 1), 'v1') is None
+  assert index.find(fingerprint, 'v2') is None
+  assert index.find(fingerprint, 'v1', exclude='a') is None
+
+def test_index_is_reloaded_from_disk(index, tmp_path):
+  index.add('a', 42, {'u1', 'u2'}, 'v1', PUBLIC_STATE)
+  reloaded = near_dup.NearDupIndex(str(tmp_path / 'near_dup.db'), threshold=0.9)
+  assert reloaded.find(42, 'v1') == ('a', 0)
+  assert reloaded.units('a') == {'u1', 'u2'}
+  assert reloaded.state('a') == PUBLIC_STATE
+
+def test_memory_budget_evicts_least_recently_used(tmp_path):
+  index = near_dup.NearDupIndex(str(tmp_path / 'near_dup.db'), threshold=0.9, memory_mb=(near_dup.ENTRY_BYTES * 2) / 1024 / 1024)
+  index.add('a', 0, set(), 'v1', PUBLIC_STATE)
+  index.add('b', (1 << 64) - 1, set(), 'v1', PUBLIC_STATE)
+  # 访问 a 后 b 成为最久未访问的条目
+  index.find(0, 'v1')
+  index.add('c', (1 << 32) - 1, set(), 'v1', PUBLIC_STATE)
+  assert index.find(0, 'v1') == ('a', 0)
+  assert index.find((1 << 64) - 1, 'v1') is None
+  assert index.state('b') is None
+
+def test_reordered_paragraphs_reuse_verdict(index):
+  near_dup.remember('通知', DOCUMENT, PUBLIC_STATE)
+  result = near_dup.check('通知（修订）', '\n'.join(reversed(PARAGRAPHS)))
+  assert result['mode'] == 'reuse'
+  assert result['state']['result'] is False
+  assert result['state']['doc_title'] == '通知（修订）'
+
+def test_added_paragraph_is_never_reused(index):
+  near_dup.remember('通知', DOCUMENT, PUBLIC_STATE)
+  result = near_dup.check('通知', DOCUMENT + '\n附：涉密人员名单见附件。')
+  assert result['mode'] == 'partial'
+  assert result['fields']['semantics_focus'] == '附：涉密人员名单见附件。'
+
+def test_removed_paragraph_reuses_only_public_verdicts(index):
+  near_dup.remember('通知', DOCUMENT, {**PUBLIC_STATE, 'result': True, 'agent_semantics_result': True})
+  result = near_dup.check('通知', '\n'.join(PARAGRAPHS[1:]))
+  assert result['mode'] == 'full'
+
+def test_degraded_results_are_not_remembered(index):
+  near_dup.remember('通知', DOCUMENT, {**PUBLIC_STATE, 'degraded_agents': ['agent_semantics']})
+  assert near_dup.check('通知', DOCUMENT + '\n补充。') is None
@@ -0,0 +1,64 @@
+import json
+import os
+import pytest
+import policy
+
+def test_shipped_policies_are_valid():
+  policy.validate(policy.load_policies())
+
+@pytest.mark.parametrize('policies', [
+  [{'name': 'a', 'stage': 'before_decision'}, {'name': 'a', 'stage': 'before_decision'}],
+  [{'name': 'a', 'stage': 'after_agent_decision'}],
+  [{'name': 'a', 'stage': 'before_decision', 'when': {'result': {'approx': 1}}}],
+  [{'name': 'a', 'stage': 'before_decision', 'skip': ['agent_keyword']}],
+  [{'name': 'a', 'stage': 'before_decision', 'verdict_from': 'agent_decision'}],
+])
+def test_invalid_policies_are_rejected(policies):
+  with pytest.raises(policy.PolicyError):
+    policy.validate(policies)
+
+def test_matches_requires_every_condition():
+  rule = {'when': {'agent_keyword_result': {'eq': True}, 'agent_keyword_confidence': {'gt': 90}}}
+  assert policy.matches(rule, {'agent_keyword_result': True, 'agent_keyword_confidence': 95})
+  assert not policy.matches(rule, {'agent_keyword_result': True, 'agent_keyword_confidence': 90})
+  assert not policy.matches(rule, {'agent_keyword_result': True})
+  # 类型不匹配视为不满足
+  assert not policy.matches(rule, {'agent_keyword_result': True, 'agent_keyword_confidence': '95'})
+
+def test_keyword_fastpath_skips_agents_and_takes_keyword_verdict():
+  state = {'agent_keyword_result': True, 'agent_keyword_confidence': 95, 'fired_policies': []}
+  fired = policy.evaluate('after_agent_keyword', state)
+  assert fired == ['keyword_fastpath']
+  actions = policy.actions(fired)
+  assert actions == {'skip': {'agent_semantics', 'agent_non_secret_proof'}, 'verdict_from': 'agent_keyword'}
+  # 已触发的策略不会重复触发
+  assert policy.evaluate('after_agent_keyword', {**state, 'fired_policies': fired}) == []
+
+def test_run_node_skips_and_evaluates_following_stage():
+  calls = []
+  def semantics(state):
+    calls.append(state)
+    return {'agent_semantics_result': True, 'agent_semantics_confidence': 96}
+  output = policy.run_node('agent_semantics', semantics, {'fired_policies': []})
+  assert output['fired_policies'] == ['semantics_confident_secret']
+  skipped = policy.run_node('agent_non_secret_proof', pytest.fail, {'fired_policies': output['fired_policies']})
+  assert skipped == {'current_node': 'agent_non_secret_proof', 'skipped_nodes': ['agent_non_secret_proof']}
+  assert len(calls) == 1
+
+def test_merge_appends_list_fields():
+  state = {'fired_policies': ['a'], 'result': False}
+  policy.merge(state, {'fired_policies': ['b'], 'skipped_nodes': ['x'], 'result': True})
+  assert state == {'fired_policies': ['a', 'b'], 'skipped_nodes': ['x'], 'result': True}
+
+def test_policy_verdict_uses_agent_secret_value():
+  verdict = policy.policy_verdict('agent_non_secret_proof', {'agent_non_secret_proof_result': True, 'agent_non_secret_proof_confidence': 97})
+  assert verdict['result'] is False
+  assert verdict['result_confidence'] == 97
+
+def test_version_changes_with_file(tmp_path):
+  path = tmp_path / 'policies.json'
+  path.write_text(json.dumps({'policies': []}), encoding='utf-8')
+  first = policy.version(str(path))
+  path.write_text(json.dumps({'policies': [{'name': 'a', 'stage': 'before_decision'}]}), encoding='utf-8')
+  os.utime(path, (1, 1))
+  assert policy.version(str(path)) != first
@@ -0,0 +1,72 @@
+import pytest
+import rate_limiter
+
+@pytest.fixture
+def limiter(tmp_path):
+  return rate_limiter.RateLimiter(str(tmp_path / 'rate_limit.db'))
+
+def test_bucket_specs_skip_unlimited():
+  assert rate_limiter.bucket_specs('m', {}, 100) == []
+  assert rate_limiter.bucket_specs('m', {'requests_per_minute': 60, 'tokens_per_minute': 0}, 100) == [('m:requests', 60, 1.0, 1)]
+  assert rate_limiter.bucket_specs('m', {'tokens_per_minute': 600}, 100) == [('m:tokens', 600, 10.0, 100)]
+
+def test_take_drains_bucket_then_reports_wait(limiter):
+  buckets = rate_limiter.bucket_specs('m', {'requests_per_minute': 60}, 1)
+  for _ in range(60):
+    assert limiter._take(buckets) == 0.0
+  wait = limiter._take(buckets)
+  # 每秒补充 1 个请求
+  assert 0.9 < wait <= 1.0
+
+def test_wait_covers_the_most_constrained_bucket(limiter):
+  limits = {'requests_per_minute': 600, 'tokens_per_minute': 600}
+  assert limiter._take(rate_limiter.bucket_specs('m', limits, 600)) == 0.0
+  # 请求数桶还有余量，token 桶需要 10 秒补充 100 个 token
+  assert limiter._take(rate_limiter.bucket_specs('m', limits, 100)) == pytest.approx(10.0, abs=0.1)
+
+def test_cost_above_capacity_only_needs_a_full_bucket(limiter):
+  assert limiter._take(rate_limiter.bucket_specs('m', {'tokens_per_minute': 60}, 1000)) == 0.0
+
+def test_acquire_times_out_when_wait_exceeds_max_wait(limiter):
+  limits = {'requests_per_minute': 1}
+  assert limiter.acquire('m', limits, 1, max_wait=0) < 0.1
+  with pytest.raises(rate_limiter.RateLimitTimeout):
+    limiter.acquire('m', limits, 1, max_wait=1)
+
+def test_acquire_waits_for_refill(limiter):
+  limits = {'tokens_per_minute': 600}
+  limiter.acquire('m', limits, 600, max_wait=0)
+  # 每秒补充 10 个 token
+  waited = limiter.acquire('m', limits, 2, max_wait=1)
+  assert 0.15 < waited < 0.5
+
+def test_settle_charges_actual_usage(limiter):
+  limits = {'tokens_per_minute': 600}
+  limiter.acquire('m', limits, 100, max_wait=0)
+  limiter.settle('m', limits, 100, 700)
+  # 多用的 600 个 token 透支到 -100，需要约 10.1 秒才能再发出 1 个 token 的请求
+  assert limiter._take(rate_limiter.bucket_specs('m', limits, 1)) == pytest.approx(10.1, abs=0.1)
+
+def test_buckets_are_shared_across_instances(tmp_path):
+  path = str(tmp_path / 'rate_limit.db')
+  limits = {'requests_per_minute': 1}
+  rate_limiter.RateLimiter(path).acquire('m', limits, 1, max_wait=0)
+  with pytest.raises(rate_limiter.RateLimitTimeout):
+    rate_limiter.RateLimiter(path).acquire('m', limits, 1, max_wait=0)
+
+def test_module_acquire_caps_wait_at_remaining_deadline(limiter, monkeypatch):
+  calls = []
+  monkeypatch.setattr(rate_limiter, 'model_limits', lambda model: {'requests_per_minute': 60})
+  monkeypatch.setattr(rate_limiter, 'get_limiter', lambda: limiter)
+  monkeypatch.setattr(limiter, 'acquire', lambda model, limits, tokens, max_wait: calls.append(max_wait) or 0.0)
+  monkeypatch.setattr(rate_limiter, 'RATE_LIMIT_MAX_WAIT', 300.0)
+  assert rate_limiter.acquire('m', 10) == 10 + rate_limiter.RATE_LIMIT_COMPLETION_TOKENS
+  rate_limiter.acquire('m', 10, max_wait=2.5)
+  rate_limiter.acquire('m', 10, max_wait=-1)
+  rate_limiter.acquire('m', 10, max_wait=1000)
+  assert calls == [300.0, 2.5, 0.0, 300.0]
+
+def test_module_acquire_skips_unlimited_models(monkeypatch):
+  monkeypatch.setattr(rate_limiter, 'model_limits', lambda model: {})
+  monkeypatch.setattr(rate_limiter, 'get_limiter', lambda: pytest.fail('未配置限额时不应访问令牌桶'))
+  assert rate_limiter.acquire('m', 10) == 0
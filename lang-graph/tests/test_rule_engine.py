@@ -0,0 +1,69 @@
+import pytest
+from rule_engine import RuleEngine, RuleError, naive_scan, required_literals, sre_parse, synthetic_document, synthetic_rules
+
+def literals(regex):
+  return required_literals(sre_parse.parse(regex))
+
+def rule(id, regex, category='类别'):
+  return {'id': id, 'name': f'规则{id}', 'regex': regex, 'category': category}
+
+def test_required_literals_from_syntax_tree():
+  assert literals(r'密级[:：]\d+') == ['密级']
+  # 每个分支都有字面量时取并集
+  assert set(literals(r'(?:绝密|机密)\d+')) == {'绝密', '机密'}
+  # 只有一个分支有字面量、可选部分、纯字符类都不能作为必需字面量
+  assert literals(r'(?:绝密|\d+)号') is None
+  assert literals(r'(?:内部)?\d{6}') is None
+  assert literals(r'[A-Z]{2}\d{6}') is None
+  # 字面量统一小写，便于在小写后的正文上预过滤
+  assert literals(r'SECRET-\d+') == ['secret-']
+
+def test_scan_counts_and_offsets():
+  engine = RuleEngine([('作战部署', '军事'), ('名单', '人事'), ('作战部署', '重复')], [
+    rule('R1', r'密级[:：]\s*(\S{2})'),
+    rule('R2', r'[A-Z]{2}\d{4}'),
+  ])
+  text = '作战部署与名单，密级：绝密，编号 AB1234；再次提到作战部署'
+  result = engine.scan(text)
+  assert result['keywords']['作战部署'] == {'category': '军事', 'count': 2, 'spans': [[0, 4], [text.rindex('作战部署'), len(text)]]}
+  assert result['keywords']['名单']['count'] == 1
+  assert result['regex']['R1']['matches'][0]['matched_text'] == '绝密'
+  match = result['regex']['R2']['matches'][0]
+  assert text[match['start']:match['end']] == 'AB1234'
+  assert result['total_keyword_matches'] == 3
+  assert result['total_regex_matches'] == 2
+
+def test_rules_without_literals_are_skipped_only_when_safe():
+  engine = RuleEngine([('名单', '人事')], [rule('R1', r'密级[:：]\d+'), rule('R2', r'\d{6}')])
+  assert engine.prefiltered == 1
+  result = engine.scan('没有任何编号的正文')
+  # 没有必需字面量的规则每篇都执行，带字面量的规则被预过滤
+  assert result['evaluated_rules'] == 1
+  assert result['regex'] == {}
+
+def test_keyword_matching_ignores_case():
+  engine = RuleEngine([('Top Secret', '密级')], [])
+  assert engine.scan('marked TOP SECRET and top secret')['keywords']['Top Secret']['count'] == 2
+
+@pytest.mark.parametrize('keywords, rules', [
+  ([('', '分类')], []),
+  ([('名单', '人事')], [rule('R1', r'\d*')]),
+  ([('名单', '人事')], [rule('R1', r'密级'), rule('R1', r'编号')]),
+  ([('名单', '人事')], [{'id': 'R1', 'name': '规则', 'regex': r'密级'}]),
+  ([('名单', '人事')], [rule('R1', r'密级(')]),
+  ([('名单', '人事')], ['密级']),
+])
+def test_invalid_configuration_raises(keywords, rules):
+  with pytest.raises(RuleError):
+    RuleEngine(keywords, rules)
+
+def test_scan_agrees_with_naive_findall():
+  keywords, rules = synthetic_rules(200, 100, seed=1)
+  engine = RuleEngine(keywords, rules)
+  for seed in range(3):
+    text = synthetic_document(keywords, 5000, seed)
+    result = engine.scan(text)
+    keyword_counts, rule_counts = naive_scan(text, [keyword for keyword, _ in keywords], rules)
+    assert {keyword: item['count'] for keyword, item in result['keywords'].items()} == keyword_counts
+    assert {id: item['count'] for id, item in result['regex'].items()} == rule_counts
+    assert result['evaluated_rules'] < len(rules)
@@ -0,0 +1,101 @@
+import json
+import pytest
+import triage
+
+SECRET = ['绝密 作战 部署 方案 第{}号', '机密 导弹 试验 参数 第{}批', '秘密 军工 研制 计划 第{}期', '绝密 核心 密码 设备 第{}套']
+PUBLIC = ['公开 招聘 公告 第{}期', '食堂 菜单 通知 第{}周', '运动会 报名 安排 第{}届', '图书馆 开放 时间 第{}季']
+
+def corpus():
+  documents = []
+  for index in range(10):
+    for template in SECRET:
+      documents.append({'doc_title': template.format(index), 'doc_content': template.format(index) * 3, 'expected': True})
+    for template in PUBLIC:
+      documents.append({'doc_title': template.format(index), 'doc_content': template.format(index) * 3, 'expected': False})
+  return documents
+
+@pytest.fixture(scope='module')
+def model():
+  return triage.TriageModel(triage.train(corpus()), threshold=0.8)
+
+def test_char_ngrams_skip_whitespace_only_grams():
+  assert triage.char_ngrams('ab a', ngrams=(1, 2)) == {'a': 2, 'b': 1, 'ab': 1, 'b ': 1, ' a': 1}
+
+def test_vectorizer_applies_min_df_and_l2_norm():
+  vectorizer = triage.Vectorizer.fit(['甲乙', '甲丙', '丁'], ngrams=(1,), min_df=2)
+  assert list(vectorizer.vocabulary) == ['甲']
+  assert vectorizer.transform('甲乙丁') == {0: pytest.approx(1.0)}
+  assert vectorizer.transform('丁') == {}
+
+def test_model_separates_classes(model):
+  assert model.probability('绝密 作战 部署 方案', '绝密 作战 部署 方案') > 0.8
+  assert model.probability('公开 招聘 公告', '公开 招聘 公告') < 0.2
+
+def test_route_label():
+  assert triage.route_label(0.95, 0.9) is True
+  assert triage.route_label(0.05, 0.9) is False
+  assert triage.route_label(0.5, 0.9) is None
+
+def test_routing_report():
+  report = triage.routing_report([0.95, 0.05, 0.5, 0.97], [True, False, True, False], 0.9)
+  assert report['routed'] == 3
+  assert report['routed_errors'] == 1
+  assert report['routing_rate'] == 0.75
+  assert report['routed_accuracy'] == pytest.approx(2 / 3)
+
+def test_recommend_threshold_picks_lowest_within_error_rate():
+  reports = [
+    {'threshold': 0.95, 'routed': 2, 'routed_errors': 0},
+    {'threshold': 0.8, 'routed': 10, 'routed_errors': 1},
+    {'threshold': 0.9, 'routed': 5, 'routed_errors': 0},
+    {'threshold': 0.99, 'routed': 0, 'routed_errors': 0},
+  ]
+  assert triage.recommend_threshold(reports) == 0.9
+  assert triage.recommend_threshold(reports, max_error_rate=0.1) == 0.8
+  assert triage.recommend_threshold(reports[3:]) is None
+
+def test_cross_validation_scores_held_out_documents():
+  validation = triage.cross_validate(corpus(), folds=4, thresholds=(0.8,))
+  report = validation['thresholds'][0]
+  assert validation['folds'] == 4
+  assert report['documents'] == 80
+  assert report['routed'] > 0
+  assert report['routed_errors'] == 0
+
+def test_route_disabled(monkeypatch, model):
+  monkeypatch.setattr(triage, 'load_model', lambda: model)
+  monkeypatch.setenv('TRIAGE', '0')
+  assert triage.route('绝密 作战 部署 方案', '绝密') == (None, None)
+
+def test_route_without_threshold_skips_scoring(monkeypatch, model):
+  unrouted = triage.TriageModel(model.artifact)
+  monkeypatch.setattr(unrouted, 'probability', lambda *args: pytest.fail('没有阈值时不应计算概率'))
+  monkeypatch.setattr(triage, 'load_model', lambda: unrouted)
+  monkeypatch.delenv('TRIAGE_THRESHOLD', raising=False)
+  assert triage.route('绝密 作战 部署 方案', '绝密') == (None, None)
+
+def test_route_uses_model_threshold_and_env_override(monkeypatch, model):
+  monkeypatch.setattr(triage, 'load_model', lambda: model)
+  monkeypatch.delenv('TRIAGE_THRESHOLD', raising=False)
+  verdict, info = triage.route('绝密 作战 部署 方案', '绝密 作战 部署 方案')
+  assert verdict['result'] is True
+  assert verdict['skipped_nodes'] == triage.AGENT_NODES
+  assert info['model'] == model.version
+  monkeypatch.setenv('TRIAGE_THRESHOLD', '0.9999')
+  verdict, info = triage.route('绝密 作战 部署 方案', '绝密 作战 部署 方案')
+  assert verdict is None
+  assert info['label'] is None
+
+def test_default_training_excludes_evaluation_db(tmp_path):
+  assert not set(triage.TRAINING_DBS) & set(triage.EVALUATION_DBS)
+  path = tmp_path / 'triage_model.json'
+  artifact = triage.main(['train', '--model', str(path)])
+  assert artifact['sources'] == list(triage.TRAINING_DBS)
+  saved = json.loads(path.read_text(encoding='utf-8'))
+  assert saved['threshold'] == artifact['threshold']
+  # 默认语料上应能选出阈值，且该阈值的交叉验证分诊没有误判
+  report = next(report for report in saved['cross_validation']['thresholds'] if report['threshold'] == saved['threshold'])
+  assert report['routed'] > 0
+  assert report['routed_errors'] == 0
+  loaded = triage.load_model(str(path))
+  assert loaded.threshold == saved['threshold']
@@ -0,0 +1,366 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from colorama import Fore,Back,Style
+import telemetry
+from verdict_cache import normalize_text
+
+# 本地轻量分诊：字符 n-gram TF-IDF + 逻辑回归，纯 CPU、毫秒级，在进入工作流之前给出涉密概率。
+#   - 概率 >= 阈值：明显涉密，直接判定为涉密
+#   - 概率 <= 1 - 阈值：明显公开，直接判定为非涉密
+#   - 其余交给工作流（关键词检测、语义分析、非涉密证明、决策评审）
+# 被分诊直接判定的文档不调用任何大模型，状态中 triage 字段记录概率与模型版本，skipped_nodes 列出全部智能体。
+#
+# 模型由带标注的测试数据库（test 表：title, summary, is_sensitive）与 JSONL 导出训练，保存为 JSON 文件；
+# 版本为模型参数的哈希（不含训练时间等元数据），文件变更后自动重新加载。训练时用 k 折交叉验证估计各候选阈值下的分诊比例与分诊准确率，
+# 并把交叉验证误判率不超过 TRIAGE_MAX_ERROR_RATE 的最低阈值写入模型文件作为默认阈值；没有满足条件的阈值时模型不直接判定任何文档，也不计算概率。
+#
+# 默认语料（test_documents.db + test_documents_2.db，32 篇）上 5 折交叉验证：阈值 0.80 分诊约 88%、0.90 约 44%、0.95 约 19%，均无误判，
+# 默认阈值为 0.80；在未参与训练的 test_documents_3.db 上阈值 0.80 分诊 10/10 篇，无误判。语料很小，误判率的估计并不精确，
+# 换用团队自己的标注导出训练后应以训练输出的交叉验证结果为准。
+#
+# 用法：
+#   python lang-graph/triage.py train --db lang-graph/test_documents.db --db lang-graph/test_documents_2.db --jsonl labeled.jsonl
+#   python lang-graph/triage.py evaluate --db lang-graph/test_documents_3.db --threshold 0.97
+# 不指定语料时用 test_documents.db 与 test_documents_2.db 训练、test_documents_3.db 评测；
+# test_documents_3.db 是 evaluate.py 与 main.test() 的评测语料，不参与默认训练。
+#
+# 配置（环境变量）：
+#   TRIAGE              设为 0 关闭分诊
+#   TRIAGE_MODEL        模型文件路径，默认 lib/triage_model.json（文件不存在时不分诊）
+#   TRIAGE_THRESHOLD    直接判定所需的置信度，默认使用模型训练时选出的阈值
+#   TRIAGE_MAX_ERROR_RATE  训练时选择默认阈值允许的交叉验证分诊误判率，默认 0
+
+MODEL_PATH = os.getenv('TRIAGE_MODEL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib', 'triage_model.json'))
+NGRAMS = (1, 2, 3)
+# 正文只取前若干字符：分诊只需要判断明显的情况，长文档交给工作流分块分析
+MAX_CHARS = 4000
+# 训练时交叉验证评估的候选阈值
+THRESHOLDS = (0.8, 0.85, 0.9, 0.95, 0.99)
+AGENT_NODES = ['agent_keyword', 'agent_semantics', 'agent_non_secret_proof', 'agent_decision']
+# 默认训练与评测语料互不重叠
+TRAINING_DBS = ('test_documents.db', 'test_documents_2.db')
+EVALUATION_DBS = ('test_documents_3.db',)
+
+def document_text(doc_title, doc_content):
+  return f'{normalize_text(doc_title)}\n{normalize_text(doc_content)[:MAX_CHARS]}'
+
+def char_ngrams(text, ngrams=NGRAMS):
+  """字符 n-gram 及其出现次数（空格也计入，保留标题与正文、词与词之间的边界）"""
+  counts = {}
+  for n in ngrams:
+    for index in range(len(text) - n + 1):
+      gram = text[index:index + n]
+      if gram.strip():
+        counts[gram] = counts.get(gram, 0) + 1
+  return counts
+
+class Vectorizer:
+  """TF-IDF：次线性词频 (1 + log tf)、平滑 idf、L2 归一化"""
+  def __init__(self, vocabulary, idf, ngrams=NGRAMS):
+    self.vocabulary = vocabulary
+    self.idf = idf
+    self.ngrams = tuple(ngrams)
+
+  @classmethod
+  def fit(cls, texts, ngrams=NGRAMS, min_df=2, max_features=50000):
+    df = {}
+    for text in texts:
+      for gram in char_ngrams(text, ngrams):
+        df[gram] = df.get(gram, 0) + 1
+    kept = sorted((gram for gram, count in df.items() if count >= min_df), key=lambda gram: (-df[gram], gram))[:max_features]
+    total = len(texts)
+    vocabulary = {gram: index for index, gram in enumerate(kept)}
+    idf = [math.log((1 + total) / (1 + df[gram])) + 1 for gram in kept]
+    return cls(vocabulary, idf, ngrams)
+
+  def transform(self, text):
+    """返回稀疏向量 {特征序号: 权重}"""
+    vector = {}
+    for gram, count in char_ngrams(text, self.ngrams).items():
+      index = self.vocabulary.get(gram)
+      if index is not None:
+        vector[index] = (1 + math.log(count)) * self.idf[index]
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    if norm:
+      for index in vector:
+        vector[index] /= norm
+    return vector
+
+def sigmoid(value):
+  if value >= 0:
+    return 1 / (1 + math.exp(-value))
+  exp = math.exp(value)
+  return exp / (1 + exp)
+
+def fit_logistic(vectors, labels, features, l2=1e-4, epochs=100, learning_rate=2.0, seed=0):
+  """
+  L2 正则逻辑回归，随机梯度下降（学习率按轮次衰减）
+  正负样本按类别频率反比加权，避免标注语料不均衡时偏向多数类
+  语料只有几十篇时正则过强会把概率压在 0.05-0.95 之间，任何阈值都无法分诊，因此默认只保留很弱的正则
+  """
+  weights = [0.0] * features
+  bias = 0.0
+  positives = sum(labels) or 1
+  negatives = (len(labels) - sum(labels)) or 1
+  class_weight = {True: len(labels) / (2 * positives), False: len(labels) / (2 * negatives)}
+  order = list(range(len(vectors)))
+  rng = random.Random(seed)
+  for epoch in range(epochs):
+    rng.shuffle(order)
+    rate = learning_rate / (1 + epoch * 0.1)
+    for position in order:
+      vector = vectors[position]
+      label = labels[position]
+      score = bias + sum(weights[index] * value for index, value in vector.items())
+      gradient = (sigmoid(score) - label) * class_weight[bool(label)]
+      for index, value in vector.items():
+        weights[index] -= rate * (gradient * value + l2 * weights[index])
+      bias -= rate * gradient
+  return weights, bias
+
+class TriageModel:
+  def __init__(self, artifact, threshold=None):
+    self.artifact = artifact
+    self.version = artifact_version(artifact)
+    # 训练时按交叉验证选出的阈值，None 表示没有阈值能满足误判率要求
+    self.threshold = threshold
+    vocabulary = {gram: index for index, gram in enumerate(artifact['features'])}
+    self.vectorizer = Vectorizer(vocabulary, artifact['idf'], artifact['ngrams'])
+    self.weights = artifact['weights']
+    self.bias = artifact['bias']
+
+  def probability(self, doc_title, doc_content):
+    """文档涉密的概率"""
+    vector = self.vectorizer.transform(document_text(doc_title, doc_content))
+    return sigmoid(self.bias + sum(self.weights[index] * value for index, value in vector.items()))
+
+def artifact_version(artifact):
+  return hashlib.sha256(json.dumps(artifact, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+def train(documents, min_df=2, max_features=50000, epochs=100, l2=1e-4):
+  """训练并返回模型参数（模型文件中的 model 字段）"""
+  texts = [document_text(document['doc_title'], document['doc_content']) for document in documents]
+  labels = [bool(document['expected']) for document in documents]
+  vectorizer = Vectorizer.fit(texts, min_df=min_df, max_features=max_features)
+  vectors = [vectorizer.transform(text) for text in texts]
+  weights, bias = fit_logistic(vectors, labels, len(vectorizer.idf), l2=l2, epochs=epochs)
+  features = sorted(vectorizer.vocabulary, key=vectorizer.vocabulary.get)
+  return {
+    'ngrams': list(vectorizer.ngrams),
+    'features': features,
+    'idf': [round(value, 6) for value in vectorizer.idf],
+    'weights': [round(value, 6) for value in weights],
+    'bias': round(bias, 6),
+  }
+
+def route_label(probability, threshold):
+  """按阈值分诊：True 涉密、False 非涉密、None 交给工作流"""
+  if probability >= threshold:
+    return True
+  if probability <= 1 - threshold:
+    return False
+  return None
+
+def routing_report(probabilities, labels, threshold):
+  """给定阈值下的分诊比例、分诊准确率与整体（不分诊时）准确率"""
+  routed = [(route_label(probability, threshold), label) for probability, label in zip(probabilities, labels)]
+  decided = [(predicted, label) for predicted, label in routed if predicted is not None]
+  correct = sum(1 for predicted, label in decided if predicted == label)
+  return {
+    'threshold': threshold,
+    'documents': len(labels),
+    'routed': len(decided),
+    'routed_public': sum(1 for predicted, _ in decided if predicted is False),
+    'routed_secret': sum(1 for predicted, _ in decided if predicted is True),
+    'routing_rate': len(decided) / len(labels) if labels else 0.0,
+    'routed_accuracy': correct / len(decided) if decided else 0.0,
+    'routed_errors': len(decided) - correct,
+    'accuracy': sum(1 for probability, label in zip(probabilities, labels) if (probability >= 0.5) == label) / len(labels) if labels else 0.0,
+  }
+
+def cross_validate(documents, folds=5, thresholds=THRESHOLDS, seed=0, **options):
+  """k 折交叉验证：每篇文档的概率都来自没有见过它的模型"""
+  folds = max(2, min(folds, len(documents)))
+  order = list(range(len(documents)))
+  random.Random(seed).shuffle(order)
+  # 训练集只有一个类别的折无法训练，其中的文档视为不确定
+  probabilities = [0.5] * len(documents)
+  for fold in range(folds):
+    held_out = order[fold::folds]
+    held_set = set(held_out)
+    training = [documents[index] for index in order if index not in held_set]
+    if len({bool(document['expected']) for document in training}) < 2:
+      continue
+    model = TriageModel(train(training, **options))
+    for index in held_out:
+      probabilities[index] = model.probability(documents[index]['doc_title'], documents[index]['doc_content'])
+  labels = [bool(document['expected']) for document in documents]
+  return {'folds': folds, 'thresholds': [routing_report(probabilities, labels, threshold) for threshold in thresholds]}
+
+def recommend_threshold(reports, max_error_rate=0.0):
+  """交叉验证中分诊误判率不超过 max_error_rate 的最低阈值（分诊比例最高），没有则返回 None"""
+  for report in sorted(reports, key=lambda report: report['threshold']):
+    if report['routed'] and report['routed_errors'] <= max_error_rate * report['routed']:
+      return report['threshold']
+  return None
+
+_lock = threading.Lock()
+_cached = {}
+
+def load_model(path=MODEL_PATH):
+  """读取模型文件，文件变更后自动重新加载；文件不存在时返回 None"""
+  try:
+    mtime = os.path.getmtime(path)
+  except OSError:
+    return None
+  cached = _cached.get(path)
+  if cached and cached[0] == mtime:
+    return cached[1]
+  with _lock:
+    with open(path, 'r', encoding='utf-8') as f:
+      artifact = json.load(f)
+    model = TriageModel(artifact['model'], artifact.get('threshold'))
+    _cached[path] = (mtime, model)
+    print(f'{Fore.BLUE}加载分诊模型: {model.version}（{len(model.weights)} 个特征）{Style.RESET_ALL}')
+    return model
+
+def threshold(model=None):
+  """直接判定所需的置信度：TRIAGE_THRESHOLD 优先，否则使用模型训练时选出的阈值"""
+  value = os.getenv('TRIAGE_THRESHOLD')
+  if value:
+    return float(value)
+  return model.threshold if model is not None else None
+
+def verdict_state(label, probability, model):
+  """分诊直接判定时并入初始状态的字段"""
+  verdict = '涉密' if label else '非涉密'
+  confidence = round((probability if label else 1 - probability) * 100)
+  return {
+    'result': label,
+    'result_detail': f'本地分诊模型判定涉密概率为 {probability:.3f}，置信度为{confidence}，直接判定为{verdict}，未调用大模型',
+    'result_confidence': confidence,
+    'current_node': 'END',
+    'skipped_nodes': list(AGENT_NODES),
+    'triage': {'label': label, 'probability': probability, 'model': model.version},
+  }
+
+def route(doc_title, doc_content):
+  """
+  进入工作流之前分诊，返回 (直接判定的状态字段或 None, 分诊信息或 None)
+  关闭分诊或没有模型时返回 (None, None)
+  """
+  if os.getenv('TRIAGE', '1') == '0':
+    return None, None
+  model = load_model()
+  if model is None:
+    return None, None
+  value = threshold(model)
+  if value is None:
+    # 没有可用的阈值时分诊不会直接判定任何文档，不必计算概率
+    return None, None
+  start = time.perf_counter()
+  probability = model.probability(doc_title, doc_content)
+  label = route_label(probability, value)
+  seconds = time.perf_counter() - start
+  outcome = 'uncertain' if label is None else ('secret' if label else 'public')
+  telemetry.TRIAGE.inc(outcome=outcome)
+  telemetry.TRIAGE_SECONDS.observe(seconds)
+  telemetry.add_event('triage', probability=probability, outcome=outcome, model=model.version)
+  info = {'label': label, 'probability': probability, 'model': model.version}
+  if label is None:
+    return None, info
+  print(f'{Fore.GREEN}分诊直接判定: {"涉密" if label else "非涉密"}（涉密概率 {probability:.3f}，{seconds * 1000:.1f}ms）{Style.RESET_ALL}')
+  return verdict_state(label, probability, model), info
+
+def load_documents(dbs, jsonls):
+  import evaluate
+  documents = []
+  for path in dbs:
+    documents.extend(evaluate.iter_db(path))
+  for path in jsonls:
+    documents.extend(evaluate.iter_jsonl(path))
+  return documents
+
+def print_routing(report):
+  print(f'  阈值 {report["threshold"]:.2f}: 分诊 {report["routed"]}/{report["documents"]} 篇（{report["routing_rate"] * 100:.1f}%，'
+        f'公开 {report["routed_public"]}，涉密 {report["routed_secret"]}），分诊准确率 {report["routed_accuracy"] * 100:.1f}%，'
+        f'误判 {report["routed_errors"]} 篇')
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='本地分诊模型训练与评测')
+  parser.add_argument('command', choices=['train', 'evaluate'], help='train 训练并保存模型；evaluate 在标注语料上统计分诊比例与准确率')
+  parser.add_argument('--db', action='append', default=[], help='测试数据库路径，可重复指定')
+  parser.add_argument('--jsonl', action='append', default=[], help='JSONL 标注导出路径，可重复指定（字段同 evaluate.py）')
+  parser.add_argument('--model', default=MODEL_PATH, help='模型文件路径')
+  parser.add_argument('--threshold', type=float, action='append', help='评测的置信度阈值，可重复指定，默认 TRIAGE_THRESHOLD 或模型训练时选出的阈值')
+  parser.add_argument('--folds', type=int, default=5, help='交叉验证折数')
+  parser.add_argument('--min-df', type=int, default=2, help='特征最少出现的文档数')
+  parser.add_argument('--max-features', type=int, default=50000, help='最大特征数')
+  parser.add_argument('--epochs', type=int, default=100, help='训练轮数')
+  parser.add_argument('--l2', type=float, default=1e-4, help='L2 正则系数')
+  parser.add_argument('--max-error-rate', type=float, default=float(os.getenv('TRIAGE_MAX_ERROR_RATE', '0')), help='选择阈值时允许的交叉验证分诊误判率')
+  args = parser.parse_args(argv)
+
+  if not args.db and not args.jsonl:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    names = EVALUATION_DBS if args.command == 'evaluate' else TRAINING_DBS
+    args.db = [os.path.join(current_dir, name) for name in names]
+  documents = load_documents(args.db, args.jsonl)
+  labels = [bool(document['expected']) for document in documents]
+
+  if args.command == 'evaluate':
+    model = load_model(args.model)
+    if model is None:
+      print(f'{Fore.RED}模型文件不存在: {args.model}{Style.RESET_ALL}')
+      return None
+    thresholds = args.threshold or [threshold(model) or THRESHOLDS[-1]]
+    start = time.perf_counter()
+    probabilities = [model.probability(document['doc_title'], document['doc_content']) for document in documents]
+    seconds = time.perf_counter() - start
+    print(f'{Fore.CYAN}模型 {model.version}：{len(documents)} 篇，平均 {seconds / len(documents) * 1000 if documents else 0:.2f}ms/篇{Style.RESET_ALL}')
+    reports = [routing_report(probabilities, labels, value) for value in thresholds]
+    for report in reports:
+      print_routing(report)
+    return reports
+
+  if len(set(labels)) < 2:
+    print(f'{Fore.RED}训练语料需要同时包含涉密与非涉密文档{Style.RESET_ALL}')
+    return None
+  options = {'min_df': args.min_df, 'max_features': args.max_features, 'epochs': args.epochs, 'l2': args.l2}
+  start = time.perf_counter()
+  validation = cross_validate(documents, folds=args.folds, thresholds=sorted(set(args.threshold or []) | set(THRESHOLDS)), **options)
+  model = train(documents, **options)
+  artifact = {
+    'model': model,
+    'threshold': recommend_threshold(validation['thresholds'], args.max_error_rate),
+    'max_error_rate': args.max_error_rate,
+    'trained': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'sources': [os.path.basename(path) for path in args.db + args.jsonl],
+    'documents': len(documents),
+    'positives': sum(labels),
+    'options': options,
+    'cross_validation': validation,
+  }
+  os.makedirs(os.path.dirname(os.path.abspath(args.model)), exist_ok=True)
+  with open(args.model, 'w', encoding='utf-8') as f:
+    json.dump(artifact, f, ensure_ascii=False)
+  print(f'{Fore.GREEN}{Style.BRIGHT}已训练 {len(documents)} 篇（涉密 {sum(labels)}），{len(model["features"])} 个特征，'
+        f'耗时 {time.perf_counter() - start:.1f}s，模型版本 {artifact_version(model)} → {args.model}{Style.RESET_ALL}')
+  print(f'{Fore.CYAN}{validation["folds"]} 折交叉验证：{Style.RESET_ALL}')
+  for report in validation['thresholds']:
+    print_routing(report)
+  if artifact['threshold'] is None:
+    print(f'{Fore.YELLOW}没有阈值的交叉验证误判率不超过 {args.max_error_rate:.1%}，模型不会直接判定文档（可通过 TRIAGE_THRESHOLD 指定）{Style.RESET_ALL}')
+  else:
+    print(f'{Fore.GREEN}默认阈值: {artifact["threshold"]:.2f}{Style.RESET_ALL}')
+  return artifact
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from colorama import Fore,Back,Style
+
+# 文档级判定结果缓存
+# 以 “规范化标题 + 正文 + 关键词库版本 + 模型名称 + 提示词版本” 的哈希为键，
+# 持久化保存最终状态与 SSE 进度事件，重复提交的文档直接返回结果。
+#
+# 配置（环境变量）：
+#   CACHE_DIR                    缓存目录，默认 lang-graph/.cache
+#   VERDICT_CACHE                设为 0 关闭缓存
+#   VERDICT_CACHE_TTL            条目有效期（秒），默认 7 天
+#   VERDICT_CACHE_MAX_ENTRIES    最大条目数，超出后按最近访问时间淘汰
+#
+# 条目数在进程内维护计数，写入时不再 COUNT(*) 全表；多个进程共用同一个数据库时每 RECOUNT_INTERVAL 次写入重新统计一次校正。
+
+RECOUNT_INTERVAL = 1000
+
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+def normalize_text(text):
+  """NFKC 统一全半角并折叠空白，避免排版差异导致缓存未命中"""
+  return ' '.join(unicodedata.normalize('NFKC', text or '').split())
+
+class VerdictCache:
+  def __init__(self, path, ttl=7 * 24 * 3600, max_entries=10000):
+    self.path = path
+    self.ttl = ttl
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    self._conn.execute('''
+    CREATE TABLE IF NOT EXISTS verdicts (
+      key TEXT PRIMARY KEY,
+      state TEXT NOT NULL,
+      events TEXT NOT NULL,
+      created REAL NOT NULL,
+      last_access REAL NOT NULL,
+      hit_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    self._conn.execute('CREATE INDEX IF NOT EXISTS idx_verdicts_last_access ON verdicts(last_access)')
+    # 过期清理按 created 范围删除，需要索引避免每次写入扫描全表
+    self._conn.execute('CREATE INDEX IF NOT EXISTS idx_verdicts_created ON verdicts(created)')
+    self._conn.commit()
+    self._writes = 0
+    self._entries = self._count()
+
+  def _count(self):
+    return self._conn.execute('SELECT COUNT(*) FROM verdicts').fetchone()[0]
+
+  def get(self, key):
+    """命中返回 {'state': 最终状态, 'events': 进度事件列表}，未命中或已过期返回 None"""
+    now = time.time()
+    with self._lock:
+      row = self._conn.execute('SELECT state, events, created FROM verdicts WHERE key = ?', (key,)).fetchone()
+      if row is None or now - row[2] > self.ttl:
+        self.misses += 1
+        return None
+      self._conn.execute('UPDATE verdicts SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?', (now, key))
+      self._conn.commit()
+      self.hits += 1
+    return {'state': json.loads(row[0]), 'events': json.loads(row[1])}
+
+  def put(self, key, state, events=None):
+    now = time.time()
+    with self._lock:
+      exists = self._conn.execute('SELECT 1 FROM verdicts WHERE key = ?', (key,)).fetchone() is not None
+      self._conn.execute(
+        'INSERT OR REPLACE INTO verdicts (key, state, events, created, last_access) VALUES (?, ?, ?, ?, ?)',
+        (key, json.dumps(state, ensure_ascii=False), json.dumps(events or [], ensure_ascii=False), now, now),
+      )
+      self._writes += 1
+      if self._writes % RECOUNT_INTERVAL == 0:
+        self._entries = self._count()
+      elif not exists:
+        self._entries += 1
+      self._evict(now)
+      self._conn.commit()
+
+  def _evict(self, now):
+    self._entries -= self._conn.execute('DELETE FROM verdicts WHERE created < ?', (now - self.ttl,)).rowcount
+    if self._entries > self.max_entries:
+      cursor = self._conn.execute(
+        'DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY last_access ASC LIMIT ?)',
+        (self._entries - self.max_entries,),
+      )
+      self._entries -= cursor.rowcount
+
+  def clear(self):
+    with self._lock:
+      self._conn.execute('DELETE FROM verdicts')
+      self._conn.commit()
+      self._entries = 0
+
+  def stats(self):
+    with self._lock:
+      entries = self._conn.execute('SELECT COUNT(*) FROM verdicts').fetchone()[0]
+    total = self.hits + self.misses
+    return {
+      'entries': entries,
+      'hits': self.hits,
+      'misses': self.misses,
+      'hit_rate': self.hits / total if total else 0.0,
+    }
+
+def config_version():
+  """影响判定结果的全部版本信息（关键词库、模型、提示词、决策配置、路由策略）的哈希"""
+  from agents import PROMPT_VERSION
+  from keyword_matcher import get_matcher
+  from llm_client import AGENTS, agent_settings
+  from decision_engine import load_config
+  import policy
+  models = ','.join(f'{agent}={agent_settings(agent)["model"]}' for agent in AGENTS)
+  parts = [
+    get_matcher().version,
+    models,
+    PROMPT_VERSION,
+    json.dumps(load_config(), sort_keys=True),
+    policy.version(),
+  ]
+  return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+def cache_key(doc_title, doc_content):
+  """文档内容与影响判定结果的全部版本信息共同决定缓存键"""
+  parts = [normalize_text(doc_title), normalize_text(doc_content), config_version()]
+  return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+  """获取进程内共享的缓存实例，关闭缓存时返回 None"""
+  global _cache
+  if os.getenv('VERDICT_CACHE', '1') == '0':
+    return None
+  if _cache is None:
+    with _cache_lock:
+      if _cache is None:
+        _cache = VerdictCache(
+          os.path.join(CACHE_DIR, 'verdicts.db'),
+          ttl=float(os.getenv('VERDICT_CACHE_TTL', str(7 * 24 * 3600))),
+          max_entries=int(os.getenv('VERDICT_CACHE_MAX_ENTRIES', '10000')),
+        )
+  return _cache
+
+def lookup(doc_title, doc_content):
+  """查询缓存，返回 (缓存键, 命中结果)；关闭缓存时缓存键为 None"""
+  cache = get_cache()
+  if cache is None:
+    return None, None
+  key = cache_key(doc_title, doc_content)
+  cached = cache.get(key)
+  if cached is not None:
+    print(f'{Fore.GREEN}判定缓存命中: {key[:12]}{Style.RESET_ALL}')
+  return key, cached
+
+def is_cacheable(state):
+  """决策结果解析失败或有智能体降级的状态不写入缓存"""
+  if state.get('degraded_agents'):
+    return False
+  return not str(state.get('result_detail', '')).startswith(('解析失败', '处理错误'))
+
+def store(key, state, events=None):
+  cache = get_cache()
+  if cache is None or key is None or not is_cacheable(state):
+    return
+  cache.put(key, state, events)